@@ -11,7 +11,6 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import locale
 import os
 import base64
 import io
@@ -19,9 +18,24 @@ import re
 import time
 import logging
 from pathlib import Path
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Callable
 from datetime import datetime, date
 
+from cache_resultados import cache_resultados, chave_canonica
+from camada_dados import assinatura_ficheiro, camada_dados
+import motor_consultas
+from formatacao import formatar_coluna_ptbr, formatar_ptbr
+from fontes_dados import (
+    ARQUIVO_LOOKUP, DIMENSOES_CUBO, alinhar_vendas_plano, anos_no_intervalo, arquivo_do_ano,
+    contar_registos, detetar_coluna_plano, mascara_valores, nome_particao, normalizar_numericos, somar_em_moeda,
+    somar_plano_por
+)
+from quota_mercado import (
+    DIMENSOES_ANALISE, EMPRESA_PETROMOC, ORIGEM_CONGENERE, quotas, totais_por_origem, variacao_posicoes
+)
+from registro_workbooks import registro_workbooks
+from somas_acumuladas import DIMENSOES_SOMAS, MEDIDA_PLANO, periodos
+
 # ============================================= CONFIGURAÇÃO DA PÁGINA =============================================
 st.set_page_config(
     page_title="Sistema de Gestão - Petromoc, SA",
@@ -483,94 +497,12 @@ st.markdown("""
 try:
     # Tentar verificar se é ambiente cloud
     if hasattr(st, 'secrets') and st.secrets.get("IS_CLOUD", False):
-        # Configurações específicas para cloud
-        st.cache_data.clear()
-        logger.info("Modo cloud detectado - cache limpo")
+        # Os dados são invalidados pela vigilância dos ficheiros, não por limpeza global
+        logger.info("Modo cloud detectado")
 except Exception as e:
     # Se houver erro com secrets, apenas continue
     logger.info(f"Modo local - secrets não configurado: {e}")
 
-# ============================================= LOCALIDADE =============================================
-def configure_locale() -> None:
-    """Configura locale com fallbacks mais robustos"""
-    try:
-        locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
-    except locale.Error:
-        try:
-            locale.setlocale(locale.LC_ALL, 'Portuguese_Brazil.1252')
-        except locale.Error:
-            try:
-                locale.setlocale(locale.LC_ALL, '')
-            except locale.Error:
-                logger.warning("Não foi possível configurar o locale pt_BR")
-
-configure_locale()
-
-# ============================================= FORMATAÇÃO PT-BR =============================================
-def formatar_ptbr(valor: float, casas: int = 2) -> str:
-    """Formata número: 1234.56 → '1.234,56' com fallback robusto"""
-    if pd.isna(valor) or valor is None:
-        return "0" + (",00" if casas > 0 else "")
-    
-    try:
-        # Tentar usar locale primeiro
-        try:
-            return locale.format_string(f"%.{casas}f", float(valor), grouping=True)
-        except:
-            # Fallback manual
-            valor_float = float(valor)
-            valor_str = f"{valor_float:,.{casas}f}"
-            if '.' in valor_str:
-                parte_inteira, parte_decimal = valor_str.split('.')
-                parte_inteira = parte_inteira.replace(',', 'X').replace('.', ',').replace('X', '.')
-                return parte_inteira + ',' + parte_decimal
-            else:
-                return valor_str.replace(',', 'X').replace('.', ',').replace('X', '.')
-    except Exception as e:
-        logger.error(f"Erro na formatação: {e}")
-        return "0" + (",00" if casas > 0 else "")
-
-# ============================================= DENSIDADE DOS COMBUSTÍVEIS ==========================================
-DENSIDADES = {
-    'Gasolina': 0.73,
-    'Jet A1': 0.79,
-    'Gasóleo': 0.84,
-    'Diesel': 0.84
-}
-
-# ============================================= FUNÇÃO DE CONVERSÃO TM → M³ ==========================================
-def converter_tm_para_m3_seguro(quantidade_tm: float, combustivel: str) -> float:
-    """Conversão segura de TM para M³"""
-    try:
-        if quantidade_tm == 0 or pd.isna(quantidade_tm):
-            return 0.0
-        
-        combustivel_limpo = str(combustivel).strip().title() if combustivel else ''
-        
-        mapeamento_combustiveis = {
-            'Gasóleo': 'Gasóleo',
-            'Gasolina': 'Gasolina', 
-            'jet': 'Jet A1',
-            'jet a1': 'Jet A1',
-            'jet-a1': 'Jet A1',
-            'diesel': 'Gasóleo',
-            '': 'Gasóleo'
-        }
-        
-        combustivel_normalizado = mapeamento_combustiveis.get(
-            combustivel_limpo.lower(), combustivel_limpo
-        )
-        
-        densidade = DENSIDADES.get(combustivel_normalizado)
-        
-        if not densidade:
-            return 0.0
-        
-        return quantidade_tm / densidade
-        
-    except Exception:
-        return 0.0
-
 # ============================================= FUNÇÃO PARA CARREGAR E EXIBIR LOGO =============================================
 def carregar_logo_base64(caminho_arquivo: str) -> str:
     """Converte a imagem para base64 para exibição no HTML"""
@@ -610,204 +542,151 @@ def exibir_logo_sidebar():
         """, unsafe_allow_html=True)
 
 # ============================================= CACHE DOS DADOS =============================================
-@st.cache_data(ttl=3600)
-def carregar_vendas() -> pd.DataFrame:
-    """Carrega dados de vendas com verificação robusta"""
-    try:
-        arquivos_vendas = [
-            'Vds_2023_Comb_.xlsx',
-            'Vds_2024_Comb_.xlsx',
-            'Vds_2025_Comb_.xlsx'
-        ]
-        
-        dfs = []
-        for arquivo in arquivos_vendas:
-            if os.path.exists(arquivo):
-                df_temp = pd.read_excel(arquivo)
-                logger.info(f"Arquivo {arquivo} carregado: {len(df_temp)} registros")
-                dfs.append(df_temp)
-            else:
-                logger.warning(f"Arquivo {arquivo} não encontrado")
-                st.warning(f"⚠️ Arquivo {arquivo} não encontrado")
-        
-        if not dfs:
-            st.error("❌ Nenhum arquivo de vendas encontrado")
-            return pd.DataFrame()
-            
-        df = pd.concat(dfs, ignore_index=True).fillna(0)
-        
-        # Processamento das colunas monetárias
-        colunas_monetarias = ['V_Liquido', 'V_Imposto', 'Custo_Produto', 'Margem_Vendas',
-                             'V_Venda_Oceanica', 'Desconto', 'Valor_ISC']
-        
-        for col in colunas_monetarias:
-            if col in df.columns:
-                df[f'{col}_MT'] = df[col] * df['Cambio']
-                df[f'{col}_USD'] = df[col] / df['Cambio']
+ROTULOS_FONTES = {
+    'vendas': 'Vendas',
+    'plano': 'Plano',
+    'lookups': 'Lookups',
+    'importacao': 'Importação',
+    'quota_mercado': 'Quota de mercado',
+    'juncoes': 'Junções com lookups',
+    'fatos_vendas': 'Factos de vendas',
+    'fatos_plano': 'Factos do plano',
+}
 
-        # Processamento de datas
-        df['Data_Facturacao'] = pd.to_datetime(df['Data_Facturacao'], errors='coerce')
-        df['Ano'] = df['Data_Facturacao'].dt.year.fillna(0).astype(int)
-        df['Mes'] = df['Data_Facturacao'].dt.month.fillna(0).astype(int)
-        
-        logger.info(f"Dataset de vendas processado: {len(df)} registros")
-        return df
-        
-    except Exception as e:
-        logger.error(f"Erro ao carregar vendas: {str(e)}")
-        st.error(f"❌ Erro crítico ao carregar vendas: {str(e)}")
-        return pd.DataFrame()
+def rotulo_fonte(nome: str) -> str:
+    """'vendas:2025' -> 'Vendas 2025'"""
+    conjunto, _, ano = nome.partition(':')
+    rotulo = ROTULOS_FONTES.get(conjunto, conjunto)
+    return f"{rotulo} {ano}" if ano else rotulo
 
-@st.cache_data(ttl=3600)
-def carregar_plano() -> pd.DataFrame:
-    try:
-        p1 = pd.read_excel('PlanComb_2023.xlsx')
-        p2 = pd.read_excel('PlanComb_2024.xlsx')
-        p3 = pd.read_excel('PlanComb_2025.xlsx')
+def carregar_conjuntos(nomes: List[str]):
+    """
+    Devolve conjuntos da camada de dados ('importacao', 'fatos_vendas:2025', ...).
+    Na primeira vez no processo mostra o progresso de cada fonte carregada.
+    """
+    em_falta = camada_dados.por_carregar(nomes)
 
-        df = pd.concat([p1, p2, p3], ignore_index=True).fillna(0)
-        df['Data_Facturacao'] = pd.to_datetime(df['Data_Facturacao'], format='%d/%m/%Y', errors='coerce')
-        
-        return df
-    except Exception as e:
-        logger.error(f"Erro ao carregar plano: {str(e)}")
-        st.error(f"Erro ao carregar plano: {str(e)}")
-        return pd.DataFrame()
+    if em_falta:
+        painel = st.empty()
+        with painel.container():
+            barra = st.progress(0.0, text="🔄 Carregando dados do sistema...")
+            estado_fontes = {n: st.empty() for n in reversed(em_falta)}
 
-@st.cache_data(ttl=3600)
-def carregar_lookups():
-    try:
-        v0 = pd.read_excel('v_loock_up.xlsx', sheet_name=0)
-        v1 = pd.read_excel('v_loock_up.xlsx', sheet_name=1)
-        v2 = pd.read_excel('v_loock_up.xlsx', sheet_name=2)
-        v3 = pd.read_excel('v_loock_up.xlsx', sheet_name=3)
-        v4 = pd.read_excel('v_loock_up.xlsx', sheet_name=4)
-        v5 = pd.read_excel('v_loock_up.xlsx', sheet_name=5)
-        v0['DataCriacaoCliente'] = pd.to_datetime(v0['DataCriacaoCliente'], format='%d/%m/%Y', errors='coerce')
-        return v0, v1, v2, v3, v4, v5
-    except Exception as e:
-        logger.error(f"Erro ao carregar lookups: {str(e)}")
-        st.error(f"Erro ao carregar lookups: {str(e)}")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        concluidas = []
+        def ao_progredir(fonte: str, estado: str, segundos: float = None):
+            rotulo = rotulo_fonte(fonte)
+            if estado == 'iniciada':
+                estado_fontes[fonte].caption(f"⏳ {rotulo}...")
+                return
+            concluidas.append(fonte)
+            icone = "✅" if estado == 'concluida' else "❌"
+            estado_fontes[fonte].caption(f"{icone} {rotulo} ({segundos:.1f} s)")
+            barra.progress(len(concluidas) / len(em_falta),
+                           text=f"🔄 Carregando dados do sistema... {len(concluidas)}/{len(em_falta)}")
 
-@st.cache_data(ttl=3600)
-def carregar_importacao() -> pd.DataFrame:
-    try:
-        df = pd.read_excel('ImportacaoMZ.xlsx')
-        
-        def safe_datetime_conversion(series, format=None):
-            try:
-                if format:
-                    return pd.to_datetime(series, format=format, errors='coerce')
-                else:
-                    return pd.to_datetime(series, errors='coerce')
-            except Exception:
-                return pd.Series([pd.NaT] * len(series))
-        
-        colunas_data = ['NOR', 'Data_Descarga']
-        for col in colunas_data:
-            if col in df.columns:
-                df[col] = safe_datetime_conversion(df[col])
-        
-        return df
-    except FileNotFoundError:
-        logger.error("Arquivo ImportacaoMZ.xlsx não encontrado")
-        st.error("Arquivo ImportacaoMZ.xlsx não encontrado")
-        return pd.DataFrame()
-    except Exception as e:
-        logger.error(f"Erro ao carregar importação: {str(e)}")
-        st.error(f"Erro ao carregar importação: {str(e)}")
-        return pd.DataFrame()
+        camada_dados.obter_varios(nomes, ao_progredir)
+        painel.empty()
 
-# Carregar dados
-@st.cache_resource
-def carregar_todos_dados():
-    with st.spinner("🔄 Carregando dados do sistema..."):
-        vendas_df = carregar_vendas()
-        plano_df = carregar_plano()
-        v0, v1, v2, v3, v4, v5 = carregar_lookups()
-        import_df = carregar_importacao()
-        return vendas_df, plano_df, v0, v1, v2, v3, v4, v5, import_df
-
-vendas_df, plano_df, v0, v1, v2, v3, v4, v5, import_df = carregar_todos_dados()
-
-# ============================================= PROCESSAMENTO DOS DATAFRAMES =============================================
-def processar_dataframes():
-    """Processa e combina os dataframes de vendas e plano"""
-    try:
-        if not vendas_df.empty:
-            colunas_usd = ['V_Liquido_USD','V_Imposto_USD','Custo_Produto_USD','Margem_Vendas_USD',
-                          'V_Venda_Oceanica_USD','Desconto_USD','Valor_ISC_USD']
-            colunas_mt = ['V_Liquido_MT','V_Imposto_MT','Custo_Produto_MT','Margem_Vendas_MT',
-                         'V_Venda_Oceanica_MT','Desconto_MT','Valor_ISC_MT']
-            
-            vendas_df_MT = vendas_df.drop([col for col in colunas_usd if col in vendas_df.columns], axis=1, errors='ignore')
-            vendas_df_USD = vendas_df.drop([col for col in colunas_mt if col in vendas_df.columns], axis=1, errors='ignore')
+    return camada_dados.obter_varios(nomes)
 
-            vendas_df_MT['Ano'] = vendas_df_MT['Data_Facturacao'].dt.year
-            vendas_df_MT['Mes'] = vendas_df_MT['Data_Facturacao'].dt.month
-            vendas_df_MT['Dia'] = vendas_df_MT['Data_Facturacao'].dt.day
+def obter_dados(nome: str):
+    return carregar_conjuntos([nome])[0]
 
-            DateSet_MT = vendas_df_MT.copy()
-            
-            if not v3.empty:
-                DateSet_MT = pd.merge(DateSet_MT, v3, left_on=['CE'], right_on=['CE'], how='left')
-            if not v0.empty:
-                DateSet_MT = pd.merge(DateSet_MT, v0, left_on=['Emissor'], right_on=['Emissor'], how='left')
-            if not v5.empty:
-                DateSet_MT = pd.merge(DateSet_MT, v5, left_on=['Material'], right_on=['Material'], how='left')
-            if not v4.empty:
-                DateSet_MT = pd.merge(DateSet_MT, v4, left_on=['TipFt'], right_on=['TipFt'], how='left')
-            if not v1.empty:
-                DateSet_MT = pd.merge(DateSet_MT, v1, left_on=['CDst'], right_on=['CDst'], how='left')
-            
-            if 'DataCriacaoCliente' in DateSet_MT.columns:
-                DateSet_MT['DataCriacaoCliente'] = pd.to_datetime(DateSet_MT['DataCriacaoCliente'], format='%d/%m/%Y', errors='coerce')
+# Colunas de data de cada tipo de dados, por ordem de preferência
+COLUNAS_DATA_VENDAS = ['Data_Facturacao']
+COLUNAS_DATA_IMPORTACAO = ['NOR', 'Data_Descarga']
 
-            colunas_remover = ['Doc.fat.','Tipo.Factura','TipFt','Denominação','Cambio','Moeda']
-            DateSet_MT_Pln = DateSet_MT.drop([col for col in colunas_remover if col in DateSet_MT.columns], axis=1, errors='ignore')
-            
-            if not plano_df.empty:
-                DateSet_MT_Pln = pd.merge(DateSet_MT_Pln, plano_df, 
-                                        left_on=['Data_Facturacao','Emissor','CDst','Material'],
-                                        right_on=['Data_Facturacao','Emissor','CDst','Material'], 
-                                        how='left')
-            
-            DateSet_MT_Pln = DateSet_MT_Pln.fillna(value=0)
-            
-            return DateSet_MT_Pln, vendas_df_MT, vendas_df_USD
-        else:
-            return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-            
-    except Exception as e:
-        logger.error(f"Erro ao processar dataframes: {str(e)}")
-        st.error(f"Erro ao processar dataframes: {str(e)}")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+# Colunas de vendas filtradas por pesquisa quando têm valores a mais para listar
+COLUNAS_PESQUISA_VENDAS = ['Nome_do_Cliente', 'Emissor', 'Gestor / Promotor']
 
-DateSet_MT_Pln, vendas_df_MT, vendas_df_USD = processar_dataframes()
+def obter_indice(nomes: List[str], colunas_data: List[str]):
+    """Índice de filtros (e catálogo) dos conjuntos, carregados se preciso"""
+    carregar_conjuntos(nomes)
+    return camada_dados.indice(nomes, colunas_data)
 
-# ============================================= LIMPEZA DE COLUNAS =============================================
-CLIENTES_CONGENERES = [
-    "AFR PETR", "B ENERGY", "BP", "CAC", "CAMEL", "DALBIT", "ENER", "EXOR",
-    "GLENCORE", "GTS", "IPM", "I2A", "LAKE OIL", "LIBERTY", "MCCI", "MITRA",
-    "MOUMERU", "MOZTOP", "NGUVU L", "PETRODA", "PETROGAL", "PESS", "PUMA",
-    "RUR", "TOP ENERGY", "TOTAL", "UNION", "VIVO"
-]
+def particoes(conjunto: str, intervalo: Tuple[date, ...]) -> List[str]:
+    """Partições ('fatos_vendas:2025', ...) dos anos que o intervalo de datas cobre"""
+    return [nome_particao(conjunto, ano) for ano in anos_no_intervalo(intervalo)]
 
+def obter_fatos(conjunto: str, intervalo: Tuple[date, ...]) -> pd.DataFrame:
+    """Factos (ou cubos) de vendas ou de plano apenas dos anos que o intervalo cobre"""
+    nomes = particoes(conjunto, intervalo)
+    carregar_conjuntos(nomes)
+    return camada_dados.combinar(nomes)
+
+def base_vendas(filtros: Dict) -> str:
+    """
+    'cubo' quando todos os filtros escolhidos são dimensões do cubo de vendas
+    (as vistas agregam do cubo, muito mais pequeno); senão 'fatos'.
+    """
+    filtrados = [c for c, v in filtros.items() if c not in motor_consultas.CHAVES_NAO_COLUNAS and v]
+    return 'cubo' if all(c in DIMENSOES_CUBO for c in filtrados) else 'fatos'
+
+def plano_comparavel(plano_filtrado: pd.DataFrame, filtros: Dict, conjuntos_plano: List[str]) -> pd.DataFrame:
+    """
+    Plano filtrado, ou tabela vazia se algum filtro escolhido for de uma coluna
+    que o plano não tem (Provincia, Instalação): o índice não o aplicaria ao
+    plano e as vendas de uma província ficariam comparadas com o plano
+    nacional. Nesse caso avisa que plano e variações ficam ocultos.
+    """
+    indice_plano = camada_dados.indice(conjuntos_plano, COLUNAS_DATA_VENDAS)
+    em_falta = indice_plano.colunas_em_falta(filtros)
+    if not em_falta or indice_plano.df.empty:
+        return plano_filtrado
+    st.warning(f"⚠️ O plano não está definido por {', '.join(em_falta)}: plano e variações ficam ocultos "
+               f"enquanto houver filtro por {'essa coluna' if len(em_falta) == 1 else 'essas colunas'}")
+    return pd.DataFrame()
+
+def intervalo_vendas_atual() -> Tuple[date, ...]:
+    """Intervalo do calendário de vendas, incluindo uma alteração ainda não aplicada"""
+    intervalo = st.session_state.get('widget_date_range_vendas') or st.session_state['date_range_vendas']
+    return tuple(intervalo)
+
+def mostrar_erros_carregamento(nomes: List[str]):
+    """Mostra os erros das fontes usadas pelos conjuntos e os ficheiros de vendas em falta"""
+    fontes = []
+    for nome in nomes:
+        fontes += [f for f in camada_dados.dependencias(nome) if f not in fontes]
+    for fonte in fontes:
+        if fonte in camada_dados.erros:
+            st.error(f"❌ Erro ao carregar {rotulo_fonte(fonte).lower()}: {str(camada_dados.erros[fonte])}")
+    for fonte in fontes:
+        conjunto, _, ano = fonte.partition(':')
+        if conjunto == 'vendas' and not os.path.exists(arquivo_do_ano('vendas', int(ano))):
+            st.warning(f"⚠️ Arquivo {arquivo_do_ano('vendas', int(ano))} não encontrado")
+
+# ============================================= LIMPEZA DE COLUNAS =============================================
 def limpar_coluna_numerica(df: pd.DataFrame, col: str) -> pd.Series:
+    """Coluna em float64 com 0 nos vazios; já numérica (importação normalizada na leitura) não é reinterpretada"""
     if col not in df.columns:
         return pd.Series([0.0] * len(df))
     
+    if pd.api.types.is_numeric_dtype(df[col]):
+        return df[col].astype('float64').fillna(0.0)
     try:
-        s = df[col].astype(str).str.strip()
-        s = s.str.replace(r'\s+', '', regex=True)
-        s = s.str.replace(',', '.', regex=False)
-        s = s.str.replace(r'[^0-9.-]', '', regex=True)
-        s = s.replace('', '0').replace('.', '0')
-        return pd.to_numeric(s, errors='coerce').fillna(0.0)
-    except:
+        return normalizar_numericos(df[[col]], [col])[col].fillna(0.0)
+    except Exception:
         return pd.Series([0.0] * len(df))
 
+def soma_numerica(df: pd.DataFrame, col: str) -> float:
+    """Soma de uma coluna numérica (vazios contam 0) sem criar colunas intermédias"""
+    if col not in df.columns:
+        return 0.0
+    if pd.api.types.is_numeric_dtype(df[col]):
+        return float(np.nansum(df[col].to_numpy(dtype='float64', na_value=np.nan)))
+    return float(limpar_coluna_numerica(df, col).sum())
+
+def valor_liquido_por(df: pd.DataFrame, chave: str) -> pd.DataFrame:
+    """V_Liquido somado por 'chave' em MT e em USD (cada linha convertida pelo seu Cambio ao agregar)"""
+    if any(c not in df.columns for c in ('V_Liquido', 'Cambio', chave)):
+        return pd.DataFrame(columns=['Valor (MT)', 'Valor (USD)'], dtype='float64')
+    return agregado(
+        f"valor_liquido_por|{chave}",
+        lambda: pd.concat({f'Valor ({moeda})': somar_em_moeda(df, ['V_Liquido'], moeda, [chave])['V_Liquido']
+                           for moeda in ('MT', 'USD')}, axis=1),
+        df
+    )
+
 # ============================================= FUNÇÃO PARA LINK EXTERNO =============================================
 def criar_link_externo(url: str, texto: str, icone: str = "🌐"):
     """Cria um link externo que abre em nova aba"""
@@ -833,34 +712,22 @@ def criar_link_externo(url: str, texto: str, icone: str = "🌐"):
     """
 
 # ============================================= FUNÇÕES DO MENU LATERAL =============================================
-@st.cache_data(ttl=3600)
-def carregar_opcoes_filtros(df: pd.DataFrame, tipo: str) -> Dict[str, Any]:
-    """Carrega opções de filtros baseadas na tabela especificada"""
+def carregar_opcoes_filtros(indice, tipo: str) -> Dict[str, Any]:
+    """Opções de filtros a partir do catálogo do índice (calculado uma vez por versão dos dados)"""
+    df = indice.df
     if df.empty:
         return {}
     
-    df = df.copy()
+    catalogo = indice.catalogo()
     result = {}
     
     # DATAS PADRÃO
     start_date_default = date(2025, 1, 1)
     end_date_default = date.today()
     
-    # Determinar coluna de data baseada no tipo
-    if tipo == "importacao":
-        coluna_data = 'NOR' if 'NOR' in df.columns else 'Data_Descarga'
-    else:  # vendas
-        coluna_data = 'Data_Facturacao'
-    
-    if coluna_data in df.columns:
-        df[coluna_data] = pd.to_datetime(df[coluna_data], errors='coerce')
-        datas_validas = df[coluna_data].dropna()
-    else:
-        datas_validas = pd.Series([])
-    
-    if not datas_validas.empty:
-        min_date = datas_validas.min().date()
-        max_date = min(datas_validas.max().date(), end_date_default)
+    if catalogo['min_date'] is not None:
+        min_date = catalogo['min_date']
+        max_date = min(catalogo['max_date'], end_date_default)
     else:
         min_date = start_date_default
         max_date = end_date_default
@@ -868,24 +735,19 @@ def carregar_opcoes_filtros(df: pd.DataFrame, tipo: str) -> Dict[str, Any]:
     result.update({
         'min_date': min_date,
         'max_date': max_date,
-        'coluna_data': coluna_data
+        'coluna_data': catalogo['coluna_data'] or ('Data_Descarga' if tipo == "importacao" else 'Data_Facturacao')
     })
     
-    # BUSCAR TODAS AS COLUNAS DISPONÍVEIS PARA FILTROS
-    colunas_disponiveis = df.columns.tolist()
-    
-    # Filtrar colunas por tipo de conteúdo
-    for coluna in colunas_disponiveis:
+    # Colunas com até LIMITE_VALORES_CATALOGO valores distintos
+    for coluna, valores_unicos in catalogo['valores'].items():
         if coluna in ['_merge', 'Ano_merge', 'Mes_merge']:
             continue
-            
-        valores_unicos = df[coluna].dropna().unique()
-        if len(valores_unicos) > 0 and len(valores_unicos) <= 100:  # Limitar a 100 valores únicos
-            if pd.api.types.is_numeric_dtype(df[coluna]):
-                if coluna in ['Ano', 'Ano_Vendas', 'Ano_Importacao']:
-                    result[coluna] = sorted([int(v) for v in valores_unicos if pd.notna(v) and str(v).isdigit()])
-            else:
-                result[coluna] = sorted([str(v) for v in valores_unicos if pd.notna(v) and str(v) != ''])
+        
+        if pd.api.types.is_numeric_dtype(df[coluna]):
+            if coluna in ['Ano', 'Ano_Vendas', 'Ano_Importacao']:
+                result[coluna] = sorted([int(v) for v in valores_unicos if pd.notna(v) and str(v).isdigit()])
+        else:
+            result[coluna] = sorted([str(v) for v in valores_unicos if pd.notna(v) and str(v) != ''])
     
     return result
 
@@ -922,6 +784,59 @@ def criar_secao_calendario_corrigida(opcoes: Dict[str, Any], tipo: str) -> tuple
         # Se seleção inválida, manter o valor anterior
         return st.session_state[chave_calendario]
 
+def selecao_atual(chave_filtro: str) -> List[Any]:
+    """Valores escolhidos num filtro: o widget já tem a escolha deste rerun, o session_state a anterior"""
+    return st.session_state.get(f"widget_{chave_filtro}", st.session_state.get(chave_filtro, []))
+
+def filtros_atuais(date_range: Tuple[date, ...], chaves_filtro: Dict[str, str]) -> Dict[str, Any]:
+    """Intervalo de datas e escolhas atuais de cada filtro (coluna -> chave no session_state)"""
+    return {'date_range': date_range, **{coluna: selecao_atual(chave) for coluna, chave in chaves_filtro.items()}}
+
+def contar_facetas(indice, date_range: Tuple[date, ...], chaves_filtro: Dict[str, str],
+                   colunas: List[str]) -> Dict[str, Dict[str, int]]:
+    """Linhas por valor de cada uma das 'colunas', com o intervalo e as escolhas atuais dos outros filtros"""
+    return indice.facetas(filtros_atuais(date_range, chaves_filtro), colunas)
+
+def opcoes_com_contagem(valores: List[Any], contagens: Dict[str, int], chave_filtro: str) -> List[Any]:
+    """Opções com linhas nos outros filtros (as já escolhidas ficam sempre)"""
+    escolhidos = {str(v) for v in selecao_atual(chave_filtro)}
+    return [v for v in valores if contagens.get(str(v)) or str(v) in escolhidos]
+
+def criar_filtro_pesquisa(indice, coluna: str, chave_filtro: str, rotulo: str,
+                          filtros_contagem: Dict[str, Any]) -> List[str]:
+    """
+    Filtro de uma coluna com muitos valores (clientes, emissores): o texto
+    escrito é pesquisado no servidor e só os melhores resultados, com as
+    linhas de cada um nos outros filtros, chegam ao multiselect.
+    """
+    if chave_filtro not in st.session_state:
+        st.session_state[chave_filtro] = []
+    
+    termo = st.sidebar.text_input(
+        f"🔎 Pesquisar {rotulo}",
+        key=f"pesquisa_{chave_filtro}",
+        placeholder="Parte do nome ou do código",
+        help=f"{indice.catalogo()['distintos'].get(coluna, 0)} valores distintos: escreva para procurar"
+    )
+    resultados = dict(indice.pesquisar(coluna, termo, filtros_contagem)) if termo else {}
+    
+    # As escolhas anteriores ficam sempre disponíveis, mesmo fora da pesquisa atual
+    escolhidos = [str(v) for v in st.session_state[chave_filtro]]
+    opcoes = list(dict.fromkeys(escolhidos + list(resultados)))
+    
+    valores_selecionados = st.sidebar.multiselect(
+        rotulo,
+        options=opcoes,
+        default=escolhidos,
+        format_func=lambda v: f"{v} ({resultados[v]})" if v in resultados else v,
+        key=f"widget_{chave_filtro}"
+    )
+    if termo and not resultados:
+        st.sidebar.caption(f"Nenhum valor de {coluna} encontrado para '{termo}'")
+    
+    st.session_state[chave_filtro] = valores_selecionados
+    return valores_selecionados
+
 def limpar_filtros_session_state():
     """Limpa todos os filtros do session_state"""
     keys_to_remove = []
@@ -973,7 +888,8 @@ def renderizar_menu_lateral_corrigido():
     
     if modo_trabalho == "Importação":
         # CARREGAR OPÇÕES DE FILTRO DA IMPORTAÇÃO
-        opcoes_import = carregar_opcoes_filtros(import_df, "importacao")
+        indice_import = obter_indice(['importacao'], COLUNAS_DATA_IMPORTACAO)
+        opcoes_import = carregar_opcoes_filtros(indice_import, "importacao")
         
         if not opcoes_import:
             st.sidebar.warning("⚠️ Nenhum dado de importação disponível")
@@ -1001,6 +917,10 @@ def renderizar_menu_lateral_corrigido():
                 len(colunas_filtradas_import) < 5):
                 colunas_filtradas_import.append(coluna)
         
+        # Contagens por valor com os outros filtros aplicados (facetas em cascata)
+        chaves_import = {coluna: f"filtro_import_{coluna}" for coluna in colunas_filtradas_import}
+        contagens = contar_facetas(indice_import, date_range_import, chaves_import, colunas_filtradas_import)
+        
         for coluna in colunas_filtradas_import:
             valores = opcoes_import[coluna]
             if valores:
@@ -1011,8 +931,9 @@ def renderizar_menu_lateral_corrigido():
                 
                 valores_selecionados = st.sidebar.multiselect(
                     f"{coluna} (Import.)",
-                    options=valores,
+                    options=opcoes_com_contagem(valores, contagens.get(coluna, {}), chave_filtro),
                     default=st.session_state[chave_filtro],
+                    format_func=lambda v, c=contagens.get(coluna, {}): f"{v} ({c.get(str(v), 0)})",
                     key=f"widget_{chave_filtro}"
                 )
                 
@@ -1020,9 +941,11 @@ def renderizar_menu_lateral_corrigido():
                 st.session_state[chave_filtro] = valores_selecionados
                 filtros[coluna] = valores_selecionados
     
-    else:  # MODO VENDAS
+    elif modo_trabalho in ("Vendas", "Promotores"):  # MODO VENDAS
         # CARREGAR OPÇÕES DE FILTRO DAS VENDAS
-        opcoes_vendas = carregar_opcoes_filtros(DateSet_MT_Pln, "vendas")
+        # Opções vêm só das partições (anos) do intervalo de datas escolhido
+        indice_vendas = obter_indice(particoes('fatos_vendas', intervalo_vendas_atual()), COLUNAS_DATA_VENDAS)
+        opcoes_vendas = carregar_opcoes_filtros(indice_vendas, "vendas")
         
         if not opcoes_vendas:
             st.sidebar.warning("⚠️ Nenhum dado de vendas disponível")
@@ -1051,6 +974,15 @@ def renderizar_menu_lateral_corrigido():
                 len(colunas_filtradas_vendas) < 5):
                 colunas_filtradas_vendas.append(coluna)
         
+        # Colunas com demasiados valores para listar: filtros por pesquisa
+        colunas_pesquisa_vendas = [coluna for coluna in COLUNAS_PESQUISA_VENDAS
+                                   if coluna not in colunas_filtradas_vendas and coluna in indice_vendas.df.columns]
+        
+        # Contagens por valor com os outros filtros aplicados (facetas em cascata)
+        chaves_vendas = {coluna: f"filtro_vendas_{coluna.replace('/', '_').replace(' ', '_')}"
+                         for coluna in colunas_filtradas_vendas + colunas_pesquisa_vendas}
+        contagens = contar_facetas(indice_vendas, date_range_vendas, chaves_vendas, colunas_filtradas_vendas)
+        
         for coluna in colunas_filtradas_vendas:
             valores = opcoes_vendas[coluna]
             if valores:
@@ -1066,14 +998,20 @@ def renderizar_menu_lateral_corrigido():
                 
                 valores_selecionados = st.sidebar.multiselect(
                     f"{nome_exibicao} (Vendas)",
-                    options=valores,
+                    options=opcoes_com_contagem(valores, contagens.get(coluna, {}), chave_filtro),
                     default=st.session_state[chave_filtro],
+                    format_func=lambda v, c=contagens.get(coluna, {}): f"{v} ({c.get(str(v), 0)})",
                     key=f"widget_{chave_filtro}"
                 )
                 
                 # Atualizar session_state
                 st.session_state[chave_filtro] = valores_selecionados
                 filtros[coluna] = valores_selecionados
+        
+        filtros_contagem = filtros_atuais(date_range_vendas, chaves_vendas)
+        for coluna in colunas_pesquisa_vendas:
+            filtros[coluna] = criar_filtro_pesquisa(indice_vendas, coluna, chaves_vendas[coluna],
+                                                    f"{coluna} (Vendas)", filtros_contagem)
     
     # BOTÕES DE AÇÃO (comuns a ambos os modos)
     st.sidebar.markdown("---")
@@ -1083,7 +1021,8 @@ def renderizar_menu_lateral_corrigido():
     
     with col1:
         if st.sidebar.button("🔄 Atualizar", use_container_width=True, key="btn_atualizar"):
-            st.cache_data.clear()
+            # Só os conjuntos cujos ficheiros mudaram são refeitos (em segundo plano)
+            camada_dados.pedir_verificacao()
             st.rerun()
     
     with col2:
@@ -1091,6 +1030,17 @@ def renderizar_menu_lateral_corrigido():
             limpar_filtros_session_state()
             st.rerun()
     
+    if camada_dados.em_reconstrucao:
+        st.sidebar.caption("🔄 Ficheiros alterados: a atualizar "
+                           + ", ".join(rotulo_fonte(n) for n in camada_dados.em_reconstrucao)
+                           + " em segundo plano...")
+    
+    # Contadores da cache de resultados partilhada por todas as sessões
+    estatisticas = cache_resultados.estatisticas()
+    if estatisticas['acertos'] + estatisticas['falhas']:
+        st.sidebar.caption(f"⚡ Cache de resultados: {estatisticas['acertos']} acertos, "
+                           f"{estatisticas['falhas']} falhas ({estatisticas['entradas']} entradas)")
+    
     return filtros
 
 # ============================================= FUNÇÕES DE VISUALIZAÇÃO =============================================
@@ -1121,11 +1071,104 @@ def criar_card_metricas(titulo: str, valor_principal: str, subtitulo1: str = "",
     </div>
     """, unsafe_allow_html=True)
 
+# ============================================= CACHE DE RESULTADOS FILTRADOS =============================================
+def filtrar_com_indice(indice, conjuntos: List[str], filtros: Dict) -> pd.DataFrame:
+    """
+    Seleção de linhas pelo índice, guardada na cache de resultados do processo
+    pela chave canónica (conjuntos e versões, filtros com o modo). A chave
+    fica em attrs da tabela filtrada para os agregados das abas.
+    """
+    chave = chave_canonica(conjuntos, camada_dados.versao(conjuntos), filtros)
+    posicoes = cache_resultados.obter(('selecao', chave), lambda: indice.selecionar(filtros))
+    df_filtrado = indice.linhas(posicoes)
+    df_filtrado.attrs['chave_resultados'] = chave
+    return df_filtrado
+
+def agregado(nome: str, calcular: Callable[[], Any], *tabelas: pd.DataFrame) -> Any:
+    """
+    Agregado 'nome' das tabelas filtradas, partilhado entre sessões. Sem chave
+    de filtros em alguma tabela (ex.: caminho SQL) é sempre calculado. O
+    resultado é partilhado: não o alterar no lugar.
+    """
+    chaves = [(t.attrs.get('chave_resultados'), len(t)) for t in tabelas]
+    if any(chave is None for chave, _ in chaves):
+        return calcular()
+    return cache_resultados.obter((nome, *chaves), calcular)
+
+# ============================================= TOTAIS POR PERÍODO =============================================
+def totais_periodos(filtros: Dict) -> Dict[str, Dict[str, float]]:
+    """
+    Vendas e plano (m³) do intervalo escolhido, do mês e do ano até à data e do
+    mesmo período do ano anterior (até ao último dia com vendas). Com no
+    máximo uma dimensão filtrada cada total são duas leituras das somas
+    acumuladas; com outros filtros, cada período é filtrado pelo índice.
+    O plano fica NaN se um filtro for de uma coluna que o plano não tem.
+    """
+    inicio, fim = filtros['date_range'][0], filtros['date_range'][-1]
+    # Mês e ano até à data contam até ao último dia com vendas, não até hoje
+    ultimo = obter_indice(particoes('cubo_vendas', (inicio, fim)), COLUNAS_DATA_VENDAS).catalogo()['max_date']
+    if ultimo is not None and inicio <= ultimo < fim:
+        fim = ultimo
+    janelas = periodos(inicio, fim)
+    cobertura = (min(a for a, _ in janelas.values()), max(b for _, b in janelas.values()))
+    filtrados = {c: v for c, v in filtros.items() if c not in motor_consultas.CHAVES_NAO_COLUNAS and v}
+    
+    if len(filtrados) <= 1 and all(c in DIMENSOES_SOMAS for c in filtrados):
+        nomes_vendas, nomes_plano = particoes('cubo_vendas', cobertura), particoes('cubo_plano', cobertura)
+        carregar_conjuntos(nomes_vendas + nomes_plano)
+        somas = camada_dados.somas(nomes_vendas, nomes_plano)
+        dimensao, valores = next(iter(filtrados.items()), (None, None))
+        return {nome: {'Vendas': somas.total('Vendas m³', a, b, dimensao, valores),
+                       'Plano': somas.total(MEDIDA_PLANO, a, b, dimensao, valores)}
+                for nome, (a, b) in janelas.items()}
+    
+    base = base_vendas(filtros)
+    nomes_vendas, nomes_plano = particoes(f'{base}_vendas', cobertura), particoes(f'{base}_plano', cobertura)
+    carregar_conjuntos(nomes_vendas + nomes_plano)
+    indice_vendas = camada_dados.indice(nomes_vendas, COLUNAS_DATA_VENDAS)
+    indice_plano = camada_dados.indice(nomes_plano, COLUNAS_DATA_VENDAS)
+    totais = {}
+    for nome, janela in janelas.items():
+        filtros_periodo = {**filtros, 'date_range': janela}
+        vendas = filtrar_com_indice(indice_vendas, nomes_vendas, filtros_periodo)
+        plano = filtrar_com_indice(indice_plano, nomes_plano, filtros_periodo)
+        coluna_plano = detetar_coluna_plano(plano)
+        totais[nome] = {'Vendas': float(vendas['Vendas m³'].sum()) if 'Vendas m³' in vendas.columns else 0.0,
+                        'Plano': float(plano[coluna_plano].sum()) if coluna_plano else 0.0}
+        # Filtro numa coluna que o plano não tem: sem plano comparável (como nas somas acumuladas)
+        if indice_plano.colunas_em_falta(filtros) and not indice_plano.df.empty:
+            totais[nome]['Plano'] = np.nan
+    return totais
+
+def mostrar_totais_periodos(filtros: Dict):
+    """Métricas de vendas por período: variação face ao plano e, no ano anterior, crescimento do intervalo"""
+    try:
+        totais = totais_periodos(filtros)
+    except Exception as e:
+        logger.error(f"Erro ao calcular os totais por período: {e}")
+        return
+    
+    colunas = st.columns(len(totais))
+    atual = totais['Intervalo']['Vendas']
+    for coluna, (nome, valores) in zip(colunas, totais.items()):
+        with coluna:
+            if nome == 'Mesmo período do ano anterior':
+                delta = f"{(atual / valores['Vendas'] - 1) * 100:+.1f}% no intervalo atual" if valores['Vendas'] else None
+            else:
+                delta = f"{(valores['Vendas'] / valores['Plano'] - 1) * 100:+.1f}% vs plano" if valores['Plano'] > 0 else None
+            st.metric(nome, f"{formatar_ptbr(valores['Vendas'], 0)} m³", delta)
+
 # ============================================= FUNÇÃO DE FILTRAGEM PARA VENDAS =============================================
-def aplicar_filtros_vendas(df: pd.DataFrame, filtros: Dict) -> pd.DataFrame:
-    """Aplica filtros no DataFrame de vendas"""
+def aplicar_filtros_vendas(df: pd.DataFrame, filtros: Dict, conjuntos: List[str] = None) -> pd.DataFrame:
+    """Aplica filtros no DataFrame de vendas (pelo índice de filtros dos 'conjuntos', ou em pandas)"""
     if df.empty:
         return df
+    
+    if conjuntos:
+        # Índice de bitmaps da versão atual dos conjuntos: seleção sem copiar a base
+        indice = camada_dados.indice(conjuntos, COLUNAS_DATA_VENDAS)
+        if indice.df is df:
+            return filtrar_com_indice(indice, conjuntos, filtros)
         
     df_filtrado = df.copy()
     
@@ -1140,15 +1183,21 @@ def aplicar_filtros_vendas(df: pd.DataFrame, filtros: Dict) -> pd.DataFrame:
     for coluna, valores in filtros.items():
         if coluna not in ['date_range', 'modo_trabalho', 'tipo_dados'] and valores:
             if coluna in df_filtrado.columns:
-                df_filtrado = df_filtrado[df_filtrado[coluna].astype(str).isin([str(v) for v in valores])]
+                df_filtrado = df_filtrado[mascara_valores(df_filtrado[coluna], valores)]
     
     return df_filtrado
 
 # ============================================= FUNÇÃO DE FILTRAGEM PARA IMPORTAÇÃO =============================================
-def aplicar_filtros_importacao(df: pd.DataFrame, filtros: Dict) -> pd.DataFrame:
-    """Aplica filtros no DataFrame de importação"""
+def aplicar_filtros_importacao(df: pd.DataFrame, filtros: Dict, conjuntos: List[str] = None) -> pd.DataFrame:
+    """Aplica filtros no DataFrame de importação (pelo índice de filtros dos 'conjuntos', ou em pandas)"""
     if df.empty:
         return df
+    
+    if conjuntos:
+        # Índice de bitmaps da versão atual dos conjuntos: seleção sem copiar a base
+        indice = camada_dados.indice(conjuntos, COLUNAS_DATA_IMPORTACAO)
+        if indice.df is df:
+            return filtrar_com_indice(indice, conjuntos, filtros)
         
     df_filtrado = df.copy()
     
@@ -1166,7 +1215,7 @@ def aplicar_filtros_importacao(df: pd.DataFrame, filtros: Dict) -> pd.DataFrame:
     for coluna, valores in filtros.items():
         if coluna not in ['date_range', 'modo_trabalho', 'tipo_dados'] and valores:
             if coluna in df_filtrado.columns:
-                df_filtrado = df_filtrado[df_filtrado[coluna].astype(str).isin([str(v) for v in valores])]
+                df_filtrado = df_filtrado[mascara_valores(df_filtrado[coluna], valores)]
     
     return df_filtrado
 
@@ -1213,7 +1262,7 @@ def criar_botao_download_csv(df: pd.DataFrame, nome_arquivo: str, descricao: str
 
 # ============================================= GRÁFICO DE LINHAS VENDAS vs PLANO =============================================
 
-def criar_grafico_linhas_vendas_plano(df_filtrado: pd.DataFrame):
+def criar_grafico_linhas_vendas_plano(df_filtrado: pd.DataFrame, plano_filtrado: pd.DataFrame):
     """Cria gráfico de linhas Vendas vs Plano por mês na ordem correta"""
     
     if df_filtrado.empty:
@@ -1221,38 +1270,20 @@ def criar_grafico_linhas_vendas_plano(df_filtrado: pd.DataFrame):
     
     try:
         # Verificar se temos as colunas necessárias
-        colunas_necessarias = ['Data_Facturacao']
         colunas_vendas = ['Vendas m³', 'V_Liquido', 'Quantidade']
-        colunas_plano = ['Plano_m³', 'Plano', 'Quantidade_Plano']
         
         # Encontrar colunas disponíveis
         coluna_vendas = next((col for col in colunas_vendas if col in df_filtrado.columns), None)
-        coluna_plano = next((col for col in colunas_plano if col in df_filtrado.columns), None)
         
-        if not coluna_vendas or not coluna_plano:
+        if not coluna_vendas or detetar_coluna_plano(plano_filtrado) is None:
             return None
         
-        # Criar cópia do dataframe
-        df_grafico = df_filtrado.copy()
-        
-        # Garantir que a data está em formato datetime
-        df_grafico['Data_Facturacao'] = pd.to_datetime(df_grafico['Data_Facturacao'], errors='coerce')
-        
-        # Extrair ano e mês
-        df_grafico['Ano'] = df_grafico['Data_Facturacao'].dt.year
-        df_grafico['Mes'] = df_grafico['Data_Facturacao'].dt.month
-        
-        # Agrupar por mês e calcular totais
-        dados_mensais = df_grafico.groupby(['Ano', 'Mes']).agg({
-            coluna_vendas: 'sum',
-            coluna_plano: 'sum'
-        }).reset_index()
-        
-        # Renomear colunas para padrão
-        dados_mensais = dados_mensais.rename(columns={
-            coluna_vendas: 'Vendas',
-            coluna_plano: 'Plano'
-        })
+        # Vendas e plano agregados por mês e só depois alinhados
+        dados_mensais = agregado(
+            'vendas_plano_mensal',
+            lambda: alinhar_vendas_plano(df_filtrado, coluna_vendas, plano_filtrado, ['Ano', 'Mes']),
+            df_filtrado, plano_filtrado
+        ).copy()
         
         # Criar coluna de data para ordenação
         dados_mensais['Data'] = pd.to_datetime(
@@ -1398,7 +1429,7 @@ def criar_grafico_linhas_simulado():
 
 # ============================================= ABA VENDAS COM TABELA E CARTÕES PRIMEIRO =============================================
 
-def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dict):
+def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dict, plano_filtrado: pd.DataFrame):
     """Cria a aba de Vendas com tabela, cartões e gráfico de linha Vendas vs Plano"""
     
     st.markdown('<div class="section-title">📊 Vendas - Análise por Linha de Negócio</div>', unsafe_allow_html=True)
@@ -1423,27 +1454,36 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
     total_vendas = 0
     total_plano = 0
     
+    # Sem plano comparável (ex.: filtro por Provincia) as colunas de plano e variação ficam ocultas
+    com_plano = detetar_coluna_plano(plano_filtrado) is not None
+    
+    # Plano da tabela de factos do plano, somado por linha de negócio
+    plano_por_linha = agregado('plano_por_linha', lambda: somar_plano_por(plano_filtrado, ['Sector/Sigla']),
+                               plano_filtrado)
+    
+    # Tentar diferentes nomes de colunas para vendas
+    colunas_vendas = ['Vendas m³', 'V_Liquido', 'Quantidade', 'Vendas']
+    col_venda = next((c for c in colunas_vendas if c in df_filtrado.columns), None)
+    
+    # Vendas por linha de negócio num só agrupamento (linhas sem registos ficam de fora)
+    if 'Sector/Sigla' in df_filtrado.columns:
+        if col_venda:
+            # Soma por linha de negócio no motor de consultas (DuckDB ou pandas)
+            vendas_por_linha = agregado(
+                'vendas_por_linha',
+                lambda: motor_consultas.somar_por(df_filtrado, 'Sector/Sigla', [col_venda])
+                        .set_index('Sector/Sigla')[col_venda],
+                df_filtrado
+            )
+        else:
+            vendas_por_linha = pd.Series(0, index=df_filtrado['Sector/Sigla'].dropna().unique())
+    
     for linha in linhas_negocio:
         # Usar dados reais do DataFrame se disponíveis, senão simular
         if 'Sector/Sigla' in df_filtrado.columns:
-            dados_linha = df_filtrado[df_filtrado['Sector/Sigla'] == linha]
-            if not dados_linha.empty:
-                # Tentar diferentes nomes de colunas para vendas
-                colunas_vendas = ['Vendas m³', 'V_Liquido', 'Quantidade', 'Vendas']
-                colunas_plano = ['Plano_m³', 'Plano', 'Quantidade_Plano']
-                
-                vendas = 0
-                plano = 0
-                
-                for col_venda in colunas_vendas:
-                    if col_venda in dados_linha.columns:
-                        vendas = dados_linha[col_venda].sum()
-                        break
-                
-                for col_plano in colunas_plano:
-                    if col_plano in dados_linha.columns:
-                        plano = dados_linha[col_plano].sum()
-                        break
+            if linha in vendas_por_linha.index:
+                vendas = vendas_por_linha[linha]
+                plano = plano_por_linha.get(linha, 0)
             else:
                 # Dados simulados se não houver dados reais
                 vendas = np.random.uniform(50000, 200000)
@@ -1501,6 +1541,8 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
     })
     
     df_tabela = pd.DataFrame(dados_tabela)
+    if not com_plano:
+        df_tabela = df_tabela[['Linha de Negócio', 'Vendas (m³)']]
     
     # Formatar tabela para exibição
     df_display = df_tabela.copy()
@@ -1509,15 +1551,11 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
     colunas_numericas = ['Vendas (m³)', 'Plano (m³)', 'Variação (m³)']
     for coluna in colunas_numericas:
         if coluna in df_display.columns:
-            df_display[coluna] = df_display[coluna].apply(
-                lambda x: formatar_ptbr(x, 0) if pd.notna(x) else "0"
-            )
+            df_display[coluna] = formatar_coluna_ptbr(df_display[coluna], 0)
     
     # Formatar percentual
     if 'Variação (%)' in df_display.columns:
-        df_display['Variação (%)'] = df_display['Variação (%)'].apply(
-            lambda x: f"{x:+.1f}%" if pd.notna(x) else "0,0%"
-        )
+        df_display['Variação (%)'] = formatar_coluna_ptbr(df_display['Variação (%)'], 1, sufixo='%', com_sinal=True)
     
     # Exibir tabela
     st.dataframe(
@@ -1541,39 +1579,44 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
             "petromoc"
         )
     
-    with col2:
-        criar_card_metricas(
-            "Plano Total",
-            f"{formatar_ptbr(total_plano, 0)}",
-            "Meta estabelecida",
-            "Volume planejado",
-            "🎯",
-            "plano"
-        )
+    if com_plano:
+        with col2:
+            criar_card_metricas(
+                "Plano Total",
+                f"{formatar_ptbr(total_plano, 0)}",
+                "Meta estabelecida",
+                "Volume planejado",
+                "🎯",
+                "plano"
+            )
     
-    with col3:
-        cor_diferenca = "fh" if variacao_total >= 0 else "RELEASE"
-        criar_card_metricas(
-            "Variação Total",
-            f"{variacao_total:+.1f}%",
-            "vs. Plano",
-            f"{formatar_ptbr(diferenca_total, 0)} m³",
-            "📊",
-            cor_diferenca
-        )
+        with col3:
+            cor_diferenca = "fh" if variacao_total >= 0 else "RELEASE"
+            criar_card_metricas(
+                "Variação Total",
+                f"{variacao_total:+.1f}%",
+                "vs. Plano",
+                f"{formatar_ptbr(diferenca_total, 0)} m³",
+                "📊",
+                cor_diferenca
+            )
     
-    with col4:
-        status_cor = "congenere" if variacao_total >= 0 else "industria"
-        status_text = "Acima" if variacao_total >= 0 else "Abaixo"
-        status_detalhe = "Meta atingida" if variacao_total >= 0 else "Abaixo da meta"
-        criar_card_metricas(
-            "Status Geral",
-            status_text,
-            "do planejado",
-            status_detalhe,
-            "✅" if variacao_total >= 0 else "⚠️",
-            status_cor
-        )
+        with col4:
+            status_cor = "congenere" if variacao_total >= 0 else "industria"
+            status_text = "Acima" if variacao_total >= 0 else "Abaixo"
+            status_detalhe = "Meta atingida" if variacao_total >= 0 else "Abaixo da meta"
+            criar_card_metricas(
+                "Status Geral",
+                status_text,
+                "do planejado",
+                status_detalhe,
+                "✅" if variacao_total >= 0 else "⚠️",
+                status_cor
+            )
+    
+    # Totais por período a partir das somas acumuladas (sem percorrer linhas)
+    st.markdown("#### ⏱️ Comparação de Períodos")
+    mostrar_totais_periodos(filtros)
     
     st.markdown("---")
     
@@ -1581,7 +1624,7 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
     st.markdown("#### 📈 Evolução Mensal - Vendas vs Plano")
     
     # Tentar criar gráfico com dados reais primeiro
-    fig_linha = criar_grafico_linhas_vendas_plano(df_filtrado)
+    fig_linha = criar_grafico_linhas_vendas_plano(df_filtrado, plano_filtrado)
     
     if fig_linha:
         st.plotly_chart(fig_linha, use_container_width=True)
@@ -1607,6 +1650,9 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
                                  key=lambda x: x.get('Variação (%)', 0))
                 st.metric("🏆 Melhor Desempenho", f"{melhor_linha['Linha de Negócio']}")
     
+    elif not com_plano:
+        st.info("ℹ️ Sem plano comparável com os filtros escolhidos: evolução Vendas vs Plano oculta")
+    
     else:
         # Se não houver dados reais, mostrar gráfico simulado
         st.info("📊 Dados reais insuficientes para análise temporal. Mostrando dados simulados para demonstração:")
@@ -1634,8 +1680,8 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
     fig = px.bar(
         df_grafico,
         x='Linha de Negócio',
-        y=['Vendas (m³)', 'Plano (m³)'],
-        title='Vendas vs Plano por Linha de Negócio',
+        y=['Vendas (m³)', 'Plano (m³)'] if com_plano else ['Vendas (m³)'],
+        title='Vendas vs Plano por Linha de Negócio' if com_plano else 'Vendas por Linha de Negócio',
         barmode='group',
         color_discrete_map={
             'Vendas (m³)': '#FF6B35',
@@ -1658,19 +1704,24 @@ def criar_aba_vendas_com_tabela_primeiro(df_filtrado: pd.DataFrame, filtros: Dic
     st.plotly_chart(fig, use_container_width=True)
     
     # ========== DOWNLOADS ==========
+    # Os downloads levam também o valor líquido de cada linha de negócio em MT e em USD
+    valores_linha = valor_liquido_por(df_filtrado, 'Sector/Sigla').reindex(linhas_negocio).fillna(0)
+    valores_linha.loc['TOTAL GERAL'] = valores_linha.sum()
+    df_download = df_tabela.join(valores_linha, on='Linha de Negócio')
+    
     with st.expander("📥 Opções de Download"):
         col1, col2 = st.columns(2)
         
         with col1:
             criar_botao_download_excel(
-                df_tabela, 
+                df_download, 
                 "vendas_linhas_negocio", 
                 "Linhas de Negócio"
             )
         
         with col2:
             criar_botao_download_csv(
-                df_tabela, 
+                df_download, 
                 "vendas_linhas_negocio", 
                 "Linhas de Negócio"
             )
@@ -1775,7 +1826,7 @@ def extrair_dados_garantias_bancarias(df_importacao: pd.DataFrame) -> pd.DataFra
     # Agrupar por banco e calcular totais
     if 'Banco_GB' in df_importacao.columns:
         # Se existe coluna específica para bancos
-        dados_garantias = df_importacao.groupby('Banco_GB').agg({
+        dados_garantias = df_importacao.groupby('Banco_GB', observed=True).agg({
             'ValorLimite_GB': 'sum',
             'Valor_GB': 'sum'
         }).reset_index()
@@ -1882,7 +1933,7 @@ def extrair_dados_portos_RELEASE_fh(df_importacao: pd.DataFrame) -> pd.DataFrame
     # Agrupar por porto
     if coluna_RELEASE and coluna_fh:
         # Se temos ambas as colunas
-        dados_portos = df_importacao.groupby(coluna_porto).agg({
+        dados_portos = df_importacao.groupby(coluna_porto, observed=True).agg({
             coluna_RELEASE: 'sum',
             coluna_fh: 'sum'
         }).reset_index()  # CORREÇÃO AQUI: reset_index() com underscore
@@ -1895,7 +1946,7 @@ def extrair_dados_portos_RELEASE_fh(df_importacao: pd.DataFrame) -> pd.DataFrame
         
     elif 'Qtd_Petro_TM' in df_importacao.columns and 'Qtd_FH_( TM)' in df_importacao.columns:
         # Usar colunas padrão que sabemos existir
-        dados_portos = df_importacao.groupby(coluna_porto).agg({
+        dados_portos = df_importacao.groupby(coluna_porto, observed=True).agg({
             'Qtd_Petro_TM': 'sum',
             'Qtd_FH_( TM)': 'sum'
         }).reset_index()  # CORREÇÃO AQUI: reset_index() com underscore
@@ -1938,6 +1989,8 @@ def extrair_dados_portos_RELEASE_fh(df_importacao: pd.DataFrame) -> pd.DataFrame
     
     # CORREÇÃO: REMOVER DUPLICATAS - Agrupar por porto e somar os valores
     if not dados_portos.empty:
+        # Porto chega como categórico da leitura; a partir daqui é texto livre
+        dados_portos['Porto'] = dados_portos['Porto'].astype(str)
         dados_portos = dados_portos.groupby('Porto', as_index=False).agg({
             'RELEASE': 'sum',
             'FINANCIAL HOLD': 'sum'
@@ -2050,61 +2103,36 @@ def extrair_ano_dos_dados(df_importacao: pd.DataFrame) -> int:
     
     return datetime.now().year
 
-def criar_analise_market_share_com_scroller(df_filtrado: pd.DataFrame):
-    """Cria análise de Market Share com scroller animado"""
+def criar_analise_market_share_com_scroller(df_filtrado: pd.DataFrame, quota_filtrada: pd.DataFrame):
+    """Cria análise de Market Share com scroller animado (a partir da tabela longa por empresa)"""
     
     st.markdown('<div class="section-title">📊 QUOTA DE MERCADO - VISUALIZAÇÃO DINÂMICA</div>', unsafe_allow_html=True)
     
-    df_processed = df_filtrado.copy()   
-    
-    # Limpar colunas numéricas
-    colunas_tm = ['Qtd_Petro_TM', 'Qtd_FH_( TM)', 'Quantidade_TM', 'Quantidade']
-    
-    for col in colunas_tm:
-        if col in df_processed.columns:
-            df_processed[col] = limpar_coluna_numerica(df_processed, col)
+    falhas = df_filtrado.attrs.get('falhas_conversao', {})
+    if falhas:
+        st.caption("⚠️ Células não numéricas ignoradas na importação: "
+                   + ", ".join(f"{coluna} ({n})" for coluna, n in falhas.items()))
 
-    for c in CLIENTES_CONGENERES:
-        if c in df_processed.columns:
-            df_processed[c] = limpar_coluna_numerica(df_processed, c)
-
-    # Calcular totais
-    total_petromoc_tm = 0
-    total_congeneres_tm = 0
-    
-    if 'Qtd_Petro_TM' in df_processed.columns and 'Qtd_FH_( TM)' in df_processed.columns:
-        total_petromoc_tm = (df_processed["Qtd_Petro_TM"] + df_processed["Qtd_FH_( TM)"]).sum()
-    elif 'Quantidade_TM' in df_processed.columns:
-        total_petromoc_tm = df_processed["Quantidade_TM"].sum()
-    
-    for c in CLIENTES_CONGENERES:
-        if c in df_processed.columns:
-            total_congeneres_tm += df_processed[c].sum()
+    # Totais por origem (RELEASE, Financial Hold, Congénere) em TM e em m³,
+    # convertidos linha a linha com a densidade do combustível ao carregar
+    totais_tm = agregado('quota_origem_tm', lambda: totais_por_origem(quota_filtrada, 'TM'), quota_filtrada)
+    totais_m3 = agregado('quota_origem_m3', lambda: totais_por_origem(quota_filtrada, 'm³'), quota_filtrada)
 
+    total_RELEASE_tm = float(totais_tm.get('RELEASE', 0.0))
+    total_fh_tm = float(totais_tm.get('Financial Hold', 0.0))
+    total_petromoc_tm = total_RELEASE_tm + total_fh_tm
+    total_congeneres_tm = float(totais_tm.get(ORIGEM_CONGENERE, 0.0))
     total_industria_tm = total_petromoc_tm + total_congeneres_tm
-    
-    total_RELEASE_tm = df_processed["Qtd_Petro_TM"].sum() if "Qtd_Petro_TM" in df_processed.columns else 0
-    total_fh_tm = df_processed["Qtd_FH_( TM)"].sum() if "Qtd_FH_( TM)" in df_processed.columns else 0
 
     if total_industria_tm == 0:
         st.warning("📊 Nenhum dado numérico válido para análise de Market Share")
         return
 
-    combustivel_principal = 'Gasóleo'
-    colunas_combustivel = ['Combustivel_Vendas', 'Combustivel_Importacao', 'Combustivel', 'Material']
-    for col in colunas_combustivel:
-        if col in df_processed.columns and not df_processed[col].empty:
-            combustiveis_validos = df_processed[col].dropna()
-            if not combustiveis_validos.empty:
-                combustivel_principal = combustiveis_validos.mode().iloc[0]
-                break
-
-    # Converter todos os valores para m³
-    total_petromoc_m3 = converter_tm_para_m3_seguro(total_petromoc_tm, combustivel_principal)
-    total_RELEASE_m3 = converter_tm_para_m3_seguro(total_RELEASE_tm, combustivel_principal)
-    total_fh_m3 = converter_tm_para_m3_seguro(total_fh_tm, combustivel_principal)
-    total_industria_m3 = converter_tm_para_m3_seguro(total_industria_tm, combustivel_principal)
-    total_congeneres_m3 = converter_tm_para_m3_seguro(total_congeneres_tm, combustivel_principal)
+    total_RELEASE_m3 = float(totais_m3.get('RELEASE', 0.0))
+    total_fh_m3 = float(totais_m3.get('Financial Hold', 0.0))
+    total_petromoc_m3 = total_RELEASE_m3 + total_fh_m3
+    total_congeneres_m3 = float(totais_m3.get(ORIGEM_CONGENERE, 0.0))
+    total_industria_m3 = total_petromoc_m3 + total_congeneres_m3
 
     def calcular_percentual(parte, total):
         return (parte / total * 100) if total > 0 else 0
@@ -2175,9 +2203,68 @@ def criar_analise_market_share_com_scroller(df_filtrado: pd.DataFrame):
         fig_petromoc.update_traces(textposition='inside', textinfo='percent+label')
         st.plotly_chart(fig_petromoc, use_container_width=True)
 
+    criar_quota_por_empresa(quota_filtrada)
+
+def criar_quota_por_empresa(quota_filtrada: pd.DataFrame):
+    """Quota de cada empresa no total, por mês, por porto ou por combustível, com as mudanças de posição"""
+    st.markdown("#### 🏁 Quota por Empresa")
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        vista = st.radio("Quota por", ['Empresa'] + list(DIMENSOES_ANALISE), horizontal=True,
+                         key='quota_mercado_vista')
+    with col2:
+        medida = st.radio("Unidade", ['TM', 'm³'], horizontal=True, key='quota_mercado_medida')
+
+    if vista == 'Empresa':
+        tabela = agregado(f'quota_empresas_{medida}', lambda: quotas(quota_filtrada, None, medida), quota_filtrada)
+        posicoes = agregado(f'quota_posicoes_{medida}', lambda: variacao_posicoes(quota_filtrada, medida=medida),
+                            quota_filtrada)
+        if tabela.empty:
+            st.info("Sem quantidades por empresa para os filtros aplicados")
+            return
+        # Posição no último mês de cada empresa e a variação face ao mês anterior em que apareceu
+        ultimo_mes = posicoes.groupby('Empresa', observed=True).tail(1).set_index('Empresa')
+        tabela = tabela.join(ultimo_mes[['Posicao', 'Variacao']], on='Empresa')
+
+        fig = px.bar(tabela.head(15), x='Empresa', y='Quota (%)', color='Empresa',
+                     color_discrete_map={EMPRESA_PETROMOC: '#FF6B35'}, title=f'Quota de Mercado por Empresa ({medida})')
+        fig.update_layout(showlegend=False, height=400)
+        st.plotly_chart(fig, use_container_width=True)
+
+        exibicao = pd.DataFrame({
+            'Empresa': tabela['Empresa'].astype(str),
+            f'Quantidade ({medida})': formatar_coluna_ptbr(tabela[medida], 0),
+            'Quota (%)': formatar_coluna_ptbr(tabela['Quota (%)'], 2),
+            'Posição (último mês)': tabela['Posicao'].apply(lambda v: '' if pd.isna(v) else f"{int(v)}º"),
+            'Variação': tabela['Variacao'].apply(
+                lambda v: '' if pd.isna(v) else '▲ ' + str(int(v)) if v > 0 else '▼ ' + str(int(-v)) if v < 0 else '='),
+        })
+        st.dataframe(exibicao, use_container_width=True, hide_index=True)
+        return
+
+    coluna = DIMENSOES_ANALISE[vista]
+    tabela = agregado(f'quota_{coluna}_{medida}', lambda: quotas(quota_filtrada, coluna, medida), quota_filtrada)
+    if tabela.empty:
+        st.info("Sem quantidades por empresa para os filtros aplicados")
+        return
+    # As empresas de maior quantidade no total; as restantes ficam juntas em 'Outras'
+    principais = tabela.groupby('Empresa', observed=True)[medida].sum().nlargest(8).index
+    tabela = tabela.assign(Empresa=tabela['Empresa'].astype(str).where(tabela['Empresa'].isin(principais), 'Outras'))
+    tabela = tabela.groupby([coluna, 'Empresa'], observed=True, sort=False)[['Quota (%)']].sum().reset_index()
+
+    if vista == 'Mês':
+        fig = px.line(tabela, x=coluna, y='Quota (%)', color='Empresa', markers=True,
+                      title=f'Quota de Mercado por Mês ({medida})')
+    else:
+        fig = px.bar(tabela, x=coluna, y='Quota (%)', color='Empresa', barmode='stack',
+                     title=f'Quota de Mercado por {vista} ({medida})')
+    fig.update_layout(height=450, xaxis_title=vista)
+    st.plotly_chart(fig, use_container_width=True)
+
 # ============================================= ABA IMPORTAÇÃO COMPLETA COM SCROLLER =============================================
 
-def criar_aba_importacao_com_dados_reais(df_filtrado: pd.DataFrame):
+def criar_aba_importacao_com_dados_reais(df_filtrado: pd.DataFrame, quota_filtrada: pd.DataFrame):
     """Cria a aba de Importação com dados reais, scroller animado e opções de download"""
     
     if df_filtrado.empty:
@@ -2307,7 +2394,7 @@ def criar_aba_importacao_com_dados_reais(df_filtrado: pd.DataFrame):
     st.markdown("---")
     
     # ========== SCROLLER QUOTA DE MERCADO ==========
-    criar_analise_market_share_com_scroller(df_filtrado)
+    criar_analise_market_share_com_scroller(df_filtrado, quota_filtrada)
     
     st.markdown("---")
     
@@ -2342,15 +2429,11 @@ def criar_aba_importacao_com_dados_reais(df_filtrado: pd.DataFrame):
         colunas_monetarias = ['ValorLimite_GB', 'Valor_GB', 'Disponibilidade_GB']
         for coluna in colunas_monetarias:
             if coluna in df_garantias_display.columns:
-                df_garantias_display[f'{coluna}_Formatado'] = df_garantias_display[coluna].apply(
-                    lambda x: f"MT {formatar_ptbr(x, 0)}" if pd.notna(x) else "MT 0"
-                )
+                df_garantias_display[f'{coluna}_Formatado'] = formatar_coluna_ptbr(df_garantias_display[coluna], 0, prefixo='MT ')
         
         # Formatar percentagem COM símbolo %
         if 'Disponibilidade_%' in df_garantias_display.columns:
-            df_garantias_display['Disponibilidade_%_Formatado'] = df_garantias_display['Disponibilidade_%'].apply(
-                lambda x: f"{x:.1f}%" if pd.notna(x) else "0.0%"
-            )
+            df_garantias_display['Disponibilidade_%_Formatado'] = formatar_coluna_ptbr(df_garantias_display['Disponibilidade_%'], 1, sufixo='%')
         
         # Selecionar colunas para exibição
         colunas_exibicao = ['Banco_GB']
@@ -2415,15 +2498,11 @@ def criar_aba_importacao_com_dados_reais(df_filtrado: pd.DataFrame):
         colunas_volume = ['RELEASE', 'FINANCIAL HOLD']
         for coluna in colunas_volume:
             if coluna in df_portos_display.columns:
-                df_portos_display[f'{coluna}_Formatado'] = df_portos_display[coluna].apply(
-                    lambda x: f"{formatar_ptbr(x, 0)} TM" if pd.notna(x) else "0 TM"
-                )
+                df_portos_display[f'{coluna}_Formatado'] = formatar_coluna_ptbr(df_portos_display[coluna], 0, sufixo=' TM')
         
         # Formatar percentagem COM símbolo %
         if '% FINANCIAL HOLD' in df_portos_display.columns:
-            df_portos_display['% FINANCIAL HOLD_Formatado'] = df_portos_display['% FINANCIAL HOLD'].apply(
-                lambda x: f"{x:.1f}%" if pd.notna(x) else "0.0%"
-            )
+            df_portos_display['% FINANCIAL HOLD_Formatado'] = formatar_coluna_ptbr(df_portos_display['% FINANCIAL HOLD'], 1, sufixo='%')
         
         # Selecionar colunas para exibição
         colunas_exibicao = ['Porto']
@@ -2526,15 +2605,15 @@ def criar_aba_importacao_com_dados_reais(df_filtrado: pd.DataFrame):
 
 ############################################################ ABA PROMOTORES ##################################################################################################        
 
-@st.cache_data(ttl=3600)
-def carregar_dados_MIS():
-    """Carrega e processa dados do MIS"""
+@st.cache_data(max_entries=2)
+def carregar_dados_MIS(assinaturas: Tuple = ()):
+    """Carrega e processa dados do MIS ('assinaturas' dos ficheiros servem de chave da cache)"""
     try:
         # 1. Carregar dados do MIS
-        MIS = pd.read_excel('MIS_.xlsx')
+        MIS = registro_workbooks.folha('MIS_.xlsx')
         
-        # 2. Carregar lookup de clientes
-        v0 = pd.read_excel('v_loock_up.xlsx', sheet_name=0)
+        # 2. Lookup de clientes (mesma folha já lida para carregar_lookups)
+        v0 = registro_workbooks.folha(ARQUIVO_LOOKUP, 0)
         
         # 3. Fazer merge com lookup
         MIS = pd.merge(MIS, v0, left_on=['Emissor'], right_on=['Emissor'], how='left')
@@ -2658,8 +2737,8 @@ def criar_tabela_divida_por_linha_negocio(mis_df: pd.DataFrame):
         st.warning("⚠️ Nenhuma coluna numérica de dívida encontrada no MIS")
         return pd.DataFrame()
     
-    # Agrupar por linha de negócio
-    tabela_linhas = mis_df.groupby('LINHA NEG.').agg(agg_dict).reset_index()
+    # Agrupar por linha de negócio (SQL no DuckDB quando ativo)
+    tabela_linhas = motor_consultas.somar_por(mis_df, 'LINHA NEG.', colunas_calculo)
     
     # Adicionar linha de Total
     linha_total = {'LINHA NEG.': 'Total'}
@@ -2681,126 +2760,86 @@ def criar_tabela_divida_por_linha_negocio(mis_df: pd.DataFrame):
 
 
 
+COLUNAS_DIVIDA = {'DIVIDA_TOTAL': 'Dívida Total', 'DENTRO_PRAZO': 'Dentro Prazo', 'PREVISAO_30_DIAS': 'Previsão 30 Dias'}
+
 def criar_tabela_top10_promotores(mis_df: pd.DataFrame):
-    """Cria tabela Top 10 Promotores com dados de dívida no formato correto"""
+    """
+    Clientes dos 10 promotores com maior dívida total, valores numéricos: soma
+    por promotor → 10 maiores → junção dos clientes de cada um (por ordem do
+    promotor e da dívida), com uma linha TOTAL no fim. Formatação só ao exibir.
+    """
     
     if mis_df.empty:
         return pd.DataFrame()
     
     # 1. IDENTIFICAR COLUNAS CORRETAS
-    colunas_necessarias = []
-    
-    # Buscar coluna de promotor
     colunas_promotor = [col for col in mis_df.columns if 'GESTOR' in col or 'PROMOTOR' in col]
-    if colunas_promotor:
-        coluna_promotor = colunas_promotor[0]
-        colunas_necessarias.append(coluna_promotor)
-    else:
+    if not colunas_promotor:
         st.warning("⚠️ Coluna de promotor não encontrada")
         return pd.DataFrame()
-    
-    # Buscar coluna de emissor
-    colunas_emissor = [col for col in mis_df.columns if 'EMISSOR' in col]
-    if colunas_emissor:
-        coluna_emissor = colunas_emissor[0]
-        colunas_necessarias.append(coluna_emissor)
-    else:
-        # Tentar alternativa
-        if 'Emissor' in mis_df.columns:
-            coluna_emissor = 'Emissor'
-            colunas_necessarias.append(coluna_emissor)
-        else:
-            # Criar coluna vazia se não existir
-            mis_df['EMISSOR'] = ''
-            coluna_emissor = 'EMISSOR'
-            colunas_necessarias.append(coluna_emissor)
-    
-    # Buscar coluna de nome do cliente
-    colunas_cliente = ['NOME_DO_CLIENTE', 'NOME_DO_CITE', 'NOMECLIENTE', 'CLIENTE']
-    for col_cliente in colunas_cliente:
-        if col_cliente in mis_df.columns:
-            colunas_necessarias.append(col_cliente)
-            break
-    else:
-        # Se não encontrar, adicionar coluna vazia
-        mis_df['NOME_CLIENTE'] = ''
-        colunas_necessarias.append('NOME_CLIENTE')
-    
-    # Adicionar colunas de dívida
-    for col in ['DIVIDA_TOTAL', 'DENTRO_PRAZO', 'PREVISAO_30_DIAS']:
-        if col in mis_df.columns:
-            colunas_necessarias.append(col)
-    
-    # 2. CRIAR TABELA AGRUPADA POR PROMOTOR
-    agg_dict = {}
-    for col in ['DIVIDA_TOTAL', 'DENTRO_PRAZO', 'PREVISAO_30_DIAS']:
-        if col in colunas_necessarias:
-            agg_dict[col] = 'sum'
-    
-    # Agrupar por promotor
-    if agg_dict:
-        tabela_agrupada = mis_df.groupby(coluna_promotor).agg(agg_dict).reset_index()
-        
-        # Ordenar por dívida total (maior primeiro)
-        if 'DIVIDA_TOTAL' in tabela_agrupada.columns:
-            tabela_agrupada = tabela_agrupada.sort_values('DIVIDA_TOTAL', ascending=False)
+    coluna_promotor = colunas_promotor[0]
+    coluna_emissor = next((col for col in mis_df.columns if 'EMISSOR' in col),
+                          'Emissor' if 'Emissor' in mis_df.columns else None)
+    coluna_cliente = next((col for col in ['NOME_DO_CLIENTE', 'NOME_DO_CITE', 'NOMECLIENTE', 'CLIENTE']
+                           if col in mis_df.columns), None)
+    colunas_divida = [col for col in COLUNAS_DIVIDA if col in mis_df.columns]
+    
+    # 2. TOP 10 PROMOTORES POR DÍVIDA TOTAL (SQL no DuckDB quando ativo)
+    if colunas_divida:
+        top10_promotores = motor_consultas.somar_por(
+            mis_df, coluna_promotor, colunas_divida,
+            ordenar_por='DIVIDA_TOTAL' if 'DIVIDA_TOTAL' in colunas_divida else None, limite=10
+        )
     else:
-        tabela_agrupada = mis_df[[coluna_promotor]].drop_duplicates()
-    
-    # 3. PEGAR TOP 10 PROMOTORES
-    top10_promotores = tabela_agrupada.head(10)
-    
-    # 4. CRIAR TABELA FINAL COM TODOS OS DADOS DOS CLIENTES DO TOP 10
-    tabela_final = []
-    
-    # Primeiro adicionar os dados detalhados de cada promotor
-    for idx, row in top10_promotores.iterrows():
-        promotor = row[coluna_promotor]
-        
-        # Filtrar clientes deste promotor
-        clientes_promotor = mis_df[mis_df[coluna_promotor] == promotor]
-        
-        # Ordenar clientes por dívida total
-        if 'DIVIDA_TOTAL' in clientes_promotor.columns:
-            clientes_promotor = clientes_promotor.sort_values('DIVIDA_TOTAL', ascending=False)
-        
-        # Adicionar cada cliente como uma linha
-        for _, cliente_row in clientes_promotor.iterrows():
-            linha = {
-                'Gestor/Promotor': str(promotor) if pd.notna(promotor) else '',
-                'Emissor': str(cliente_row[coluna_emissor]) if pd.notna(cliente_row.get(coluna_emissor, '')) else '',
-                'Nome_do_Cliente': str(cliente_row[colunas_necessarias[2]]) if len(colunas_necessarias) > 2 else '',
-                'Dívida Total': cliente_row.get('DIVIDA_TOTAL', 0),
-                'Dentro Prazo': cliente_row.get('DENTRO_PRAZO', 0),
-                'Previsão 30 Dias': cliente_row.get('PREVISAO_30_DIAS', 0)
-            }
-            tabela_final.append(linha)
-    
-    # 5. ADICIONAR LINHA DE TOTAL
-    if tabela_final:
-        # Calcular totais
-        totais = {
-            'Gestor/Promotor': 'TOTAL',
-            'Emissor': '',
-            'Nome_do_Cliente': '',
-            'Dívida Total': sum(row['Dívida Total'] for row in tabela_final),
-            'Dentro Prazo': sum(row['Dentro Prazo'] for row in tabela_final),
-            'Previsão 30 Dias': sum(row['Previsão 30 Dias'] for row in tabela_final)
-        }
-        tabela_final.append(totais)
-    
-    # Converter para DataFrame
-    df_final = pd.DataFrame(tabela_final)
+        top10_promotores = mis_df[[coluna_promotor]].dropna().drop_duplicates().head(10)
+    
+    # 3. CLIENTES DO TOP 10: posição do promotor no top 10 e, dentro dele, maior dívida primeiro
+    posicao = pd.Series(range(len(top10_promotores)), index=top10_promotores[coluna_promotor].to_numpy())
+    clientes = mis_df[mis_df[coluna_promotor].isin(posicao.index)]
+    clientes = clientes.assign(_posicao=clientes[coluna_promotor].map(posicao))
+    chaves_ordem = ['_posicao'] + (['DIVIDA_TOTAL'] if 'DIVIDA_TOTAL' in clientes.columns else [])
+    clientes = clientes.sort_values(chaves_ordem, ascending=[True, False][:len(chaves_ordem)], kind='stable')
+    
+    def texto(col):
+        if col is None:
+            return pd.Series('', index=clientes.index)
+        return clientes[col].astype(str).where(clientes[col].notna(), '')
+    
+    df_final = pd.DataFrame({
+        'Gestor/Promotor': texto(coluna_promotor),
+        'Emissor': texto(coluna_emissor),
+        'Nome_do_Cliente': texto(coluna_cliente),
+        **{rotulo: (clientes[col].fillna(0).astype('float64') if col in clientes.columns
+                    else pd.Series(0.0, index=clientes.index))
+           for col, rotulo in COLUNAS_DIVIDA.items()},
+    }).reset_index(drop=True)
+    
+    # 4. ADICIONAR LINHA DE TOTAL
+    if not df_final.empty:
+        totais = {'Gestor/Promotor': 'TOTAL', 'Emissor': '', 'Nome_do_Cliente': '',
+                  **df_final[list(COLUNAS_DIVIDA.values())].sum().to_dict()}
+        df_final = pd.concat([df_final, pd.DataFrame([totais])], ignore_index=True)
     
     return df_final
 
+def resumir_top10_promotores(tabela_top10: pd.DataFrame) -> pd.DataFrame:
+    """Totais e número de clientes por promotor (sem a linha TOTAL), pela dívida total"""
+    clientes = tabela_top10[tabela_top10['Gestor/Promotor'] != 'TOTAL']
+    resumo = clientes.groupby('Gestor/Promotor', sort=False).agg(**{
+        'Total Dívida': ('Dívida Total', 'sum'),
+        'Total Dentro Prazo': ('Dentro Prazo', 'sum'),
+        'Total Previsão 30 Dias': ('Previsão 30 Dias', 'sum'),
+        'Nº Clientes': ('Dívida Total', 'size'),
+    }).reset_index().rename(columns={'Gestor/Promotor': 'Promotor'})
+    return resumo.sort_values('Total Dívida', ascending=False, kind='stable', ignore_index=True)
+
 def criar_aba_divida_promotores():
     """Cria a parte de análise de dívida dos promotores"""
     
     st.markdown("#### 💰 Análise de Dívida - Linhas de Negócio")
     
     # Carregar dados do MIS
-    MIS_df = carregar_dados_MIS()
+    MIS_df = carregar_dados_MIS((assinatura_ficheiro('MIS_.xlsx'), assinatura_ficheiro(ARQUIVO_LOOKUP)))
     
     if MIS_df.empty:
         st.warning("⚠️ Nenhum dado do MIS disponível para análise de dívida")
@@ -2818,15 +2857,11 @@ def criar_aba_divida_promotores():
         colunas_disponiveis = [col for col in colunas_numericas if col in df_linhas_display.columns]
         
         for coluna in colunas_disponiveis:
-            df_linhas_display[coluna] = df_linhas_display[coluna].apply(
-                lambda x: f"MT {formatar_ptbr(x, 0)}" if pd.notna(x) else "MT 0"
-            )
+            df_linhas_display[coluna] = formatar_coluna_ptbr(df_linhas_display[coluna], 0, prefixo='MT ')
         
         # Formatar percentual
         if '% sobre Total' in df_linhas_display.columns:
-            df_linhas_display['% sobre Total'] = df_linhas_display['% sobre Total'].apply(
-                lambda x: f"{x:.1f}%" if pd.notna(x) else "0.0%"
-            )
+            df_linhas_display['% sobre Total'] = formatar_coluna_ptbr(df_linhas_display['% sobre Total'], 1, sufixo='%')
         
         # Renomear colunas para exibição
         rename_dict = {
@@ -2933,9 +2968,7 @@ def criar_aba_divida_promotores():
         colunas_numericas_existentes = [col for col in colunas_numericas if col in df_top10_display.columns]
         
         for coluna in colunas_numericas_existentes:
-            df_top10_display[coluna] = df_top10_display[coluna].apply(
-                lambda x: f"MT {formatar_ptbr(x, 0)}" if pd.notna(x) and x != 0 else "MT 0"
-            )
+            df_top10_display[coluna] = formatar_coluna_ptbr(df_top10_display[coluna], 0, prefixo='MT ')
         
         # Destacar linha de TOTAL com cores vivas
         def highlight_top10_total(row):
@@ -2987,50 +3020,14 @@ def criar_aba_divida_promotores():
         # 2. TABELA RESUMIDA DOS PROMOTORES (SOMENTE PROMOTORES)
         st.markdown("##### 📊 Resumo por Promotor (Top 10)")
         
-        # Criar tabela resumida apenas com os totais por promotor
-        tabela_resumo_promotores = []
-        
-        # Obter lista única de promotores (excluindo TOTAL)
-        promotores_unicos = [p for p in df_top10_display['Gestor/Promotor'].unique() 
-                           if p != 'TOTAL' and pd.notna(p)]
+        # Totais por promotor a partir da tabela numérica (sem voltar a ler texto formatado)
+        resumo_promotores = resumir_top10_promotores(tabela_top10)
         
-        for promotor in promotores_unicos[:10]:  # Top 10
-            dados_promotor = df_top10_display[df_top10_display['Gestor/Promotor'] == promotor]
-            
-            # Calcular totais (precisamos converter de volta para numérico)
-            def extrair_valor(valor_str):
-                try:
-                    if isinstance(valor_str, (int, float)):
-                        return float(valor_str)
-                    valor_limpo = str(valor_str).replace('MT ', '').replace('.', '').replace(',', '.')
-                    return float(valor_limpo) if valor_limpo.replace('.', '', 1).isdigit() else 0
-                except:
-                    return 0
-            
-            # Somar valores numéricos
-            total_divida = sum(extrair_valor(row['Dívida Total']) for _, row in dados_promotor.iterrows())
-            total_dentro = sum(extrair_valor(row['Dentro Prazo']) for _, row in dados_promotor.iterrows())
-            total_30_dias = sum(extrair_valor(row['Previsão 30 Dias']) for _, row in dados_promotor.iterrows())
-            
-            tabela_resumo_promotores.append({
-                'Promotor': promotor,
-                'Total Dívida': total_divida,
-                'Total Dentro Prazo': total_dentro,
-                'Total Previsão 30 Dias': total_30_dias,
-                'Nº Clientes': len(dados_promotor)
-            })
-        
-        # Criar DataFrame do resumo
-        if tabela_resumo_promotores:
-            df_resumo = pd.DataFrame(tabela_resumo_promotores)
-            df_resumo = df_resumo.sort_values('Total Dívida', ascending=False)
-            
+        if not resumo_promotores.empty:
             # Formatar valores
+            df_resumo = resumo_promotores.copy()
             for col in ['Total Dívida', 'Total Dentro Prazo', 'Total Previsão 30 Dias']:
-                if col in df_resumo.columns:
-                    df_resumo[col] = df_resumo[col].apply(
-                        lambda x: f"MT {formatar_ptbr(x, 0)}" if pd.notna(x) else "MT 0"
-                    )
+                df_resumo[col] = formatar_coluna_ptbr(df_resumo[col], 0, prefixo='MT ')
             
             # Exibir resumo
             st.dataframe(
@@ -3049,65 +3046,46 @@ def criar_aba_divida_promotores():
         # 3. GRÁFICO DE BARRAS PARA TOP 10 PROMOTORES
         st.markdown("##### 📈 Visualização do Top 10 - Dívida Total por Promotor")
         
-        if tabela_resumo_promotores:
-            # Preparar dados para gráfico
-            df_grafico = pd.DataFrame(tabela_resumo_promotores)
+        if not resumo_promotores.empty:
+            # Cores vibrantes
+            cores_vibrantes = [
+                '#FF0000', '#FF4500', '#FF8C00', '#FFA500', '#FFD700',
+                '#FF6347', '#FF7F50', '#FFA07A', '#FFB6C1', '#FF69B4'
+            ]
             
-            # Extrair valores numéricos para o gráfico
-            def extrair_valor_grafico(valor_str):
-                try:
-                    if isinstance(valor_str, (int, float)):
-                        return float(valor_str)
-                    return float(str(valor_str).replace('MT ', '').replace('.', '').replace(',', '.'))
-                except:
-                    return 0
+            fig_barras = px.bar(
+                resumo_promotores.head(10),
+                x='Promotor',
+                y='Total Dívida',
+                title='Top 10 Promotores - Dívida Total',
+                color='Promotor',
+                color_discrete_sequence=cores_vibrantes[:min(10, len(resumo_promotores))],
+                labels={'Total Dívida': 'Dívida Total (MT)', 'Promotor': 'Promotor'},
+                text='Total Dívida'
+            )
             
-            # Converter valores formatados de volta para numéricos
-            if 'Total Dívida' in df_grafico.columns:
-                df_grafico['Dívida_Numérica'] = df_grafico['Total Dívida'].apply(extrair_valor_grafico)
-                
-                # Ordenar por dívida
-                df_grafico = df_grafico.sort_values('Dívida_Numérica', ascending=False)
-                
-                # Cores vibrantes
-                cores_vibrantes = [
-                    '#FF0000', '#FF4500', '#FF8C00', '#FFA500', '#FFD700',
-                    '#FF6347', '#FF7F50', '#FFA07A', '#FFB6C1', '#FF69B4'
-                ]
-                
-                fig_barras = px.bar(
-                    df_grafico.head(10),
-                    x='Promotor',
-                    y='Dívida_Numérica',
-                    title='Top 10 Promotores - Dívida Total',
-                    color='Promotor',
-                    color_discrete_sequence=cores_vibrantes[:min(10, len(df_grafico))],
-                    labels={'Dívida_Numérica': 'Dívida Total (MT)', 'Promotor': 'Promotor'},
-                    text='Dívida_Numérica'
-                )
-                
-                fig_barras.update_traces(
-                    texttemplate='MT %{text:,.0f}',
-                    textposition='outside',
-                    marker_line_color='rgb(139,0,0)',
-                    marker_line_width=2,
-                    opacity=0.85
-                )
-                
-                fig_barras.update_layout(
-                    xaxis_tickangle=-45,
-                    plot_bgcolor='rgba(255,250,240,0.8)',
-                    paper_bgcolor='rgba(255,255,255,0.95)',
-                    font=dict(size=12, color='#2C3E50'),
-                    title_font=dict(size=18, color='#8B0000'),
-                    showlegend=False,
-                    yaxis=dict(
-                        title='Dívida Total (MT)',
-                        gridcolor='rgba(128,128,128,0.2)'
-                    )
+            fig_barras.update_traces(
+                texttemplate='MT %{text:,.0f}',
+                textposition='outside',
+                marker_line_color='rgb(139,0,0)',
+                marker_line_width=2,
+                opacity=0.85
+            )
+            
+            fig_barras.update_layout(
+                xaxis_tickangle=-45,
+                plot_bgcolor='rgba(255,250,240,0.8)',
+                paper_bgcolor='rgba(255,255,255,0.95)',
+                font=dict(size=12, color='#2C3E50'),
+                title_font=dict(size=18, color='#8B0000'),
+                showlegend=False,
+                yaxis=dict(
+                    title='Dívida Total (MT)',
+                    gridcolor='rgba(128,128,128,0.2)'
                 )
-                
-                st.plotly_chart(fig_barras, use_container_width=True)
+            )
+            
+            st.plotly_chart(fig_barras, use_container_width=True)
     
     
     st.markdown("---") 
@@ -3246,82 +3224,44 @@ def criar_aba_divida_promotores():
                             }
                             clientes_promotor = clientes_promotor.rename(columns=rename_dict_clientes)
                             
-                            # Ordenar por dívida total
+                            # Ordenar por dívida total (valores numéricos; texto formatado só na cópia exibida)
                             if 'Dívida Total' in clientes_promotor.columns:
                                 clientes_promotor = clientes_promotor.sort_values('Dívida Total', ascending=False)
+                            clientes_promotor = clientes_promotor.reset_index(drop=True)
                             
                             # Formatar valores monetários
+                            clientes_display = clientes_promotor.copy()
                             for col in ['Dívida Total', 'Dentro Prazo', 'Previsão 30 Dias']:
-                                if col in clientes_promotor.columns:
-                                    clientes_promotor[col] = clientes_promotor[col].apply(
-                                        lambda x: f"MT {formatar_ptbr(x, 0)}" if pd.notna(x) else "MT 0"
-                                    )
+                                if col in clientes_display.columns:
+                                    clientes_display[col] = formatar_coluna_ptbr(clientes_display[col], 0, prefixo='MT ')
                             
-                            # Estilizar a tabela com cores vivas
-                            def highlight_clientes(row):
-                                # Destacar os 3 maiores valores
-                                try:
-                                    valor_str = row['Dívida Total'].replace('MT ', '').replace('.', '').replace(',', '.')
-                                    valor = float(valor_str) if valor_str.replace('.', '', 1).isdigit() else 0
-                                    
-                                    if valor > 0 and row.name < 3:  # Primeiros 3 lugares
-                                        return ['background-color: #FFD700; color: #333333; font-weight: bold'] * len(row)
-                                    elif valor == 0:
-                                        return ['background-color: #90EE90; color: #333333'] * len(row)
-                                except:
-                                    pass
-                                return [''] * len(row)
+                            # Estilizar a tabela com cores vivas: 3 maiores dívidas a dourado, sem dívida a verde,
+                            # restantes em cores alternadas (estilos de todas as linhas de uma só vez)
+                            def cores_clientes(df):
+                                cores = np.where(np.arange(len(df)) % 2 == 0,
+                                                 'background-color: #E8F4FD; color: #333333',
+                                                 'background-color: #FFFFFF; color: #333333').astype(object)
+                                if 'Dívida Total' in clientes_promotor.columns:
+                                    divida = clientes_promotor['Dívida Total'].to_numpy(dtype='float64', na_value=0.0)
+                                    cores[divida == 0] = 'background-color: #90EE90; color: #333333'
+                                    cores[:3][divida[:3] > 0] = 'background-color: #FFD700; color: #333333; font-weight: bold'
+                                return pd.DataFrame(np.repeat(cores[:, None], df.shape[1], axis=1), index=df.index, columns=df.columns)
                             
-                            styled_clientes = clientes_promotor.style.apply(highlight_clientes, axis=1)
-                            
-                            # Aplicar cores alternadas
-                            def color_clientes_rows(df):
-                                """Aplica cores alternadas de forma segura"""
-                                if df.empty:
-                                  return pd.DataFrame('', index=df.index, columns=df.columns)
-    
-                                styles = pd.DataFrame('', index=df.index, columns=df.columns)
-    
-                                try:
-                                  for i in range(len(df)):
-                                      color = '#E8F4FD' if i % 2 == 0 else '#FFFFFF'
-            
-                                      # Aplicar a todas as colunas
-                                      for col in df.columns:
-                                          styles.iloc[i, df.columns.get_loc(col)] = f'background-color: {color}; color: #333333'
-                                except Exception as e:
-                                  # Em caso de erro, retornar sem estilo
-                                  print(f"Erro na aplicação de cores: {e}")
-    
-                                return styles
+                            styled_clientes = clientes_display.style.apply(cores_clientes, axis=None)
                             
-                            for i in range(len(clientes_promotor)):
-                                styled_clientes = styled_clientes.apply(
-                                    lambda x: [color_clientes_rows(i) for _ in x], 
-                                    subset=pd.IndexSlice[i:i], axis=0
-                                )
-                
                             try:
                                 st.dataframe(styled_clientes, use_container_width=True, height=300)
                             except Exception as e:
                                # Exibir dados sem formatação em caso de erro
                                 st.warning(f"⚠️ Erro na formatação: {str(e)[:100]}...")
-                                st.dataframe(clientes_promotor, use_container_width=True, height=300)
+                                st.dataframe(clientes_display, use_container_width=True, height=300)
                             
                             # Gráfico de pizza para distribuição da dívida por cliente
                             if 'Dívida Total' in clientes_promotor.columns:
                                 st.markdown(f"##### 📈 Distribuição da Dívida - {promotor_selecionado}")
                                 
-                                # Extrair valores numéricos para o gráfico
-                                valores = []
-                                for val in clientes_promotor['Dívida Total'].head(10):  # Top 10 clientes
-                                    try:
-                                        valor_str = val.replace('MT ', '').replace('.', '').replace(',', '.')
-                                        valor = float(valor_str) if valor_str.replace('.', '', 1).isdigit() else 0
-                                        valores.append(valor)
-                                    except:
-                                        valores.append(0)
-                                
+                                # Top 10 clientes, já numéricos
+                                valores = clientes_promotor['Dívida Total'].head(10).fillna(0).clip(lower=0).tolist()
                                 nomes = clientes_promotor['Nome do Cliente'].head(10).tolist()
                                 
                                 if valores and any(v > 0 for v in valores):
@@ -3390,8 +3330,8 @@ def criar_aba_divida_promotores():
 
                 
 
-def criar_aba_promotores(df_filtrado: pd.DataFrame):
-    """Cria a aba de Análise de Promotores com dados de DateSet_MT_Pln"""
+def criar_aba_promotores(df_filtrado: pd.DataFrame, plano_filtrado: pd.DataFrame):
+    """Cria a aba de Análise de Promotores com os factos de vendas e de plano"""
     
     st.markdown('<div class="section-title">👥 Análise de Promotores - Desempenho Comercial</div>', unsafe_allow_html=True)
     
@@ -3399,14 +3339,14 @@ def criar_aba_promotores(df_filtrado: pd.DataFrame):
     tab_vendas, tab_divida = st.tabs(["📈 Análise de Vendas", "💰 Análise de Dívida"])
     
     with tab_vendas:
-        criar_aba_vendas_promotores(df_filtrado)
+        criar_aba_vendas_promotores(df_filtrado, plano_filtrado)
     
     with tab_divida:
         criar_aba_divida_promotores()
 
 
 
-def criar_aba_vendas_promotores(df_filtrado: pd.DataFrame):
+def criar_aba_vendas_promotores(df_filtrado: pd.DataFrame, plano_filtrado: pd.DataFrame):
     """Cria a parte de análise de vendas dos promotores"""
     
     if df_filtrado.empty:
@@ -3454,29 +3394,22 @@ def criar_aba_vendas_promotores(df_filtrado: pd.DataFrame):
     if coluna_quantidade:
         total_vendas = df_filtrado[coluna_quantidade].sum()
     
-    # Verificar se temos coluna de valor
-    coluna_valor = None
-    colunas_valor = ['V_Liquido', 'Valor', 'Vendas_MT']
-    for col in colunas_valor:
-        if col in df_filtrado.columns:
-            coluna_valor = col
-            break
+    # Valor líquido por promotor em MT e USD (V_Liquido está na moeda original de cada linha)
+    valores_promotores = valor_liquido_por(df_filtrado, coluna_promotor)
+    coluna_valor = 'Valor (MT)' if 'V_Liquido' in df_filtrado.columns else None
     
     total_valor = 0
     if coluna_valor:
-        total_valor = df_filtrado[coluna_valor].sum()
+        total_valor = valores_promotores[coluna_valor].sum()
     
-    # Identificar coluna de meta/plano
-    colunas_plano = ['Plano_m³', 'Plano', 'Quantidade_Plano', 'Meta']
-    coluna_plano = None
-    for col in colunas_plano:
-        if col in df_filtrado.columns:
-            coluna_plano = col
-            break
+    # Identificar coluna de meta/plano (tabela de factos do plano, por promotor)
+    coluna_plano = detetar_coluna_plano(plano_filtrado)
+    if coluna_promotor not in plano_filtrado.columns:
+        coluna_plano = None
     
     total_plano = 0
     if coluna_plano:
-        total_plano = df_filtrado[coluna_plano].sum()
+        total_plano = plano_filtrado[coluna_plano].sum()
     
     taxa_atingimento = (total_vendas / total_plano * 100) if total_plano > 0 else 0
     
@@ -3487,7 +3420,7 @@ def criar_aba_vendas_promotores(df_filtrado: pd.DataFrame):
             "Total Promotores",
             str(total_promotores),
             "Ativos no período",
-            f"{len(df_filtrado)} transações",
+            f"{contar_registos(df_filtrado)} transações",
             "👥",
             "petromoc"
         )
@@ -3535,18 +3468,29 @@ def criar_aba_vendas_promotores(df_filtrado: pd.DataFrame):
         if coluna_quantidade:
             agg_dict[coluna_quantidade] = 'sum'
         
-        if coluna_valor:
-            agg_dict[coluna_valor] = 'sum'
-        
-        if coluna_plano:
-            agg_dict[coluna_plano] = 'sum'
-        
-        if not agg_dict:
+        if not agg_dict and not coluna_valor:
             st.warning("⚠️ Nenhuma coluna numérica disponível para análise")
             return
         
         # Agrupar por promotor
-        desempenho_promotores = df_filtrado.groupby(coluna_promotor).agg(agg_dict).reset_index()
+        def calcular_desempenho():
+            # Somas por promotor no motor de consultas (DuckDB ou pandas)
+            desempenho = (motor_consultas.somar_por(df_filtrado, coluna_promotor, list(agg_dict))
+                          .set_index(coluna_promotor) if agg_dict
+                          else pd.DataFrame(index=valores_promotores.index))
+            # Valor em MT (mostrado) e em USD (só nos downloads)
+            if coluna_valor:
+                desempenho = desempenho.join(valores_promotores, how='outer').fillna(0)
+            # Plano somado por promotor e alinhado aos totais de vendas (promotores só com plano incluídos)
+            if coluna_plano:
+                plano_promotores = somar_plano_por(plano_filtrado, [coluna_promotor]).rename(coluna_plano)
+                desempenho = desempenho.join(plano_promotores, how='outer').fillna(0)
+            return desempenho
+        
+        desempenho_promotores = agregado(
+            f"desempenho_promotores|{coluna_promotor}|{'|'.join(agg_dict)}|{coluna_valor}|{coluna_plano}",
+            calcular_desempenho, df_filtrado, plano_filtrado
+        ).reset_index()
         
         # Calcular métricas adicionais
         if coluna_quantidade and coluna_plano:
@@ -3601,27 +3545,19 @@ def criar_aba_vendas_promotores(df_filtrado: pd.DataFrame):
         # Formatar colunas numéricas
         for col in [coluna_quantidade, 'Variação (m³)']:
             if col in df_display.columns:
-                df_display[col] = df_display[col].apply(
-                    lambda x: formatar_ptbr(x, 0) if pd.notna(x) else "0"
-                )
+                df_display[col] = formatar_coluna_ptbr(df_display[col], 0)
         
         if coluna_plano and coluna_plano in df_display.columns:
-            df_display[coluna_plano] = df_display[coluna_plano].apply(
-                lambda x: formatar_ptbr(x, 0) if pd.notna(x) else "0"
-            )
+            df_display[coluna_plano] = formatar_coluna_ptbr(df_display[coluna_plano], 0)
         
         # Formatar colunas percentuais
         for col in ['Atingimento (%)', 'Participação (%)']:
             if col in df_display.columns:
-                df_display[col] = df_display[col].apply(
-                    lambda x: f"{x:.1f}%" if pd.notna(x) else "0.0%"
-                )
+                df_display[col] = formatar_coluna_ptbr(df_display[col], 1, sufixo='%')
         
         # Formatar coluna monetária
         if coluna_valor and coluna_valor in df_display.columns:
-            df_display[coluna_valor] = df_display[coluna_valor].apply(
-                lambda x: f"MT {formatar_ptbr(x, 0)}" if pd.notna(x) else "MT 0"
-            )
+            df_display[coluna_valor] = formatar_coluna_ptbr(df_display[coluna_valor], 0, prefixo='MT ')
         
         # Exibir tabela
         st.dataframe(
@@ -3682,132 +3618,10 @@ def criar_aba_vendas_promotores(df_filtrado: pd.DataFrame):
 
 
 
-# ============================================= CACHE DOS DADOS =============================================
-@st.cache_data(ttl=3600)
-def carregar_vendas() -> pd.DataFrame:
-    """Carrega dados de vendas com verificação robusta"""
-    try:
-        arquivos_vendas = [
-            'Vds_2023_Comb_.xlsx',
-            'Vds_2024_Comb_.xlsx',
-            'Vds_2025_Comb_.xlsx'
-        ]
-        
-        dfs = []
-        for arquivo in arquivos_vendas:
-            if os.path.exists(arquivo):
-                df_temp = pd.read_excel(arquivo)
-                logger.info(f"Arquivo {arquivo} carregado: {len(df_temp)} registros")
-                dfs.append(df_temp)
-            else:
-                logger.warning(f"Arquivo {arquivo} não encontrado")
-                st.warning(f"⚠️ Arquivo {arquivo} não encontrado")
-        
-        if not dfs:
-            st.error("❌ Nenhum arquivo de vendas encontrado")
-            return pd.DataFrame()
-            
-        df = pd.concat(dfs, ignore_index=True).fillna(0)
-        
-        # Processamento das colunas monetárias
-        colunas_monetarias = ['V_Liquido', 'V_Imposto', 'Custo_Produto', 'Margem_Vendas',
-                             'V_Venda_Oceanica', 'Desconto', 'Valor_ISC']
-        
-        for col in colunas_monetarias:
-            if col in df.columns:
-                df[f'{col}_MT'] = df[col] * df['Cambio']
-                df[f'{col}_USD'] = df[col] / df['Cambio']
-
-        # Processamento de datas
-        df['Data_Facturacao'] = pd.to_datetime(df['Data_Facturacao'], errors='coerce')
-        df['Ano'] = df['Data_Facturacao'].dt.year.fillna(0).astype(int)
-        df['Mes'] = df['Data_Facturacao'].dt.month.fillna(0).astype(int)
-        
-        logger.info(f"Dataset de vendas processado: {len(df)} registros")
-        return df
-        
-    except Exception as e:
-        logger.error(f"Erro ao carregar vendas: {str(e)}")
-        st.error(f"❌ Erro crítico ao carregar vendas: {str(e)}")
-        return pd.DataFrame()
-
-@st.cache_data(ttl=3600)
-def carregar_plano() -> pd.DataFrame:
-    try:
-        p1 = pd.read_excel('PlanComb_2023.xlsx')
-        p2 = pd.read_excel('PlanComb_2024.xlsx')
-        p3 = pd.read_excel('PlanComb_2025.xlsx')
-
-        df = pd.concat([p1, p2, p3], ignore_index=True).fillna(0)
-        df['Data_Facturacao'] = pd.to_datetime(df['Data_Facturacao'], format='%d/%m/%Y', errors='coerce')
-        
-        return df
-    except Exception as e:
-        logger.error(f"Erro ao carregar plano: {str(e)}")
-        st.error(f"Erro ao carregar plano: {str(e)}")
-        return pd.DataFrame()
-
-@st.cache_data(ttl=3600)
-def carregar_lookups():
-    try:
-        v0 = pd.read_excel('v_loock_up.xlsx', sheet_name=0)
-        v1 = pd.read_excel('v_loock_up.xlsx', sheet_name=1)
-        v2 = pd.read_excel('v_loock_up.xlsx', sheet_name=2)
-        v3 = pd.read_excel('v_loock_up.xlsx', sheet_name=3)
-        v4 = pd.read_excel('v_loock_up.xlsx', sheet_name=4)
-        v5 = pd.read_excel('v_loock_up.xlsx', sheet_name=5)
-        v0['DataCriacaoCliente'] = pd.to_datetime(v0['DataCriacaoCliente'], format='%d/%m/%Y', errors='coerce')
-        return v0, v1, v2, v3, v4, v5
-    except Exception as e:
-        logger.error(f"Erro ao carregar lookups: {str(e)}")
-        st.error(f"Erro ao carregar lookups: {str(e)}")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-
-@st.cache_data(ttl=3600)
-def carregar_importacao() -> pd.DataFrame:
-    try:
-        df = pd.read_excel('ImportacaoMZ.xlsx')
-        
-        def safe_datetime_conversion(series, format=None):
-            try:
-                if format:
-                    return pd.to_datetime(series, format=format, errors='coerce')
-                else:
-                    return pd.to_datetime(series, errors='coerce')
-            except Exception:
-                return pd.Series([pd.NaT] * len(series))
-        
-        colunas_data = ['NOR', 'Data_Descarga']
-        for col in colunas_data:
-            if col in df.columns:
-                df[col] = safe_datetime_conversion(df[col])
-        
-        return df
-    except FileNotFoundError:
-        logger.error("Arquivo ImportacaoMZ.xlsx não encontrado")
-        st.error("Arquivo ImportacaoMZ.xlsx não encontrado")
-        return pd.DataFrame()
-    except Exception as e:
-        logger.error(f"Erro ao carregar importação: {str(e)}")
-        st.error(f"Erro ao carregar importação: {str(e)}")
-        return pd.DataFrame()
-
-# Carregar dados
-@st.cache_resource
-def carregar_todos_dados():
-    with st.spinner("🔄 Carregando dados do sistema..."):
-        vendas_df = carregar_vendas()
-        plano_df = carregar_plano()
-        v0, v1, v2, v3, v4, v5 = carregar_lookups()
-        import_df = carregar_importacao()
-        return vendas_df, plano_df, v0, v1, v2, v3, v4, v5, import_df
-
-vendas_df, plano_df, v0, v1, v2, v3, v4, v5, import_df = carregar_todos_dados()
-
 # ============================================= DADOS DE STOCK (SIMULADOS OU REAIS) =============================================
-@st.cache_data(ttl=3600)
-def carregar_dados_stock():
-    """Carrega dados de stock - pode ser real ou simulado"""
+@st.cache_data(max_entries=2)
+def carregar_dados_stock(assinatura: Tuple = None):
+    """Carrega dados de stock - pode ser real ou simulado ('assinatura' do ficheiro serve de chave da cache)"""
     try:
         # Tentar carregar arquivo real primeiro
         if os.path.exists('Stock_Provincias.xlsx'):
@@ -3872,9 +3686,6 @@ def criar_dados_stock_simulados():
     
     return pd.DataFrame(dados)
 
-# Carregar dados de stock
-stock_df = carregar_dados_stock()
-
 # ============================================= FUNÇÕES PARA ABA STOCK =============================================
 
 def criar_card_metricas_stock(titulo: str, valor_principal: str, subtitulo1: str = "", subtitulo2: str = "", icone: str = "📊", tipo_card: str = "default"):
@@ -4047,6 +3858,8 @@ def criar_aba_stock():
     
     st.markdown('<div class="section-title-stock">📦 ANÁLISE DE STOCK - MOÇAMBIQUE</div>', unsafe_allow_html=True)
     
+    stock_df = carregar_dados_stock(assinatura_ficheiro('Stock_Provincias.xlsx'))
+    
     # Verificar se temos dados
     if stock_df.empty:
         st.warning("⚠️ Nenhum dado de stock disponível")
@@ -4167,16 +3980,12 @@ def criar_aba_stock():
         
         for coluna in colunas_formatar:
             if coluna in df_display.columns:
-                df_display[coluna] = df_display[coluna].apply(
-                    lambda x: formatar_ptbr(x, 0) if pd.notna(x) else "0"
-                )
+                df_display[coluna] = formatar_coluna_ptbr(df_display[coluna], 0)
         
         # Formatar autonomias e adicionar classificação
         for coluna in ["Autonomia_Gasolina", "Autonomia_Gasoleo", "Autonomia_Jet", "Autonomia_Total"]:
             if coluna in df_display.columns:
-                df_display[f"{coluna}_Formatado"] = df_display[coluna].apply(
-                    lambda x: f"{x:.1f}" if pd.notna(x) else "0.0"
-                )
+                df_display[f"{coluna}_Formatado"] = formatar_coluna_ptbr(df_display[coluna], 1)
                 df_display[f"{coluna}_Classificacao"] = df_display[coluna].apply(
                     lambda x: classificar_autonomia(x)[0] if pd.notna(x) else "N/A"
                 )
@@ -4492,6 +4301,9 @@ def main():
     </style>
     """, unsafe_allow_html=True)
 
+    # VIGILÂNCIA DOS FICHEIROS DE ORIGEM (uma thread por processo)
+    camada_dados.iniciar_vigilancia()
+    
     # HEADER PRINCIPAL
     st.markdown('<h1 class="main-header">Sistema de Gestão - Petromoc, SA</h1>', unsafe_allow_html=True)
     
@@ -4499,8 +4311,27 @@ def main():
     with st.sidebar:
         filtros = renderizar_menu_lateral_corrigido()
     
-    # VERIFICAR SE TEMOS DADOS
-    if DateSet_MT_Pln.empty and import_df.empty:
+    # PROCESSAR COM BASE NO MODO SELECIONADO
+    modo_trabalho = filtros.get('modo_trabalho', 'Importação')
+    
+    # VERIFICAR SE TEMOS DADOS (só os do modo selecionado são carregados)
+    if modo_trabalho in ("Vendas", "Promotores"):
+        intervalo = filtros.get('date_range', st.session_state['date_range_vendas'])
+        base = base_vendas(filtros)
+        conjuntos_modo = particoes(f'{base}_vendas', intervalo)
+        conjuntos_plano = particoes(f'{base}_plano', intervalo)
+        dados_modo = obter_fatos(f'{base}_vendas', intervalo)
+        plano_modo = obter_fatos(f'{base}_plano', intervalo)
+        mostrar_erros_carregamento(conjuntos_plano)
+    elif modo_trabalho == "Importação":
+        conjuntos_modo = ['importacao']
+        dados_modo = obter_dados('importacao')
+        quota_modo = obter_dados('quota_mercado')
+    else:
+        conjuntos_modo, dados_modo = [], None
+    
+    mostrar_erros_carregamento(conjuntos_modo)
+    if dados_modo is not None and dados_modo.empty:
         st.error("""
         ❌ Nenhum dado disponível para análise.
         
@@ -4515,29 +4346,31 @@ def main():
         """)
         return
     
-    # PROCESSAR COM BASE NO MODO SELECIONADO
-    modo_trabalho = filtros.get('modo_trabalho', 'Importação')
-    
     if modo_trabalho == "Vendas":
         # APLICAR FILTROS NAS VENDAS
-        df_filtrado_vendas = aplicar_filtros_vendas(DateSet_MT_Pln, filtros)
+        df_filtrado_vendas = aplicar_filtros_vendas(dados_modo, filtros, conjuntos_modo)
+        plano_filtrado = plano_comparavel(aplicar_filtros_vendas(plano_modo, filtros, conjuntos_plano),
+                                          filtros, conjuntos_plano)
         
         # CRIAR ABA DE VENDAS COM TABELA PRIMEIRO
-        criar_aba_vendas_com_tabela_primeiro(df_filtrado_vendas, filtros)
+        criar_aba_vendas_com_tabela_primeiro(df_filtrado_vendas, filtros, plano_filtrado)
         
     elif modo_trabalho == "Importação":
         # APLICAR FILTROS NA IMPORTAÇÃO
-        df_filtrado_importacao = aplicar_filtros_importacao(import_df, filtros)
+        df_filtrado_importacao = aplicar_filtros_importacao(dados_modo, filtros, conjuntos_modo)
+        quota_filtrada = aplicar_filtros_importacao(quota_modo, filtros, ['quota_mercado'])
         
         # CRIAR ABA DE IMPORTAÇÃO COM SCROLLER
-        criar_aba_importacao_com_dados_reais(df_filtrado_importacao)
+        criar_aba_importacao_com_dados_reais(df_filtrado_importacao, quota_filtrada)
         
     elif modo_trabalho == "Promotores":
         # APLICAR FILTROS NAS VENDAS
-        df_filtrado_promotores = aplicar_filtros_vendas(DateSet_MT_Pln, filtros)
+        df_filtrado_promotores = aplicar_filtros_vendas(dados_modo, filtros, conjuntos_modo)
+        plano_filtrado = plano_comparavel(aplicar_filtros_vendas(plano_modo, filtros, conjuntos_plano),
+                                          filtros, conjuntos_plano)
         
         # CRIAR ABA DE PROMOTORES
-        criar_aba_promotores(df_filtrado_promotores)
+        criar_aba_promotores(df_filtrado_promotores, plano_filtrado)
         
     elif modo_trabalho == "Stock":
         # CRIAR ABA DE STOCK (NOVA FUNCIONALIDADE)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Armazém Analítico Versionado – Petromoc, SA
+Conjuntos já carregados, limpos e enriquecidos (factos de vendas e de plano
+por ano, importação), gravados em Parquet pelo comando construir_armazem.py. Cada
+execução cria uma versão nova e só no fim aponta 'atual.json' para ela; a
+aplicação web abre a versão atual sem ler Excel nem fazer junções.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from cache_snapshots import DIRETORIO_SNAPSHOTS, gravar_parquet, ler_parquet, normalizar_tipos
+from fontes_dados import CONFIGURACAO
+
+logger = logging.getLogger(__name__)
+
+# ============================================= CONFIGURAÇÃO =============================================
+DIRETORIO_ARMAZEM_ANALITICO = Path(CONFIGURACAO.get('analytics_store') or DIRETORIO_SNAPSHOTS / 'analitico')
+PONTEIRO_ATUAL = DIRETORIO_ARMAZEM_ANALITICO / 'atual.json'
+
+# Incrementar quando o conteúdo ou o formato dos conjuntos mudar (versões antigas são ignoradas)
+VERSAO_FORMATO = 10
+
+# Versões anteriores mantidas em disco (para sessões que ainda as estejam a ler)
+MANTER_VERSOES = 3
+
+def _arquivo_conjunto(nome: str) -> str:
+    return nome.replace(':', '_') + '.parquet'
+
+# ============================================= LEITURA =============================================
+def versao_atual() -> Optional[str]:
+    try:
+        with open(PONTEIRO_ATUAL, 'r', encoding='utf-8') as f:
+            return json.load(f)['versao']
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ponteiro do armazém analítico {PONTEIRO_ATUAL} inválido: {e}")
+        return None
+
+def manifesto_atual() -> Optional[Dict[str, Any]]:
+    """Manifesto da versão atual, ou None se não houver armazém compatível"""
+    versao = versao_atual()
+    if versao is None:
+        return None
+    try:
+        with open(DIRETORIO_ARMAZEM_ANALITICO / versao / 'manifesto.json', 'r', encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifesto da versão {versao} do armazém analítico ilegível: {e}")
+        return None
+    if manifesto.get('formato') != VERSAO_FORMATO:
+        logger.warning(f"Armazém analítico {versao} no formato {manifesto.get('formato')} "
+                       f"(esperado {VERSAO_FORMATO}) - ignorado; volte a correr construir_armazem.py")
+        return None
+    return manifesto
+
+def ler_conjunto(nome: str) -> pd.DataFrame:
+    """Lê um conjunto da versão atual (resolvida a cada chamada, para apanhar versões novas)"""
+    inicio = time.perf_counter()
+    manifesto = manifesto_atual()
+    if manifesto is None or nome not in manifesto['conjuntos']:
+        raise FileNotFoundError(f"Conjunto '{nome}' não existe no armazém analítico")
+    df = ler_parquet(DIRETORIO_ARMAZEM_ANALITICO / manifesto['versao'] / manifesto['conjuntos'][nome]['arquivo'])
+    logger.info(f"'{nome}' lido do armazém analítico {manifesto['versao']}: "
+                f"{len(df)} registros em {time.perf_counter() - inicio:.2f} s")
+    return df
+
+# ============================================= GRAVAÇÃO =============================================
+def gravar_versao(conjuntos: Dict[str, pd.DataFrame], fontes: Dict[str, Any],
+                  erros: Optional[Dict[str, str]] = None) -> str:
+    """
+    Grava os conjuntos numa versão nova e torna-a a atual. O ponteiro só muda
+    depois de todos os ficheiros estarem escritos.
+    """
+    versao = time.strftime('v%Y%m%d-%H%M%S')
+    if (DIRETORIO_ARMAZEM_ANALITICO / versao).exists():
+        versao += f"-{len(versoes())}"
+    diretorio = DIRETORIO_ARMAZEM_ANALITICO / versao
+    temporario = diretorio.with_name(versao + '.tmp')
+    if temporario.exists():
+        shutil.rmtree(temporario)
+    temporario.mkdir(parents=True)
+
+    descricao: Dict[str, Dict[str, Any]] = {}
+    for nome, df in conjuntos.items():
+        arquivo = _arquivo_conjunto(nome)
+        gravar_parquet(normalizar_tipos(df.copy()), temporario / arquivo)
+        descricao[nome] = {'arquivo': arquivo, 'linhas': len(df)}
+
+    manifesto = {
+        'versao': versao,
+        'formato': VERSAO_FORMATO,
+        'criado_em': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'conjuntos': descricao,
+        'fontes': fontes,
+        'erros': erros or {},
+    }
+    with open(temporario / 'manifesto.json', 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, diretorio)
+
+    ponteiro_tmp = PONTEIRO_ATUAL.with_suffix('.json.tmp')
+    with open(ponteiro_tmp, 'w', encoding='utf-8') as f:
+        json.dump({'versao': versao}, f)
+    os.replace(ponteiro_tmp, PONTEIRO_ATUAL)
+
+    _remover_antigas(versao)
+    return versao
+
+def versoes() -> List[str]:
+    if not DIRETORIO_ARMAZEM_ANALITICO.exists():
+        return []
+    return sorted(p.name for p in DIRETORIO_ARMAZEM_ANALITICO.iterdir()
+                  if p.is_dir() and p.name.startswith('v') and not p.name.endswith('.tmp'))
+
+def _remover_antigas(atual: str) -> None:
+    for versao in versoes()[:-MANTER_VERSOES]:
+        if versao != atual:
+            shutil.rmtree(DIRETORIO_ARMAZEM_ANALITICO / versao, ignore_errors=True)
+            logger.info(f"Versão antiga do armazém analítico removida: {versao}")
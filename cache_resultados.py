@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de Resultados Filtrados – Petromoc, SA
+Cache LRU do processo (partilhada por todas as sessões) das seleções de
+linhas e dos agregados das abas, identificados por uma chave canónica de
+(versão dos conjuntos, modo, filtros). Sessões e reruns com os mesmos
+filtros reutilizam o resultado em vez de o voltar a calcular.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import numpy as np
+import pandas as pd
+
+# ============================================= CONFIGURAÇÃO =============================================
+MAX_ENTRADAS = int(os.environ.get('PETROMOC_CACHE_RESULTADOS_ENTRADAS', 512))
+MAX_BYTES = int(os.environ.get('PETROMOC_CACHE_RESULTADOS_MB', 256)) * (1 << 20)
+
+# ============================================= CHAVE CANÓNICA =============================================
+def _normalizar(valor: Any) -> Any:
+    """Forma estável para JSON: datas em ISO e seleções como listas ordenadas de texto"""
+    if isinstance(valor, dict):
+        # Seleção vazia equivale a não filtrar
+        return {str(k): _normalizar(v) for k, v in valor.items() if not (isinstance(v, (list, set)) and not v)}
+    if isinstance(valor, (date, datetime, pd.Timestamp)):
+        return pd.Timestamp(valor).isoformat()
+    if isinstance(valor, tuple) or (isinstance(valor, list) and any(isinstance(v, date) for v in valor)):
+        # Intervalos de datas e chaves compostas: a ordem conta
+        return [_normalizar(v) for v in valor]
+    if isinstance(valor, (list, set)):
+        # Valores selecionados num filtro: a ordem não conta
+        return sorted(str(v) for v in valor)
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+def chave_canonica(*partes: Any) -> str:
+    """Hash das partes normalizadas: a ordem das chaves e dos valores selecionados não conta"""
+    texto = json.dumps(_normalizar(partes), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+# ============================================= CACHE LRU =============================================
+def _tamanho(valor: Any) -> int:
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=False).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=False))
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, (tuple, list)):
+        return sum(_tamanho(v) for v in valor)
+    return sys.getsizeof(valor)
+
+class CacheResultados:
+    """
+    LRU limitada em número de entradas e em bytes. Os valores guardados são
+    partilhados entre sessões e devem ser tratados como só de leitura.
+    """
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS, max_bytes: int = MAX_BYTES):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave: Hashable, calcular: Callable[[], Any]) -> Any:
+        """Valor da chave, calculado (fora do lock) e guardado se ainda não existir"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return entrada[0]
+            self.falhas += 1
+
+        valor = calcular()
+        tamanho = _tamanho(valor)
+        if tamanho > self.max_bytes:
+            return valor
+        with self._lock:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._entradas[chave] = (valor, tamanho)
+            self.bytes += tamanho
+            while self._entradas and (len(self._entradas) > self.max_entradas or self.bytes > self.max_bytes):
+                _, (_, removido) = self._entradas.popitem(last=False)
+                self.bytes -= removido
+        return valor
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def estatisticas(self) -> Dict[str, Any]:
+        total = self.acertos + self.falhas
+        return {
+            'entradas': len(self._entradas),
+            'bytes': self.bytes,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acerto': self.acertos / total if total else 0.0,
+        }
+
+# Instância única do processo, partilhada por todas as sessões
+cache_resultados = CacheResultados()
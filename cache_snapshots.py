@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de Snapshots em Disco – Petromoc, SA
+Guarda cada folha Excel já lida e normalizada em formato colunar (Parquet),
+identificada por caminho + tamanho + mtime + hash do conteúdo do ficheiro.
+Leituras seguintes abrem o snapshot em milissegundos e só os livros que
+mudaram voltam a ser interpretados pelo pd.read_excel.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# ============================================= CONFIGURAÇÃO =============================================
+DIRETORIO_SNAPSHOTS = Path(os.environ.get('PETROMOC_SNAPSHOTS', '.snapshots'))
+
+# Incrementar quando a normalização de tipos mudar (invalida todos os snapshots)
+VERSAO_FORMATO = 2
+
+try:
+    import pyarrow  # noqa: F401
+    FORMATO_SNAPSHOT = 'parquet'
+except ImportError:
+    FORMATO_SNAPSHOT = 'pickle'
+    logger.warning("pyarrow não instalado - snapshots gravados em pickle")
+
+Folha = Union[int, str]
+
+# ============================================= ASSINATURA DOS FICHEIROS =============================================
+def calcular_hash_arquivo(caminho: Union[str, Path], bloco: int = 1 << 20) -> str:
+    """Calcula o SHA-256 do conteúdo do ficheiro em blocos"""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for parte in iter(lambda: f.read(bloco), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+def assinatura_arquivo(caminho: Union[str, Path], com_hash: bool = True) -> Dict[str, Any]:
+    """Devolve caminho absoluto, tamanho, mtime e (opcionalmente) hash do ficheiro"""
+    caminho = Path(caminho)
+    info = os.stat(caminho)  # FileNotFoundError propaga para o chamador
+    assinatura = {
+        'caminho': str(caminho.resolve()),
+        'tamanho': info.st_size,
+        'mtime_ns': info.st_mtime_ns,
+    }
+    if com_hash:
+        assinatura['sha256'] = calcular_hash_arquivo(caminho)
+    return assinatura
+
+def _nome_base_snapshot(caminho: Union[str, Path], folha: Folha, versao: str) -> Path:
+    """Nome estável do snapshot para (ficheiro, folha, versão do parser)"""
+    caminho_abs = str(Path(caminho).resolve())
+    chave = f"{caminho_abs}|{folha}|{versao}|{VERSAO_FORMATO}"
+    sufixo = hashlib.sha1(chave.encode('utf-8')).hexdigest()[:12]
+    return DIRETORIO_SNAPSHOTS / f"{Path(caminho).stem}__{folha}__{sufixo}"
+
+# ============================================= NORMALIZAÇÃO DE TIPOS =============================================
+def normalizar_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte para numérico as colunas object que só têm números. Colunas com
+    tipos mistos ficam como vieram do Excel (ex.: chave 123 continua inteiro);
+    gravar_parquet guarda-as sem alterar os valores.
+    """
+    if df.empty:
+        return df
+
+    if not all(isinstance(c, str) for c in df.columns):
+        df = df.rename(columns=str)
+
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+
+        tipo = pd.api.types.infer_dtype(df[col], skipna=True)
+
+        if tipo in ('integer', 'floating', 'mixed-integer-float'):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    return df
+
+# ============================================= PARQUET COM TIPOS MISTOS =============================================
+# Nos metadados do ficheiro: colunas gravadas valor a valor em pickle
+_METADADOS_MISTAS = b'petromoc_colunas_mistas'
+
+def colunas_mistas(df: pd.DataFrame) -> List[str]:
+    """Colunas object com valores de tipos diferentes (o Parquet só aceita um tipo por coluna)"""
+    return [c for c in df.columns if df[c].dtype == object
+            and pd.api.types.infer_dtype(df[c], skipna=True) in ('mixed', 'mixed-integer')]
+
+def gravar_parquet(df: pd.DataFrame, destino: Union[str, Path]) -> None:
+    """Grava em Parquet; as colunas de tipos mistos vão em binário e voltam iguais em ler_parquet"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    mistas = colunas_mistas(df)
+    if mistas:
+        df = df.assign(**{c: [pickle.dumps(v) for v in df[c]] for c in mistas})
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    metadados = dict(tabela.schema.metadata or {})
+    metadados[_METADADOS_MISTAS] = json.dumps(mistas).encode('utf-8')
+    pq.write_table(tabela.replace_schema_metadata(metadados), destino)
+
+def ler_parquet(caminho: Union[str, Path]) -> pd.DataFrame:
+    """Lê um ficheiro gravado por gravar_parquet, com os tipos originais das colunas mistas"""
+    import pyarrow.parquet as pq
+
+    tabela = pq.read_table(caminho)
+    df = tabela.to_pandas()
+    for col in json.loads((tabela.schema.metadata or {}).get(_METADADOS_MISTAS, b'[]')):
+        df[col] = pd.Series([pickle.loads(v) for v in df[col]], index=df.index, dtype=object)
+    return df
+
+# ============================================= LEITURA E GRAVAÇÃO =============================================
+def _caminho_dados(base: Path, formato: str) -> Path:
+    return base.with_suffix('.parquet' if formato == 'parquet' else '.pkl')
+
+def _ler_manifesto(base: Path) -> Optional[Dict[str, Any]]:
+    manifesto = base.with_suffix('.json')
+    if not manifesto.exists():
+        return None
+    try:
+        with open(manifesto, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifesto de snapshot inválido {manifesto}: {e}")
+        return None
+
+def _gravar_manifesto(base: Path, dados: Dict[str, Any]) -> None:
+    manifesto = base.with_suffix('.json')
+    temporario = manifesto.with_suffix('.json.tmp')
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, manifesto)
+
+def snapshot_valido(caminho: Union[str, Path], folha: Folha = 0, versao: str = '1') -> bool:
+    """Indica se existe um snapshot atualizado para o ficheiro/folha, sem o abrir"""
+    base = _nome_base_snapshot(caminho, folha, versao)
+    manifesto = _ler_manifesto(base)
+    if manifesto is None or not _caminho_dados(base, manifesto.get('formato', FORMATO_SNAPSHOT)).exists():
+        return False
+
+    atual = assinatura_arquivo(caminho, com_hash=False)
+    if atual['tamanho'] != manifesto['tamanho']:
+        return False
+    if atual['mtime_ns'] == manifesto['mtime_ns']:
+        return True
+
+    # mtime mudou mas o tamanho não: confirmar pelo conteúdo
+    if calcular_hash_arquivo(caminho) == manifesto.get('sha256'):
+        manifesto['mtime_ns'] = atual['mtime_ns']
+        _gravar_manifesto(base, manifesto)
+        return True
+    return False
+
+def carregar_snapshot(caminho: Union[str, Path], folha: Folha = 0, versao: str = '1') -> Optional[pd.DataFrame]:
+    """Abre o snapshot do ficheiro/folha se ainda corresponder ao ficheiro de origem"""
+    if not snapshot_valido(caminho, folha, versao):
+        return None
+
+    base = _nome_base_snapshot(caminho, folha, versao)
+    formato = (_ler_manifesto(base) or {}).get('formato', FORMATO_SNAPSHOT)
+    dados = _caminho_dados(base, formato)
+    try:
+        if formato == 'parquet':
+            return ler_parquet(dados)
+        return pd.read_pickle(dados)
+    except Exception as e:
+        logger.warning(f"Snapshot {dados} ilegível, será refeito: {e}")
+        return None
+
+def gravar_snapshot(caminho: Union[str, Path], df: pd.DataFrame, folha: Folha = 0, versao: str = '1',
+                    assinatura: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Grava o DataFrame normalizado como snapshot do ficheiro/folha, com a
+    'assinatura' tirada antes da leitura: se o ficheiro mudar a meio, o
+    snapshot fica inválido. Sem 'assinatura' é calculada agora.
+    """
+    DIRETORIO_SNAPSHOTS.mkdir(parents=True, exist_ok=True)
+    base = _nome_base_snapshot(caminho, folha, versao)
+    dados = _caminho_dados(base, FORMATO_SNAPSHOT)
+    temporario = dados.with_name(dados.name + '.tmp')
+
+    if FORMATO_SNAPSHOT == 'parquet':
+        gravar_parquet(df, temporario)
+    else:
+        df.to_pickle(temporario)
+    os.replace(temporario, dados)
+
+    manifesto = dict(assinatura or assinatura_arquivo(caminho))
+    manifesto.update({
+        'folha': folha,
+        'versao': versao,
+        'formato': FORMATO_SNAPSHOT,
+        'linhas': len(df),
+        'criado_em': time.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    _gravar_manifesto(base, manifesto)
+
+def ler_com_snapshot(caminho: Union[str, Path], folha: Folha,
+                     interpretar: Callable[[], pd.DataFrame], versao: str = '1') -> pd.DataFrame:
+    """
+    Devolve o snapshot válido do ficheiro/folha ou, se não houver, chama
+    'interpretar()' e guarda o resultado. Mudar o interpretador exige nova 'versao'.
+    """
+    inicio = time.perf_counter()
+    df = carregar_snapshot(caminho, folha, versao)
+    if df is not None:
+        logger.info(f"Snapshot {caminho}[{folha}] carregado em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return df
+
+    # Assinatura tirada antes da leitura
+    assinatura = assinatura_arquivo(caminho)
+    df = normalizar_tipos(interpretar())
+    logger.info(f"Excel {caminho}[{folha}] interpretado em {time.perf_counter() - inicio:.2f} s")
+
+    try:
+        gravar_snapshot(caminho, df, folha, versao, assinatura)
+    except Exception as e:
+        # Falhar a gravação do cache nunca deve impedir o carregamento
+        logger.warning(f"Não foi possível gravar snapshot de {caminho}[{folha}]: {e}")
+
+    return df
+
+def ler_excel_snapshot(caminho: Union[str, Path], folha: Folha = 0,
+                       normalizar: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                       versao: str = '1', **kwargs) -> pd.DataFrame:
+    """
+    Substituto do pd.read_excel com snapshot em disco.
+    'normalizar' corre apenas quando o livro é interpretado; o resultado já
+    normalizado é o que fica guardado. Mudar a normalização exige nova 'versao'.
+    """
+    def interpretar() -> pd.DataFrame:
+        df = pd.read_excel(caminho, sheet_name=folha, **kwargs)
+        return normalizar(df) if normalizar is not None else df
+
+    return ler_com_snapshot(caminho, folha, interpretar, versao)
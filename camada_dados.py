@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Camada de Acesso a Dados – Petromoc, SA
+Cada conjunto de dados (importação, vendas com plano, ...) é carregado só
+quando um modo o pede pela primeira vez e fica partilhado por todas as
+sessões do processo. Nada é lido ao importar o módulo.
+Conjuntos presentes no armazém analítico (construir_armazem.py) são lidos
+diretamente dele, sem Excel nem junções. Uma thread de vigilância compara
+tamanho e data de modificação dos ficheiros de origem (e do ponteiro do
+armazém) e reconstrói em segundo plano só os conjuntos afetados; até à
+troca as sessões continuam a receber a versão anterior.
+"""
+
+import logging
+import os
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+import armazem_analitico
+from carregador_paralelo import Progresso, Tarefa, executar_grafo
+from indice_filtros import IndiceFiltros
+from quota_mercado import tabela_longa
+from somas_acumuladas import SomasAcumuladas
+from ingestao_incremental import atualizar_particao
+from fontes_dados import (
+    ARQUIVO_IMPORTACAO, ARQUIVO_LOOKUP, FOLHAS_LOOKUP, ano_ativo, anos_configurados, candidatos_do_ano,
+    concatenar_fatos, enriquecer_plano, enriquecer_vendas, fonte_em_cache, ler_importacao, ler_lookups, ler_plano_ano,
+    ler_vendas_ano, materializar_cubo, nome_particao, preparar_vendas
+)
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre verificações dos ficheiros de origem
+INTERVALO_VIGILANCIA = float(os.environ.get('PETROMOC_INTERVALO_VIGILANCIA', '30'))
+
+AssinaturaFicheiro = Optional[Tuple[int, int]]
+
+def assinatura_ficheiro(caminho: str) -> AssinaturaFicheiro:
+    """(tamanho, mtime em ns) do ficheiro, ou None se não existir"""
+    try:
+        estado = os.stat(caminho)
+    except OSError:
+        return None
+    return estado.st_size, estado.st_mtime_ns
+
+def tarefas_carregamento(anos: List[int], ativo: Optional[int] = None) -> List[Tarefa]:
+    """
+    Grafo de carregamento com vendas e plano partidos por ano. Fontes Excel
+    correm em paralelo; as junções de cada ano esperam pelas suas dependências.
+    Vendas e plano são tabelas de factos separadas (fatos_vendas, fatos_plano),
+    alinhadas só ao nível agregado. Cada uma tem o seu cubo (cubo_vendas,
+    cubo_plano) ao grão dia × dimensões das vistas, de onde as vistas de
+    Vendas e Promotores agregam. As quantidades da importação são desdobradas
+    por empresa em quota_mercado (formato longo). A partição de vendas do ano 'ativo' é
+    mantida pelo armazém incremental. Leituras brutas e junções são
+    intermédias e não ficam em memória.
+    """
+    vazio = pd.DataFrame()
+    tarefas = [
+        # No processo principal: as folhas ficam no registro_workbooks, onde o MIS as volta a usar
+        Tarefa('lookups', ler_lookups, padrao=tuple(pd.DataFrame() for _ in FOLHAS_LOOKUP),
+               arquivos=(ARQUIVO_LOOKUP,)),
+        Tarefa('importacao', ler_importacao, em_processo=True, padrao=vazio, arquivos=(ARQUIVO_IMPORTACAO,)),
+        Tarefa('quota_mercado', tabela_longa, ('importacao',), padrao=vazio),
+    ]
+    for ano in anos:
+        vendas, plano, juncoes, fatos_vendas = (nome_particao(c, ano) for c in ('vendas', 'plano', 'juncoes', 'fatos_vendas'))
+        tarefas += [
+            Tarefa(vendas, partial(ler_vendas_ano, ano), em_processo=True, padrao=vazio,
+                   arquivos=tuple(candidatos_do_ano('vendas', ano)), reter=False),
+            Tarefa(plano, partial(ler_plano_ano, ano), em_processo=True, padrao=vazio,
+                   arquivos=tuple(candidatos_do_ano('plano', ano)), reter=False),
+        ]
+        if ano == ativo:
+            # Ano corrente: só as linhas novas passam pelas junções (armazém incremental)
+            tarefas.append(Tarefa(fatos_vendas, partial(atualizar_particao, ano), (vendas, 'lookups'), padrao=vazio))
+        else:
+            tarefas += [
+                Tarefa(juncoes, enriquecer_vendas, (vendas, 'lookups'), padrao=vazio, reter=False),
+                Tarefa(fatos_vendas, preparar_vendas, (juncoes,), padrao=vazio),
+            ]
+        fatos_plano = nome_particao('fatos_plano', ano)
+        tarefas += [
+            Tarefa(fatos_plano, enriquecer_plano, (plano, 'lookups'), padrao=vazio),
+            Tarefa(nome_particao('cubo_vendas', ano), materializar_cubo, (fatos_vendas,), padrao=vazio),
+            Tarefa(nome_particao('cubo_plano', ano), materializar_cubo, (fatos_plano,), padrao=vazio),
+        ]
+    return tarefas
+
+def tarefas_armazem(tarefas: List[Tarefa]) -> List[Tarefa]:
+    """
+    Conjuntos presentes na versão atual do armazém analítico passam a ser
+    lidos dele, sem dependências. A camada de dados volta a aplicar esta
+    função sempre que o ponteiro 'atual.json' muda (ver CamadaDados.verificar).
+    """
+    manifesto = armazem_analitico.manifesto_atual()
+    if manifesto is None:
+        return tarefas
+    logger.info(f"Armazém analítico {manifesto['versao']} ({manifesto['criado_em']}): "
+                f"{', '.join(manifesto['conjuntos'])}")
+    return [
+        Tarefa(t.nome, partial(armazem_analitico.ler_conjunto, t.nome), padrao=t.padrao,
+               arquivos=(str(armazem_analitico.PONTEIRO_ATUAL),))
+        if t.nome in manifesto['conjuntos'] else t
+        for t in tarefas
+    ]
+
+class CamadaDados:
+    """
+    Conjuntos de dados carregados a pedido, uma única vez por processo.
+    Os valores devolvidos são partilhados entre sessões e devem ser tratados
+    como só de leitura. 'versoes' conta as reconstruções de cada conjunto e
+    serve de chave para caches derivadas (st.cache_data). Com 'usar_armazem'
+    os conjuntos do armazém analítico são lidos dele (tarefas_armazem).
+    """
+
+    def __init__(self, tarefas: List[Tarefa], em_cache: Callable[[str], bool], usar_armazem: bool = False):
+        self._tarefas_base = tarefas
+        self._usar_armazem = usar_armazem
+        self._assinatura_armazem = assinatura_ficheiro(str(armazem_analitico.PONTEIRO_ATUAL))
+        self._tarefas = {t.nome: t for t in (tarefas_armazem(tarefas) if usar_armazem else tarefas)}
+        self._em_cache = em_cache
+        self._lock = threading.Lock()
+        self._valores: Dict[str, Any] = {}
+        self._carregadas: Set[str] = set()
+        self._combinados: Dict[Tuple[str, ...], pd.DataFrame] = {}
+        self._indices: Dict[Tuple[str, ...], IndiceFiltros] = {}
+        self._somas: Dict[Tuple[str, ...], SomasAcumuladas] = {}
+        self._assinaturas: Dict[str, AssinaturaFicheiro] = {}
+        self._vigilante: Optional[threading.Thread] = None
+        self._verificar_agora = threading.Event()
+        self.versoes: Dict[str, int] = {}
+        self.em_reconstrucao: List[str] = []
+        self.erros: Dict[str, Exception] = {}
+
+    def carregado(self, nome: str) -> bool:
+        return nome in self._valores
+
+    def por_carregar(self, nomes: List[str], conhecidos: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Conjuntos que é preciso calcular para obter 'nomes' (a procura pára nos que estão em memória)"""
+        conhecidos = self._valores if conhecidos is None else conhecidos
+        em_falta: List[str] = []
+        pendentes = list(nomes)
+        while pendentes:
+            atual = pendentes.pop()
+            if atual not in conhecidos and atual not in em_falta:
+                em_falta.append(atual)
+                pendentes.extend(self._tarefas[atual].dependencias)
+        return em_falta
+
+    def _guardar(self, valores: Dict[str, Any], resultados: Dict[str, Any], pedidos: List[str]) -> None:
+        """Guarda os resultados, exceto os intermédios que ninguém pediu diretamente"""
+        for nome, valor in resultados.items():
+            if self._tarefas[nome].reter or nome in pedidos:
+                valores[nome] = valor
+            else:
+                valores.pop(nome, None)
+        self._carregadas.update(resultados)
+
+    def versao(self, nomes: List[str]) -> Tuple[int, ...]:
+        """Versões atuais dos conjuntos (e das suas dependências), para chaves de cache"""
+        return tuple(self.versoes.get(d, 0) for n in nomes for d in self.dependencias(n))
+
+    def dependencias(self, nome: str) -> List[str]:
+        """O próprio conjunto e tudo aquilo de que depende"""
+        vistos: List[str] = []
+        pendentes = [nome]
+        while pendentes:
+            atual = pendentes.pop()
+            if atual not in vistos:
+                vistos.append(atual)
+                pendentes.extend(self._tarefas[atual].dependencias)
+        return vistos
+
+    def obter(self, nome: str, ao_progredir: Optional[Progresso] = None) -> Any:
+        """Devolve o conjunto, carregando-o (e só as dependências em falta) na primeira vez"""
+        return self.obter_varios([nome], ao_progredir)[0]
+
+    def obter_varios(self, nomes: List[str], ao_progredir: Optional[Progresso] = None) -> List[Any]:
+        """Como obter(), mas carrega todos os conjuntos em falta num só grafo (em paralelo)"""
+        if all(n in self._valores for n in nomes):
+            return [self._valores[n] for n in nomes]
+
+        # Uma sessão carrega; as outras esperam e reutilizam o resultado
+        with self._lock:
+            em_falta = self.por_carregar(nomes)
+            if not em_falta:
+                return [self._valores[n] for n in nomes]
+            # Assinaturas tiradas antes da leitura: uma alteração a meio é detetada depois
+            self._registar_assinaturas(em_falta)
+            frias = [n for n in em_falta if self._tarefas[n].em_processo and not self._em_cache(n)]
+            resultado = executar_grafo(list(self._tarefas.values()), alvos=nomes,
+                                       ao_progredir=ao_progredir,
+                                       usar_processos=len(frias) > 1,
+                                       conhecidos=self._valores)
+            self._guardar(self._valores, resultado.resultados, nomes)
+            self.erros.update(resultado.erros)
+            return [resultado.resultados[n] if n in resultado.resultados else self._valores[n] for n in nomes]
+
+    def combinar(self, nomes: List[str]) -> pd.DataFrame:
+        """Concatena partições já carregadas; o resultado fica guardado por combinação"""
+        chave = tuple(nomes)
+        combinado = self._combinados.get(chave)
+        if combinado is None:
+            versao = self.versao(nomes)
+            # Medidas ausentes em alguns anos ficam a 0, como no concat+fillna original
+            combinado = concatenar_fatos(self.obter_varios(nomes))
+            # Não guardar uma combinação de valores trocados entretanto pela vigilância
+            if self.versao(nomes) == versao:
+                self._combinados[chave] = combinado
+        return combinado
+
+    def indice(self, nomes: List[str], colunas_data: List[str]) -> IndiceFiltros:
+        """Índice de filtros da combinação, criado uma vez por versão dos conjuntos"""
+        df = self.combinar(nomes)
+        chave = tuple(nomes)
+        indice = self._indices.get(chave)
+        if indice is None or indice.df is not df:
+            indice = IndiceFiltros(df, colunas_data)
+            self._indices[chave] = indice
+        return indice
+
+    def somas(self, nomes_vendas: List[str], nomes_plano: List[str]) -> SomasAcumuladas:
+        """Somas acumuladas por dia das vendas e do plano, criadas uma vez por versão dos conjuntos"""
+        vendas, plano = self.combinar(nomes_vendas), self.combinar(nomes_plano)
+        chave = tuple(nomes_vendas) + tuple(nomes_plano)
+        somas = self._somas.get(chave)
+        if somas is None or somas.vendas is not vendas or somas.plano is not plano:
+            somas = SomasAcumuladas(vendas, plano)
+            self._somas[chave] = somas
+        return somas
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._valores.clear()
+            self._carregadas.clear()
+            self._combinados.clear()
+            self._indices.clear()
+            self._somas.clear()
+            self._assinaturas.clear()
+            self.erros.clear()
+
+    # ============================================= VIGILÂNCIA DOS FICHEIROS =============================================
+    def _registar_assinaturas(self, nomes: List[str]) -> None:
+        for nome in nomes:
+            for arquivo in self._tarefas[nome].arquivos:
+                self._assinaturas[arquivo] = assinatura_ficheiro(arquivo)
+
+    def _dependentes(self, nomes: List[str]) -> List[str]:
+        """Conjuntos carregados que dependem (direta ou indiretamente) de 'nomes'"""
+        afetados = set(nomes)
+        mudou = True
+        while mudou:
+            mudou = False
+            for tarefa in self._tarefas.values():
+                if tarefa.nome not in afetados and afetados.intersection(tarefa.dependencias):
+                    afetados.add(tarefa.nome)
+                    mudou = True
+        return [n for n in self._tarefas if n in afetados and n in self._carregadas]
+
+    def obsoletos(self) -> List[str]:
+        """Conjuntos carregados cujos ficheiros de origem mudaram desde a leitura"""
+        alterados = [
+            nome for nome in list(self._carregadas)
+            if any(assinatura_ficheiro(a) != self._assinaturas.get(a) for a in self._tarefas[nome].arquivos)
+        ]
+        return self._dependentes(alterados) if alterados else []
+
+    def reconstruir(self, nomes: List[str]) -> None:
+        """
+        Volta a calcular 'nomes' reutilizando tudo o resto. Os valores antigos
+        continuam a ser servidos e são trocados de uma só vez no fim.
+        """
+        with self._lock:
+            nomes = [n for n in nomes if n in self._carregadas]
+            if not nomes:
+                return
+            self.em_reconstrucao = nomes
+            try:
+                inicio = time.perf_counter()
+                conhecidos = {k: v for k, v in self._valores.items() if k not in nomes}
+                # Só os conjuntos em memória são refeitos; intermédios libertados voltam a ser lidos
+                alvos = [n for n in nomes if n in self._valores]
+                em_falta = self.por_carregar(alvos, conhecidos)
+                self._registar_assinaturas(list(set(em_falta) | set(nomes)))
+                frias = [n for n in em_falta if self._tarefas[n].em_processo and not self._em_cache(n)]
+                resultado = executar_grafo(list(self._tarefas.values()), alvos=alvos,
+                                           usar_processos=len(frias) > 1, conhecidos=conhecidos)
+                valores = dict(self._valores)
+                self._guardar(valores, resultado.resultados, alvos)
+                for nome in nomes:
+                    self.erros.pop(nome, None)
+                self.erros.update(resultado.erros)
+                self._combinados = {c: df for c, df in self._combinados.items() if not set(c) & set(nomes)}
+                self._indices = {c: i for c, i in self._indices.items() if not set(c) & set(nomes)}
+                self._somas = {c: s for c, s in self._somas.items() if not set(c) & set(nomes)}
+                self._valores = valores
+                for nome in nomes:
+                    self.versoes[nome] = self.versoes.get(nome, 0) + 1
+                logger.info(f"Reconstruídos {', '.join(nomes)} em {time.perf_counter() - inicio:.2f} s")
+            finally:
+                self.em_reconstrucao = []
+
+    def _seguir_armazem(self) -> List[str]:
+        """
+        Se o ponteiro do armazém analítico mudou (armazém criado, versão nova ou
+        removido), refaz o grafo com tarefas_armazem e devolve os conjuntos
+        carregados, que passam a vir da nova origem.
+        """
+        if not self._usar_armazem:
+            return []
+        assinatura = assinatura_ficheiro(str(armazem_analitico.PONTEIRO_ATUAL))
+        if assinatura == self._assinatura_armazem:
+            return []
+        with self._lock:
+            self._assinatura_armazem = assinatura
+            self._tarefas = {t.nome: t for t in tarefas_armazem(self._tarefas_base)}
+            return [n for n in self._carregadas if n in self._tarefas]
+
+    def verificar(self) -> List[str]:
+        """Verifica os ficheiros agora e reconstrói o que mudou; devolve os conjuntos refeitos"""
+        nomes = list(dict.fromkeys(self._seguir_armazem() + self.obsoletos()))
+        if nomes:
+            logger.info(f"Ficheiros de origem alterados, a reconstruir: {', '.join(nomes)}")
+            self.reconstruir(nomes)
+        return nomes
+
+    def pedir_verificacao(self) -> None:
+        """Antecipa a próxima verificação da thread de vigilância"""
+        self.iniciar_vigilancia()
+        self._verificar_agora.set()
+
+    def iniciar_vigilancia(self, intervalo: float = INTERVALO_VIGILANCIA) -> None:
+        """Arranca (uma vez por processo) a thread que vigia os ficheiros de origem"""
+        with self._lock:
+            if self._vigilante is not None and self._vigilante.is_alive():
+                return
+
+            def vigiar():
+                while True:
+                    self._verificar_agora.wait(intervalo)
+                    self._verificar_agora.clear()
+                    try:
+                        self.verificar()
+                    except Exception as e:
+                        logger.error(f"Erro na vigilância dos ficheiros de origem: {e}")
+
+            self._vigilante = threading.Thread(target=vigiar, name='vigilancia-dados', daemon=True)
+            self._vigilante.start()
+
+# Instância única partilhada por todas as sessões do processo
+camada_dados = CamadaDados(tarefas_carregamento(anos_configurados(), ano_ativo()), fonte_em_cache, usar_armazem=True)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Carregador Paralelo – Petromoc, SA
+Executa um grafo de tarefas de carregamento: as fontes Excel independentes
+correm em simultâneo num pool de processos (a interpretação é CPU-bound e
+presa ao GIL) e as etapas dependentes correm no processo principal assim
+que as suas dependências terminam.
+"""
+
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Tarefa(NamedTuple):
+    """
+    Nó do grafo de carregamento.
+    'funcao' recebe os resultados das dependências pela ordem declarada.
+    Tarefas 'em_processo' têm de ser funções de módulo (serializáveis) sem
+    dependências; o valor 'padrao' substitui o resultado quando a tarefa falha.
+    'arquivos' são os ficheiros lidos diretamente pela tarefa (para vigilância).
+    Resultados com 'reter' falso são intermédios: a camada de dados liberta-os
+    depois de calculados os dependentes e volta a calculá-los se preciso.
+    """
+    nome: str
+    funcao: Callable[..., Any]
+    dependencias: Tuple[str, ...] = ()
+    em_processo: bool = False
+    padrao: Any = None
+    arquivos: Tuple[str, ...] = ()
+    reter: bool = True
+
+# Callback de progresso: (nome, estado, segundos) com estado em
+# 'iniciada', 'concluida' ou 'falhou'. É sempre chamado no processo principal.
+Progresso = Callable[[str, str, Optional[float]], None]
+
+class ResultadoGrafo(NamedTuple):
+    resultados: Dict[str, Any]
+    erros: Dict[str, Exception]
+    tempos: Dict[str, float]
+    segundos_total: float
+
+# ============================================= GRAFO =============================================
+def _ordenar(tarefas: Dict[str, Tarefa], alvos: Iterable[str], conhecidos: Dict[str, Any]) -> List[str]:
+    """Fecho das dependências dos alvos ainda por calcular, em ordem topológica"""
+    ordem: List[str] = []
+    visitando = set()
+
+    def visitar(nome: str):
+        if nome in ordem or nome in conhecidos:
+            return
+        if nome in visitando:
+            raise ValueError(f"Dependência circular no carregamento: {nome}")
+        if nome not in tarefas:
+            raise KeyError(f"Tarefa de carregamento desconhecida: {nome}")
+        visitando.add(nome)
+        for dep in tarefas[nome].dependencias:
+            visitar(dep)
+        visitando.discard(nome)
+        ordem.append(nome)
+
+    for alvo in alvos:
+        visitar(alvo)
+    return ordem
+
+def _criar_pool(num_processos: int) -> Optional[ProcessPoolExecutor]:
+    """Pool com 'spawn': os processos não herdam threads nem estado do Streamlit"""
+    try:
+        return ProcessPoolExecutor(max_workers=num_processos,
+                                   mp_context=multiprocessing.get_context('spawn'))
+    except (OSError, NotImplementedError) as e:
+        logger.warning(f"Pool de processos indisponível, carregamento sequencial: {e}")
+        return None
+
+# sys.modules é do processo inteiro e as sessões do Streamlit correm em threads:
+# só um carregamento de cada vez pode trocar e repor o __main__
+_lock_principal = threading.Lock()
+
+@contextmanager
+def _sem_script_principal():
+    """
+    O Streamlit regista o script da página como __main__; com 'spawn' cada
+    processo novo voltaria a executá-lo. Enquanto o pool cria os processos,
+    __main__ passa a ser um módulo vazio.
+    """
+    with _lock_principal:
+        principal = sys.modules.get('__main__')
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = principal
+
+def executar_grafo(tarefas: List[Tarefa], alvos: Optional[Iterable[str]] = None,
+                   ao_progredir: Optional[Progresso] = None,
+                   usar_processos: bool = True, max_processos: Optional[int] = None,
+                   conhecidos: Optional[Dict[str, Any]] = None) -> ResultadoGrafo:
+    """
+    Executa os alvos (por omissão todas as tarefas) e as suas dependências.
+    Tarefas presentes em 'conhecidos' não voltam a correr e o seu valor é
+    reutilizado. Uma tarefa que falha fica com o seu valor 'padrao' e o grafo
+    continua, tal como os carregadores individuais devolviam DataFrames vazios.
+    """
+    por_nome = {t.nome: t for t in tarefas}
+    conhecidos = conhecidos or {}
+    ordem = _ordenar(por_nome, alvos if alvos is not None else list(por_nome), conhecidos)
+
+    resultados: Dict[str, Any] = {}
+    erros: Dict[str, Exception] = {}
+    tempos: Dict[str, float] = {}
+    inicios: Dict[str, float] = {}
+    avisar = ao_progredir or (lambda *_: None)
+    inicio_total = time.perf_counter()
+
+    def concluir(nome: str, obter: Callable[[], Any]):
+        try:
+            resultados[nome] = obter()
+            tempos[nome] = time.perf_counter() - inicios[nome]
+            avisar(nome, 'concluida', tempos[nome])
+        except Exception as e:
+            tempos[nome] = time.perf_counter() - inicios[nome]
+            logger.error(f"Falha ao carregar '{nome}': {e}")
+            erros[nome] = e
+            resultados[nome] = por_nome[nome].padrao
+            avisar(nome, 'falhou', tempos[nome])
+
+    externas = [n for n in ordem if por_nome[n].em_processo]
+    pool = None
+    if usar_processos and len(externas) > 1:
+        pool = _criar_pool(min(len(externas), max_processos or os.cpu_count() or 1))
+
+    pendentes: Dict[Future, str] = {}
+    try:
+        # As fontes independentes arrancam todas de imediato
+        if pool is not None:
+            with _sem_script_principal():
+                for nome in externas:
+                    inicios[nome] = time.perf_counter()
+                    avisar(nome, 'iniciada', None)
+                    pendentes[pool.submit(por_nome[nome].funcao)] = nome
+
+        while len(resultados) < len(ordem):
+            # Tudo o que já tem dependências satisfeitas corre aqui
+            avancou = False
+            for nome in ordem:
+                tarefa = por_nome[nome]
+                if nome in resultados or nome in inicios:
+                    continue
+                if all(d in resultados or d in conhecidos for d in tarefa.dependencias):
+                    inicios[nome] = time.perf_counter()
+                    avisar(nome, 'iniciada', None)
+                    argumentos = [resultados[d] if d in resultados else conhecidos[d]
+                                  for d in tarefa.dependencias]
+                    concluir(nome, lambda: tarefa.funcao(*argumentos))
+                    avancou = True
+
+            if avancou:
+                continue
+            if not pendentes:
+                break
+
+            prontos, _ = wait(list(pendentes), return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                concluir(pendentes.pop(futuro), futuro.result)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    resultado = ResultadoGrafo(resultados, erros, tempos, time.perf_counter() - inicio_total)
+    if ordem:
+        registar_resumo(resultado, pool is not None)
+    return resultado
+
+def registar_resumo(resultado: ResultadoGrafo, paralelo: bool) -> None:
+    """Escreve no log o tempo de cada tarefa e o ganho face à execução sequencial"""
+    soma = sum(resultado.tempos.values())
+    linhas = [f"  {nome:<20} {segundos:8.2f} s{'  (falhou)' if nome in resultado.erros else ''}"
+              for nome, segundos in sorted(resultado.tempos.items(), key=lambda x: -x[1])]
+    logger.info(
+        f"Carregamento {'paralelo' if paralelo else 'sequencial'} concluído em "
+        f"{resultado.segundos_total:.2f} s (soma das tarefas: {soma:.2f} s)\n" + "\n".join(linhas)
+    )
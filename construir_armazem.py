@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Construção do Armazém Analítico – Petromoc, SA
+Comando sem Streamlit que corre todo o carregamento (leitura dos Excel,
+limpeza, junções das vendas e do plano com os lookups, cubos) e grava o resultado
+numa versão nova do armazém analítico, aberta depois pela aplicação web.
+
+Uso:
+    python construir_armazem.py                 # anos do config.json
+    python construir_armazem.py --anos 2024 2025
+    python construir_armazem.py --sequencial    # sem pool de processos
+"""
+
+import argparse
+import logging
+import sys
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from armazem_analitico import DIRETORIO_ARMAZEM_ANALITICO, gravar_versao
+from camada_dados import assinatura_ficheiro, tarefas_carregamento
+from carregador_paralelo import executar_grafo
+from fontes_dados import ano_ativo, anos_configurados, nome_particao, relatorio_memoria
+
+logger = logging.getLogger('construir_armazem')
+
+def construir(anos: List[int], usar_processos: bool = True) -> int:
+    """Constrói e publica uma versão; devolve o código de saída (1 se alguma fonte falhou)"""
+    tarefas = tarefas_carregamento(anos, ano_ativo())
+    alvos = ['importacao', 'quota_mercado'] + [nome_particao(conjunto, ano) for ano in anos
+                              for conjunto in ('fatos_vendas', 'fatos_plano', 'cubo_vendas', 'cubo_plano')]
+    resultado = executar_grafo(tarefas, alvos=alvos, usar_processos=usar_processos)
+
+    # Conjuntos com falha (própria ou de uma dependência) ficam fora da versão:
+    # a aplicação volta a calculá-los a partir dos Excel
+    por_nome = {t.nome: t for t in tarefas}
+    def falhou(nome: str) -> bool:
+        return nome in resultado.erros or any(falhou(d) for d in por_nome[nome].dependencias)
+
+    conjuntos = {nome: resultado.resultados[nome] for nome in alvos if not falhou(nome)}
+    fontes = {arquivo: assinatura_ficheiro(arquivo)
+              for tarefa in tarefas if tarefa.nome in resultado.resultados
+              for arquivo in tarefa.arquivos}
+    erros = {nome: str(e) for nome, e in resultado.erros.items()}
+
+    versao = gravar_versao(conjuntos, fontes, erros)
+    logger.info(f"Armazém analítico {DIRETORIO_ARMAZEM_ANALITICO / versao}: "
+                + ", ".join(f"{n} ({len(df)})" for n, df in conjuntos.items()))
+    for nome, erro in erros.items():
+        logger.error(f"Falha em '{nome}': {erro}")
+    registar_memoria(conjuntos)
+    return 1 if erros else 0
+
+def registar_memoria(conjuntos: Dict[str, pd.DataFrame]) -> None:
+    """Escreve no log a memória de cada coluna dos factos e cubos com e sem o esquema compacto"""
+    for nome, df in conjuntos.items():
+        if not nome.startswith(('fatos_', 'cubo_')) or df.empty:
+            continue
+        relatorio = relatorio_memoria(df)
+        atual, largo = relatorio['Bytes'].sum(), relatorio['Bytes sem esquema'].sum()
+        logger.info(f"Memória de '{nome}': {atual / 1e6:.2f} MB (sem esquema {largo / 1e6:.2f} MB, "
+                    f"-{100 * (1 - atual / largo):.0f}%)\n" + relatorio.to_string(index=False))
+
+def main(argumentos: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Constrói o armazém analítico da Petromoc a partir dos Excel")
+    parser.add_argument('--anos', type=int, nargs='+', help="anos de vendas/plano (por omissão, os do config.json)")
+    parser.add_argument('--sequencial', action='store_true', help="não usar o pool de processos")
+    opcoes = parser.parse_args(argumentos)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return construir(opcoes.anos or anos_configurados(), usar_processos=not opcoes.sequencial)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Conversão de Volumes TM → m³ – Petromoc, SA
+Densidades dos combustíveis e conversão de toneladas métricas em metros
+cúbicos, sem dependência do Streamlit. A conversão de colunas inteiras é
+vetorizada: cada nome de combustível distinto é normalizado uma só vez e
+as linhas recebem a densidade por código (categoria), de modo que totais
+com vários combustíveis usam a densidade de cada linha.
+"""
+
+import re
+import unicodedata
+from typing import Any, Union
+
+import numpy as np
+import pandas as pd
+
+# ============================================= DENSIDADE DOS COMBUSTÍVEIS ==========================================
+# Toneladas por m³
+DENSIDADES = {
+    'Gasolina': 0.73,
+    'Jet A1': 0.79,
+    'Gasóleo': 0.84,
+    'Diesel': 0.84
+}
+
+# Grafias encontradas nas fontes (minúsculas, sem acentos, '_' e '-' como espaço)
+SINONIMOS_COMBUSTIVEL = {
+    'gasoleo': 'Gasóleo',
+    'diesel': 'Gasóleo',
+    'gasolina': 'Gasolina',
+    'jet': 'Jet A1',
+    'jet a1': 'Jet A1',
+    # Combustível em branco: gasóleo, como na conversão original
+    '': 'Gasóleo',
+}
+
+_SEPARADORES = re.compile(r'[\s_-]+')
+
+def normalizar_combustivel(combustivel: Any) -> str:
+    """Nome canónico do combustível ('Jet_A1', 'jet-a1' → 'Jet A1'); desconhecidos ficam como vieram"""
+    texto = '' if combustivel is None or (isinstance(combustivel, float) and combustivel != combustivel) \
+        else str(combustivel).strip()
+    sem_acentos = ''.join(c for c in unicodedata.normalize('NFKD', texto.lower()) if not unicodedata.combining(c))
+    return SINONIMOS_COMBUSTIVEL.get(_SEPARADORES.sub(' ', sem_acentos).strip(), texto.title())
+
+def densidade(combustivel: Any) -> float:
+    """Densidade do combustível (NaN se desconhecido)"""
+    return DENSIDADES.get(normalizar_combustivel(combustivel), np.nan)
+
+# ============================================= CONVERSÃO VETORIZADA ==========================================
+def densidades_por_linha(combustiveis: pd.Series) -> np.ndarray:
+    """Densidade de cada linha: uma consulta por combustível distinto e um 'take' pelos códigos"""
+    categorias = combustiveis.astype('category') if not isinstance(combustiveis.dtype, pd.CategoricalDtype) \
+        else combustiveis
+    # Última posição da tabela: linhas sem combustível (código -1)
+    tabela = np.array([densidade(c) for c in categorias.cat.categories] + [densidade(None)], dtype='float64')
+    return tabela[categorias.cat.codes.to_numpy()]
+
+def tm_para_m3(quantidades_tm: Union[np.ndarray, pd.Series, pd.DataFrame],
+               densidades: np.ndarray) -> np.ndarray:
+    """
+    Converte uma coluna (n) ou várias (n × k) de TM em m³ com a densidade de
+    cada linha, numa só multiplicação. Quantidades vazias e linhas sem
+    densidade conhecida valem 0, como em converter_tm_para_m3_seguro.
+    """
+    valores = np.nan_to_num(np.asarray(quantidades_tm, dtype='float64'))
+    inversas = np.zeros(len(densidades))
+    conhecidas = np.isfinite(densidades) & (densidades > 0)
+    inversas[conhecidas] = 1.0 / densidades[conhecidas]
+    return valores * (inversas if valores.ndim == 1 else inversas[:, None])
+
+def converter_tm_para_m3_seguro(quantidade_tm: float, combustivel: str) -> float:
+    """Conversão segura de TM para M³ de um só valor (0 se o combustível for desconhecido)"""
+    try:
+        if quantidade_tm == 0 or pd.isna(quantidade_tm):
+            return 0.0
+        d = densidade(combustivel)
+        return quantidade_tm / d if d == d else 0.0
+    except Exception:
+        return 0.0
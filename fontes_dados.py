@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+"""
+Fontes de Dados – Petromoc, SA
+Leitura das fontes Excel e etapas de processamento (junções com os lookups
+e junção do plano) sem dependência do Streamlit, para poderem correr em
+processos de trabalho do carregador paralelo.
+"""
+
+import json
+import logging
+import os
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cache_snapshots import ler_com_snapshot, ler_excel_snapshot, snapshot_valido
+from leitor_streaming import TIPO_DATA, TIPO_DECIMAL, TIPO_INTEIRO, TIPO_TEXTO, ler_folha_projetada, texto_para_float
+from registro_workbooks import registro_workbooks
+
+logger = logging.getLogger(__name__)
+
+# ============================================= CONFIGURAÇÃO =============================================
+ARQUIVO_CONFIGURACAO = os.environ.get('PETROMOC_CONFIG', 'config.json')
+
+CONFIGURACAO_PADRAO = {
+    'start_year': 2023,
+    'end_year': 2025,
+    'files': {
+        'vendas': ['Vds_{year}_Comb_.xlsx'],
+        'plano': ['PlanComb_{year}.xlsx'],
+        'importacao': ['ImportacaoMZ.xlsx'],
+    }
+}
+
+def carregar_configuracao(caminho: str = ARQUIVO_CONFIGURACAO) -> Dict[str, Any]:
+    """Lê o config.json; sem ficheiro (ou inválido) usa a configuração padrão"""
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            configuracao = json.load(f)
+    except FileNotFoundError:
+        return CONFIGURACAO_PADRAO
+    except ValueError as e:
+        logger.warning(f"{caminho} inválido, a usar configuração padrão: {e}")
+        return CONFIGURACAO_PADRAO
+
+    arquivos = {**CONFIGURACAO_PADRAO['files'], **configuracao.get('files', {})}
+    return {**CONFIGURACAO_PADRAO, **configuracao, 'files': arquivos}
+
+CONFIGURACAO = carregar_configuracao()
+
+# ============================================= PARTIÇÕES POR ANO =============================================
+def anos_configurados() -> List[int]:
+    """Anos de start_year a end_year (end_year nulo = ano corrente)"""
+    fim = CONFIGURACAO.get('end_year') or date.today().year
+    return list(range(int(CONFIGURACAO['start_year']), int(fim) + 1))
+
+def ano_ativo() -> int:
+    """Ano cujos ficheiros ainda mudam: active_year do config ou o ano corrente (limitado aos configurados)"""
+    anos = anos_configurados()
+    return int(CONFIGURACAO.get('active_year') or min(max(date.today().year, anos[0]), anos[-1]))
+
+def anos_no_intervalo(intervalo: Tuple[date, ...]) -> List[int]:
+    """Anos configurados que se sobrepõem ao intervalo de datas"""
+    if not intervalo:
+        return anos_configurados()
+    inicio, fim = intervalo[0], intervalo[-1]
+    return [ano for ano in anos_configurados() if inicio.year <= ano <= fim.year]
+
+def candidatos_do_ano(fonte: str, ano: int) -> List[str]:
+    """Caminhos possíveis do ficheiro do ano, pela ordem dos padrões de config.json"""
+    padroes = CONFIGURACAO['files'][fonte]
+    if isinstance(padroes, str):
+        padroes = [padroes]
+    return [p.format(year=ano) for p in padroes]
+
+def arquivo_do_ano(fonte: str, ano: int) -> str:
+    """Primeiro padrão de config.json que existe para o ano (ou o primeiro, se nenhum existir)"""
+    candidatos = candidatos_do_ano(fonte, ano)
+    return next((c for c in candidatos if os.path.exists(c)), candidatos[0])
+
+def nome_particao(conjunto: str, ano: int) -> str:
+    return f"{conjunto}:{ano}"
+
+# ============================================= ARQUIVOS =============================================
+# Todas as folhas do lookup são lidas numa só abertura do livro e partilhadas
+ARQUIVO_LOOKUP = 'v_loock_up.xlsx'
+FOLHAS_LOOKUP = [0, 1, 2, 3, 4, 5]
+
+# Um só livro para todos os anos: primeiro caminho de files.importacao que existe
+ARQUIVO_IMPORTACAO = arquivo_do_ano('importacao', ano_ativo())
+
+CLIENTES_CONGENERES = [
+    "AFR PETR", "B ENERGY", "BP", "CAC", "CAMEL", "DALBIT", "ENER", "EXOR",
+    "GLENCORE", "GTS", "IPM", "I2A", "LAKE OIL", "LIBERTY", "MCCI", "MITRA",
+    "MOUMERU", "MOZTOP", "NGUVU L", "PETRODA", "PETROGAL", "PESS", "PUMA",
+    "RUR", "TOP ENERGY", "TOTAL", "UNION", "VIVO"
+]
+
+# Colunas da ImportacaoMZ usadas pela aplicação e respetivo tipo.
+# As restantes colunas da folha não chegam a ser convertidas nem guardadas.
+COLUNAS_IMPORTACAO = {
+    'Ano': TIPO_INTEIRO,
+    'Mes': TIPO_TEXTO,
+    'Situacao_Descarga': TIPO_TEXTO,
+    'Porto': TIPO_TEXTO,
+    'Combustivel': TIPO_TEXTO,
+    'NOR': TIPO_DATA,
+    'Data_Descarga': TIPO_DATA,
+    'Qtd_Petro_TM': TIPO_DECIMAL,
+    'Qtd_FH_( TM)': TIPO_DECIMAL,
+    'Banco_GB': TIPO_TEXTO,
+    'ValorLimite_GB': TIPO_DECIMAL,
+    'Valor_GB': TIPO_DECIMAL,
+    **{c: TIPO_DECIMAL for c in CLIENTES_CONGENERES},
+}
+VERSAO_LEITURA_IMPORTACAO = 'projecao-4'
+COLUNAS_DECIMAIS_IMPORTACAO = [c for c, tipo in COLUNAS_IMPORTACAO.items() if tipo == TIPO_DECIMAL]
+
+def normalizar_lookup_clientes(v0: pd.DataFrame) -> pd.DataFrame:
+    """Normaliza a folha de clientes (v0) antes de ir para o snapshot"""
+    if 'DataCriacaoCliente' in v0.columns:
+        v0['DataCriacaoCliente'] = pd.to_datetime(v0['DataCriacaoCliente'], format='%d/%m/%Y', errors='coerce')
+    return v0
+
+# Declarado ao importar o módulo, também em cada processo de trabalho
+registro_workbooks.declarar(ARQUIVO_LOOKUP, FOLHAS_LOOKUP)
+registro_workbooks.registar_normalizador(ARQUIVO_LOOKUP, 0, normalizar_lookup_clientes)
+
+# ============================================= NORMALIZAÇÃO NUMÉRICA =============================================
+def normalizar_numericos(df: pd.DataFrame, colunas: List[str]) -> pd.DataFrame:
+    """
+    Etapa única de conversão das 'colunas' para float64. Colunas já numéricas
+    passam sem cópia; as de texto são convertidas pelo texto_para_float, uma
+    vez por valor distinto. Células em branco ficam NaN sem contar como falha;
+    as que falharam, por coluna, somam-se às já registadas em
+    df.attrs['falhas_conversao'] (e também ficam NaN).
+    """
+    falhas = dict(df.attrs.get('falhas_conversao', {}))
+    convertidas = {}
+    for coluna in colunas:
+        if coluna not in df.columns or pd.api.types.is_numeric_dtype(df[coluna]):
+            continue
+        serie = df[coluna]
+        unicos = pd.unique(serie.dropna())
+        numeros = {v: float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else texto_para_float(str(v))
+                   for v in unicos}
+        convertidas[coluna] = serie.map(numeros).astype('float64')
+        invalidos = [v for v, numero in numeros.items() if numero != numero and str(v).strip()]
+        n_falhas = int(serie.isin(invalidos).sum()) if invalidos else 0
+        if n_falhas:
+            falhas[coluna] = falhas.get(coluna, 0) + n_falhas
+    resultado = df.assign(**convertidas) if convertidas else df
+    resultado.attrs['falhas_conversao'] = falhas
+    if convertidas:
+        logger.info(f"Colunas numéricas convertidas de texto: {list(convertidas)}; falhas: {falhas or 'nenhuma'}")
+    return resultado
+
+# ============================================= LEITURA DAS FONTES =============================================
+def ler_vendas_ano(ano: int) -> pd.DataFrame:
+    """Lê a partição de vendas do ano (valores na moeda original, com o Cambio de cada linha)"""
+    arquivo = arquivo_do_ano('vendas', ano)
+    if not os.path.exists(arquivo):
+        logger.warning(f"Arquivo {arquivo} não encontrado")
+        return pd.DataFrame()
+
+    df = ler_excel_snapshot(arquivo).fillna(0)
+    logger.info(f"Arquivo {arquivo} carregado: {len(df)} registros")
+
+    # Processamento de datas
+    df['Data_Facturacao'] = pd.to_datetime(df['Data_Facturacao'], errors='coerce')
+    df['Ano'] = df['Data_Facturacao'].dt.year.fillna(0).astype(int)
+    df['Mes'] = df['Data_Facturacao'].dt.month.fillna(0).astype(int)
+
+    return df
+
+def ler_plano_ano(ano: int) -> pd.DataFrame:
+    """Lê a partição do plano do ano"""
+    arquivo = arquivo_do_ano('plano', ano)
+    if not os.path.exists(arquivo):
+        logger.warning(f"Arquivo {arquivo} não encontrado")
+        return pd.DataFrame()
+
+    df = ler_excel_snapshot(arquivo).fillna(0)
+    df['Data_Facturacao'] = pd.to_datetime(df['Data_Facturacao'], format='%d/%m/%Y', errors='coerce')
+    return df
+
+def ler_lookups() -> Tuple[pd.DataFrame, ...]:
+    """Devolve as seis folhas do lookup (v0..v5)"""
+    folhas = registro_workbooks.folhas(ARQUIVO_LOOKUP, FOLHAS_LOOKUP)
+    return tuple(folhas[f] for f in FOLHAS_LOOKUP)
+
+def ler_importacao() -> pd.DataFrame:
+    """
+    Lê só as colunas usadas da ImportacaoMZ (ver COLUNAS_IMPORTACAO), com as
+    quantidades e valores já em float64: a quota de mercado lê-os diretamente.
+    """
+    df = ler_com_snapshot(
+        ARQUIVO_IMPORTACAO, 0,
+        lambda: ler_folha_projetada(ARQUIVO_IMPORTACAO, COLUNAS_IMPORTACAO),
+        versao=VERSAO_LEITURA_IMPORTACAO
+    )
+    return normalizar_numericos(df, COLUNAS_DECIMAIS_IMPORTACAO)
+
+def fonte_em_cache(nome: str) -> bool:
+    """Indica se todos os ficheiros da fonte têm snapshot válido (leitura rápida)"""
+    fonte, _, ano = nome.partition(':')
+    try:
+        if fonte in ('vendas', 'plano'):
+            arquivo = arquivo_do_ano(fonte, int(ano))
+            return not os.path.exists(arquivo) or snapshot_valido(arquivo)
+        if fonte == 'lookups':
+            return all(snapshot_valido(ARQUIVO_LOOKUP, f) for f in FOLHAS_LOOKUP)
+        if fonte == 'importacao':
+            return snapshot_valido(ARQUIVO_IMPORTACAO, 0, VERSAO_LEITURA_IMPORTACAO)
+    except OSError:
+        return False
+    return False
+
+# ============================================= ESQUEMA DOS FACTOS =============================================
+# float32 só quando a conversão não altera nenhum valor mais do que TOLERANCIA_FLOAT32
+# (volumes passam sempre; montantes grandes com cêntimos ficam em float64)
+TIPO_DECIMAL_COMPACTO = 'float32'
+TOLERANCIA_FLOAT32 = 0.005
+
+# Tipo de cada coluna das tabelas de factos de vendas e de plano. Texto fica
+# em category (códigos inteiros) com nulos em vez de 0; colunas de texto não
+# declaradas passam a category se tiverem poucos valores distintos.
+ESQUEMA_FATOS = {
+    'Data_Facturacao': TIPO_DATA,
+    'DataCriacaoCliente': TIPO_DATA,
+    'Ano': 'int16',
+    'Mes': 'int8',
+    'Dia': 'int8',
+    'CE': 'int32',
+    'Emissor': 'int32',
+    'CDst': 'int32',
+    'Cambio': TIPO_DECIMAL,
+    'Vendas m³': TIPO_DECIMAL_COMPACTO,
+    'Plano_m³': TIPO_DECIMAL_COMPACTO,
+    'Plano': TIPO_DECIMAL_COMPACTO,
+    'Quantidade_Plano': TIPO_DECIMAL_COMPACTO,
+    'Meta': TIPO_DECIMAL_COMPACTO,
+    **{c: TIPO_DECIMAL_COMPACTO for c in ('V_Liquido', 'V_Imposto', 'Custo_Produto', 'Margem_Vendas',
+                                          'V_Venda_Oceanica', 'Desconto', 'Valor_ISC')},
+    **{c: TIPO_TEXTO for c in ('Material', 'SiglaInst.', 'Instalação', 'Região', 'Provincia', 'ESTADO',
+                               'Nome_do_Cliente', 'Gestor / Promotor', 'Sector/Sigla', 'Cond. Pagamento',
+                               'Regime de Preço', 'CAI', 'Code Setor 1', 'Classe', 'Classificação',
+                               'DomicilioCliente', 'Linha Neg.', 'Combustivel', 'C.D', 'CanalDist',
+                               'SegMercado')},
+}
+
+# Texto não declarado com até esta fração de valores distintos passa a category
+FRACAO_MAXIMA_CATEGORIA = 0.5
+
+def _converter_coluna(serie: pd.Series, tipo: str) -> pd.Series:
+    if tipo == TIPO_TEXTO:
+        # 0 deixado pelos fillna antigos é um nulo, não um valor
+        if serie.dtype == object:
+            serie = serie.mask(serie.eq(0))
+        return serie.astype('category')
+    if tipo == TIPO_DATA:
+        return pd.to_datetime(serie, errors='coerce')
+    numeros = pd.to_numeric(serie, errors='coerce')
+    if tipo == TIPO_DECIMAL_COMPACTO:
+        compacto = numeros.astype('float32')
+        erro = np.abs(compacto.to_numpy(dtype='float64') - numeros.to_numpy(dtype='float64'))
+        return compacto if not len(erro) or np.nanmax(erro, initial=0) <= TOLERANCIA_FLOAT32 else numeros.astype('float64')
+    if tipo.startswith('int'):
+        # Inteiros só se couberem no tipo declarado e não houver nulos
+        limites = np.iinfo(tipo)
+        if numeros.isna().any() or numeros.min() < limites.min or numeros.max() > limites.max:
+            return numeros
+    return numeros.astype(tipo)
+
+def aplicar_esquema(df: pd.DataFrame, esquema: Dict[str, str] = ESQUEMA_FATOS) -> pd.DataFrame:
+    """
+    Converte as colunas para o tipo declarado em 'esquema'. Medidas nulas
+    ficam a 0, como no fillna(0) original; texto e datas ficam nulos.
+    """
+    if df.empty:
+        return df
+    convertidas = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        tipo = esquema.get(coluna)
+        if tipo is None:
+            if serie.dtype == object and serie.nunique() <= FRACAO_MAXIMA_CATEGORIA * len(serie):
+                tipo = TIPO_TEXTO
+            elif pd.api.types.is_numeric_dtype(serie) and serie.hasnans:
+                convertidas[coluna] = serie.fillna(0)
+                continue
+            else:
+                continue
+        if tipo not in (TIPO_TEXTO, TIPO_DATA):
+            serie = pd.to_numeric(serie, errors='coerce').fillna(0)
+        if serie.dtype != tipo:
+            convertidas[coluna] = _converter_coluna(serie, tipo)
+    return df.assign(**convertidas) if convertidas else df
+
+def ordenar_por_data(df: pd.DataFrame, coluna: str = 'Data_Facturacao') -> pd.DataFrame:
+    """Factos por ordem da data: um intervalo de datas passa a ser um bloco contínuo de linhas"""
+    if df.empty or coluna not in df.columns or df[coluna].is_monotonic_increasing:
+        return df
+    return df.sort_values(coluna, kind='stable', ignore_index=True)
+
+def preencher_medidas(df: pd.DataFrame) -> pd.DataFrame:
+    """fillna(0) só nas colunas numéricas (texto e datas mantêm o nulo)"""
+    numericas = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c]) and df[c].hasnans]
+    return df.assign(**{c: df[c].fillna(0) for c in numericas}) if numericas else df
+
+def concatenar_fatos(partes: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    pd.concat de partições de factos sem perder as colunas category (as
+    categorias são unidas antes) e com 0 nas medidas ausentes nalguma parte.
+    """
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame()
+    if len(partes) == 1:
+        return partes[0]
+
+    categoricas = {c for p in partes for c in p.columns if isinstance(p[c].dtype, pd.CategoricalDtype)}
+    for coluna in categoricas:
+        categorias = pd.Index([])
+        for p in partes:
+            if coluna in p.columns:
+                atuais = p[coluna].cat.categories if isinstance(p[coluna].dtype, pd.CategoricalDtype) \
+                    else pd.Index(p[coluna].dropna().unique())
+                categorias = categorias.append(atuais[~atuais.isin(categorias)])
+        partes = [p.assign(**{coluna: pd.Categorical(p[coluna], categories=categorias)})
+                  if coluna in p.columns else p for p in partes]
+
+    combinado = pd.concat(partes, ignore_index=True)
+    if any(len(p.columns) != len(combinado.columns) for p in partes):
+        combinado = preencher_medidas(combinado)
+    return combinado
+
+def mascara_valores(serie: pd.Series, valores: List[Any]) -> np.ndarray:
+    """
+    serie.astype(str).isin(valores) como nos filtros do painel; em colunas
+    category só as categorias são comparadas e as linhas pelos códigos inteiros.
+    """
+    textos = [str(v) for v in valores]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        selecionadas = np.isin(serie.cat.categories.astype(str), textos)
+        # Código -1 (nulo) aponta para o False acrescentado no fim
+        return np.append(selecionadas, False)[serie.cat.codes.to_numpy()]
+    return serie.astype(str).isin(textos).to_numpy()
+
+def relatorio_memoria(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Memória de cada coluna no tipo atual e no tipo largo de antes do esquema
+    (texto em object, decimais em float64, inteiros em int64), em bytes.
+    """
+    linhas = []
+    for coluna in df.columns:
+        serie = df[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            larga = serie.astype(object)
+        elif pd.api.types.is_float_dtype(serie):
+            larga = serie.astype('float64')
+        elif pd.api.types.is_integer_dtype(serie):
+            larga = serie.astype('int64')
+        else:
+            larga = serie
+        linhas.append({
+            'Coluna': coluna,
+            'Tipo': str(serie.dtype),
+            'Bytes': int(serie.memory_usage(index=False, deep=True)),
+            'Bytes sem esquema': int(larga.memory_usage(index=False, deep=True)),
+        })
+    relatorio = pd.DataFrame(linhas, columns=['Coluna', 'Tipo', 'Bytes', 'Bytes sem esquema'])
+    relatorio['Poupança %'] = (100 * (1 - relatorio['Bytes'] / relatorio['Bytes sem esquema'].replace(0, np.nan))).round(1)
+    return relatorio.sort_values('Bytes sem esquema', ascending=False, ignore_index=True)
+
+# ============================================= PROCESSAMENTO =============================================
+def _codificar_juncao(chaves_base: pd.Series, chaves_lookup: pd.Series) -> Tuple[Optional[np.ndarray], np.ndarray]:
+    """
+    Índices de uma junção à esquerda codificada em inteiros: posição de cada
+    linha do resultado na base e no lookup (-1 sem correspondência). Chaves
+    repetidas no lookup multiplicam linhas tal como no pd.merge; sem
+    repetições a base fica como está (None).
+    """
+    codigos_lookup, dicionario = pd.factorize(chaves_lookup, use_na_sentinel=False)
+    codigos_base = pd.Index(dicionario).get_indexer(chaves_base)
+    if len(dicionario) == len(chaves_lookup):
+        return None, codigos_base
+
+    # Linhas do lookup agrupadas por código, mantendo a ordem original dentro de cada chave
+    ordem = np.argsort(codigos_lookup, kind='stable')
+    contagem = np.bincount(codigos_lookup, minlength=len(dicionario))
+    inicio = np.cumsum(contagem) - contagem
+    encontrada = codigos_base >= 0
+    repeticoes = np.where(encontrada, contagem[np.where(encontrada, codigos_base, 0)], 1)
+
+    linhas_base = np.repeat(np.arange(len(chaves_base)), repeticoes)
+    deslocamento = np.arange(len(linhas_base)) - np.repeat(np.cumsum(repeticoes) - repeticoes, repeticoes)
+    primeira = np.repeat(inicio[np.where(encontrada, codigos_base, 0)], repeticoes)
+    linhas_lookup = np.where(np.repeat(encontrada, repeticoes), ordem[primeira + deslocamento], -1)
+    return linhas_base, linhas_lookup
+
+def _juntar_lookups(base: pd.DataFrame, lookups: List[Tuple[str, pd.DataFrame]]) -> pd.DataFrame:
+    """
+    Equivalente a uma cadeia de pd.merge(how='left') pela chave de cada lookup,
+    sem copiar a tabela inteira a cada junção: cada chave é codificada em
+    inteiros uma vez e cada coluna nova é obtida por take sobre esses códigos.
+    A base só é reindexada quando um lookup tem chaves repetidas.
+    """
+    novas: Dict[str, Any] = {}
+    for chave, lookup in lookups:
+        if lookup.empty:
+            continue
+        valores_chave = novas[chave] if chave in novas else base[chave]
+        linhas_base, linhas_lookup = _codificar_juncao(pd.Series(valores_chave), lookup[chave])
+
+        if linhas_base is not None:
+            base = base.take(linhas_base)
+            novas = {c: pd.api.extensions.take(v, linhas_base) for c, v in novas.items()}
+
+        for coluna in lookup.columns:
+            if coluna == chave:
+                continue
+            destino = coluna
+            # Colunas já existentes recebem os sufixos do pd.merge
+            if coluna in novas:
+                novas[coluna + '_x'] = novas.pop(coluna)
+                destino = coluna + '_y'
+            elif coluna in base.columns:
+                base = base.rename(columns={coluna: coluna + '_x'})
+                destino = coluna + '_y'
+            # allow_fill: -1 vira nulo, com a mesma promoção de tipo do merge (int -> float)
+            novas[destino] = pd.api.extensions.take(lookup[coluna].values, linhas_lookup, allow_fill=True)
+
+    base = base.reset_index(drop=True)
+    if novas:
+        base = pd.concat([base, pd.DataFrame(novas, index=base.index)], axis=1)
+    return base
+
+def enriquecer_vendas(vendas_df: pd.DataFrame, lookups: Tuple[pd.DataFrame, ...]) -> pd.DataFrame:
+    """Junta os lookups às vendas (instalação, cliente, material, factura, canal)"""
+    if vendas_df.empty:
+        return pd.DataFrame()
+
+    v0, v1, v2, v3, v4, v5 = lookups
+
+    datas = vendas_df['Data_Facturacao'].dt
+    vendas = vendas_df.assign(Ano=datas.year, Mes=datas.month, Dia=datas.day)
+
+    # Instalação, cliente, material, factura e canal, pela ordem das junções originais
+    DateSet_MT = _juntar_lookups(vendas, [('CE', v3), ('Emissor', v0), ('Material', v5),
+                                          ('TipFt', v4), ('CDst', v1)])
+
+    if 'DataCriacaoCliente' in DateSet_MT.columns:
+        DateSet_MT['DataCriacaoCliente'] = pd.to_datetime(DateSet_MT['DataCriacaoCliente'], format='%d/%m/%Y', errors='coerce')
+
+    return DateSet_MT
+
+def preparar_vendas(DateSet_MT: pd.DataFrame) -> pd.DataFrame:
+    """Tabela de factos das vendas: sem colunas de documento, no tipo de ESQUEMA_FATOS (o Cambio fica)"""
+    if DateSet_MT.empty:
+        return pd.DataFrame()
+
+    colunas_remover = ['Doc.fat.','Tipo.Factura','TipFt','Denominação','Moeda']
+    fatos = DateSet_MT.drop([col for col in colunas_remover if col in DateSet_MT.columns], axis=1, errors='ignore')
+    return ordenar_por_data(aplicar_esquema(fatos))
+
+def enriquecer_plano(plano_df: pd.DataFrame, lookups: Tuple[pd.DataFrame, ...]) -> pd.DataFrame:
+    """
+    Tabela de factos do plano, no grão em que é publicado (data, cliente,
+    canal, material), com os atributos dos lookups dessas chaves (promotor,
+    linha de negócio, canal, combustível). Não tem instalação nem província.
+    """
+    if plano_df.empty:
+        return pd.DataFrame()
+
+    v0, v1, v2, v3, v4, v5 = lookups
+    fatos = plano_df.assign(Ano=plano_df['Data_Facturacao'].dt.year, Mes=plano_df['Data_Facturacao'].dt.month)
+    # Primeira linha do lookup por chave: chaves repetidas não podem multiplicar o plano
+    fatos = _juntar_lookups(fatos, [(chave, lookup.drop_duplicates(chave)) for chave, lookup in
+                                    (('Emissor', v0), ('Material', v5), ('CDst', v1)) if not lookup.empty])
+    if 'DataCriacaoCliente' in fatos.columns:
+        fatos['DataCriacaoCliente'] = pd.to_datetime(fatos['DataCriacaoCliente'], format='%d/%m/%Y', errors='coerce')
+    return ordenar_por_data(aplicar_esquema(fatos))
+
+# ============================================= MOEDAS =============================================
+# Valores guardados uma só vez, na moeda original; MT e USD são calculados ao agregar
+COLUNAS_MONETARIAS = ['V_Liquido', 'V_Imposto', 'Custo_Produto', 'Margem_Vendas',
+                      'V_Venda_Oceanica', 'Desconto', 'Valor_ISC']
+
+def somar_em_moeda(vendas_df: pd.DataFrame, colunas: List[str], moeda: str = 'MT',
+                   chaves: Optional[List[str]] = None):
+    """
+    Soma das colunas monetárias convertidas (MT = valor × Cambio, USD =
+    valor ÷ Cambio, como as antigas colunas _MT/_USD), por 'chaves' ou total.
+    Só as colunas pedidas são convertidas, e só durante a agregação.
+    """
+    if moeda not in ('MT', 'USD'):
+        raise ValueError(f"Moeda desconhecida: {moeda}")
+    cambio = vendas_df['Cambio'].to_numpy()
+    convertidas = pd.DataFrame(
+        {c: vendas_df[c].to_numpy() * cambio if moeda == 'MT' else vendas_df[c].to_numpy() / cambio
+         for c in colunas},
+        index=vendas_df.index,
+    )
+    if not chaves:
+        return convertidas.sum()
+    return convertidas.groupby([vendas_df[c] for c in chaves], observed=True).sum()
+
+# ============================================= PLANO vs REAL =============================================
+COLUNAS_PLANO = ['Plano_m³', 'Plano', 'Quantidade_Plano', 'Meta']
+
+def detetar_coluna_plano(plano_df: pd.DataFrame) -> Optional[str]:
+    return next((c for c in COLUNAS_PLANO if c in plano_df.columns), None)
+
+def somar_plano_por(plano_df: pd.DataFrame, chaves: List[str]) -> pd.Series:
+    """Plano somado por 'chaves' (série vazia se o plano não tiver as colunas)"""
+    coluna = detetar_coluna_plano(plano_df)
+    if coluna is None or any(c not in plano_df.columns for c in chaves):
+        return pd.Series(dtype='float64', name='Plano')
+    return plano_df.groupby(chaves, observed=True)[coluna].sum().rename('Plano')
+
+def alinhar_vendas_plano(vendas_df: pd.DataFrame, coluna_vendas: str, plano_df: pd.DataFrame,
+                         chaves: List[str]) -> pd.DataFrame:
+    """
+    Vendas e plano agregados separadamente por 'chaves' e alinhados só depois
+    (junção externa dos totais): plano sem vendas conta, e o plano nunca é
+    repetido por cada linha de venda com a mesma chave.
+    """
+    vendas = vendas_df.groupby(chaves, observed=True)[coluna_vendas].sum().rename('Vendas')
+    plano = somar_plano_por(plano_df, chaves)
+    return pd.concat([vendas, plano], axis=1).fillna(0).reset_index()
+
+# ============================================= CUBO DE VENDAS =============================================
+# Grão do cubo: dia e as dimensões das vistas de Vendas e Promotores. Ano, Mes e
+# Nome_do_Cliente dependem do dia e do Emissor, por isso não aumentam o número de linhas.
+# O Cambio também é dimensão: V_Liquido fica na moeda original e cada linha do cubo
+# soma valores de um só câmbio, que somar_em_moeda converte como nos factos.
+DIMENSOES_CUBO = ['Data_Facturacao', 'Ano', 'Mes', 'Sector/Sigla', 'Combustivel', 'Provincia', 'Instalação',
+                  'Gestor / Promotor', 'Emissor', 'Nome_do_Cliente', 'Cambio']
+MEDIDAS_CUBO = ['Vendas m³', 'V_Liquido'] + COLUNAS_PLANO
+
+# Linhas de factos somadas em cada linha do cubo
+COLUNA_REGISTOS = 'Registos'
+
+def materializar_cubo(fatos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Factos de vendas ou de plano somados ao grão do cubo. Dimensões ausentes
+    (o plano não tem Provincia nem Instalação) ficam de fora; nulos formam
+    grupo próprio para os totais não mudarem.
+    """
+    if fatos.empty:
+        return fatos
+    dimensoes = [c for c in DIMENSOES_CUBO if c in fatos.columns]
+    medidas = [c for c in MEDIDAS_CUBO if c in fatos.columns]
+    chaves = [fatos[c].dt.normalize() if c == 'Data_Facturacao' else fatos[c] for c in dimensoes]
+    # Somas em float64; o esquema volta a compactar o que couber em float32
+    grupos = fatos[medidas].astype('float64').groupby(chaves, observed=True, dropna=False, sort=False)
+    cubo = grupos.sum()
+    cubo[COLUNA_REGISTOS] = grupos.size().astype('int32')
+    return ordenar_por_data(aplicar_esquema(cubo.reset_index()))
+
+def contar_registos(df: pd.DataFrame) -> int:
+    """Linhas de factos representadas por 'df' (factos ou cubo)"""
+    return int(df[COLUNA_REGISTOS].sum()) if COLUNA_REGISTOS in df.columns else len(df)
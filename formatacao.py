@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Formatação pt-BR de Números – Petromoc, SA
+Números em texto no formato 1.234.567,89 sem depender do locale do
+processo (setlocale é global e não é seguro com várias sessões em
+paralelo). Valores soltos formatam-se com formatar_ptbr; colunas inteiras
+com formatar_coluna_ptbr, que constrói os textos com funções vetorizadas do
+pyarrow, sem uma chamada Python por célula. Os dados numéricos não são
+alterados: o resultado é uma coluna nova, só para exibição.
+"""
+
+from typing import Any, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Separadores do formato en-US ('1,234.5') trocados pelos do pt-BR ('1.234,5')
+_PARA_PTBR = str.maketrans({',': '.', '.': ','})
+
+def formatar_ptbr(valor: Any, casas: int = 2) -> str:
+    """Formata número: 1234.56 → '1.234,56' (vazios e não numéricos → '0')"""
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        numero = 0.0
+    # Vazios, infinitos e valores que arredondam para zero: '0' (nunca '-0')
+    if not np.isfinite(numero) or abs(numero) < 0.5 / 10 ** casas:
+        numero = 0.0
+    return f"{numero:,.{casas}f}".translate(_PARA_PTBR)
+
+def formatar_coluna_ptbr(valores: Union[pd.Series, Sequence[Any]], casas: int = 2,
+                         prefixo: str = '', sufixo: str = '', com_sinal: bool = False) -> pd.Series:
+    """
+    Texto pt-BR de cada valor da coluna, com 'prefixo' e 'sufixo' (ex.: 'MT ',
+    ' TM') e '+' nos positivos se 'com_sinal' (variações); vazios e não
+    numéricos contam como 0, como em formatar_ptbr.
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+    numeros = pd.to_numeric(serie, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    numeros = np.nan_to_num(numeros, nan=0.0, posinf=0.0, neginf=0.0)
+
+    # Parte inteira e decimais como inteiros, já arredondados
+    escala = 10 ** casas
+    escalados = np.rint(np.abs(numeros) * escala).astype(np.int64)
+    inteiros = escalados // escala
+
+    # Parte inteira com zeros à esquerda até um múltiplo de 3 dígitos, grupos de 3
+    # unidos por pontos e, no fim, sem os zeros e pontos iniciais: 001234 → 001.234 → 1.234
+    digitos = len(str(int(inteiros.max()))) if len(inteiros) else 1
+    largura = -(-digitos // 3) * 3
+    texto = pc.utf8_lpad(pc.cast(pa.array(inteiros), pa.string()), largura, '0')
+    grupos = [pc.utf8_slice_codeunits(texto, i, i + 3) for i in range(0, largura, 3)]
+    texto = pc.binary_join_element_wise(*grupos, '.') if len(grupos) > 1 else grupos[0]
+    texto = pc.if_else(pa.array(inteiros == 0), '0', pc.utf8_ltrim(texto, '0.'))
+    if casas > 0:
+        decimais = pc.utf8_lpad(pc.cast(pa.array(escalados % escala), pa.string()), casas, '0')
+        texto = pc.binary_join_element_wise(texto, decimais, ',')
+
+    sinal = np.where((numeros < 0) & (escalados > 0), '-', '')
+    if com_sinal:
+        sinal[(numeros > 0) & (escalados > 0)] = '+'
+    sinal = pa.array(sinal)
+    texto = pc.binary_join_element_wise(prefixo, sinal, texto, sufixo, '')
+    return pd.Series(texto.to_numpy(zero_copy_only=False), index=serie.index, dtype=object, name=serie.name)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de Filtros em Bitmaps – Petromoc, SA
+Índice construído uma vez por versão de cada conjunto: posições das linhas
+ordenadas pela data e, por coluna filtrada, um bitmap compactado (1 bit por
+linha) para cada valor. Os filtros do menu lateral resolvem-se com uma
+procura binária no intervalo de datas e um AND de bitmaps, sem copiar nem
+converter a tabela base. O mesmo índice dá o catálogo dos filtros (datas e
+valores de cada coluna) e as contagens por valor com os outros filtros
+aplicados (facetas em cascata). Colunas com muitos valores (clientes,
+emissores) não têm bitmaps: filtram-se pelos códigos e os seus valores
+encontram-se por pesquisa (indice_pesquisa.py).
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from indice_pesquisa import K_PADRAO, IndicePesquisa
+from motor_consultas import CHAVES_NAO_COLUNAS
+
+logger = logging.getLogger(__name__)
+
+# Colunas com mais valores distintos não são listadas no catálogo (só contadas)
+# nem têm bitmaps: pesquisam-se e filtram-se pelos códigos
+LIMITE_VALORES_CATALOGO = 100
+
+class IndiceFiltros:
+    """
+    Índice de filtros de um DataFrame só de leitura. Os bitmaps de uma coluna
+    são criados na primeira vez que essa coluna é filtrada. As linhas estão
+    pela ordem da data: se a tabela já vier ordenada (factos de vendas e de
+    plano) a ordem é a da própria tabela e não há array de permutação.
+    """
+
+    def __init__(self, df: pd.DataFrame, colunas_data: Sequence[str]):
+        inicio = time.perf_counter()
+        self.df = df
+        self.coluna_data = next((c for c in colunas_data if c in df.columns), None)
+        self.ordem: Optional[np.ndarray] = None
+        self.datas: Optional[np.ndarray] = None
+        self._bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        self._codigos: Dict[str, Tuple[np.ndarray, List[str]]] = {}
+        self._pesquisas: Dict[str, IndicePesquisa] = {}
+        self._codigos_texto: Dict[str, Dict[str, List[int]]] = {}
+        self._catalogo: Optional[Dict[str, Any]] = None
+
+        if self.coluna_data is not None:
+            datas = pd.to_datetime(df[self.coluna_data], errors='coerce').to_numpy(dtype='datetime64[ns]')
+            # NaT fica no fim da ordem e nunca entra num intervalo de datas
+            if not pd.Series(datas).is_monotonic_increasing:
+                self.ordem = np.argsort(datas, kind='stable')
+                datas = datas[self.ordem]
+            self.datas = datas
+        logger.info(f"Índice de filtros criado: {len(df)} registros em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    def _codigos_coluna(self, coluna: str) -> Tuple[np.ndarray, List[str]]:
+        """Código de cada linha (pela ordem da data, -1 nos nulos) e texto de cada código"""
+        codificada = self._codigos.get(coluna)
+        if codificada is None:
+            serie = self.df[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                codigos, valores = serie.cat.codes.to_numpy(), serie.cat.categories
+            else:
+                codigos, valores = pd.factorize(serie)
+            if self.ordem is not None:
+                codigos = codigos[self.ordem]
+            codificada = self._codigos[coluna] = (codigos, [str(v) for v in valores])
+        return codificada
+
+    def _bitmaps_coluna(self, coluna: str) -> Dict[str, np.ndarray]:
+        """Bitmap compactado de cada valor da coluna (pelo seu texto, como nos filtros)"""
+        bitmaps = self._bitmaps.get(coluna)
+        if bitmaps is not None:
+            return bitmaps
+
+        codigos, textos = self._codigos_coluna(coluna)
+        bitmaps = {}
+        for codigo, texto in enumerate(textos):
+            bitmap = np.packbits(codigos == codigo)
+            # Valores diferentes com o mesmo texto (1 e '1') partilham o bitmap
+            bitmaps[texto] = bitmaps[texto] | bitmap if texto in bitmaps else bitmap
+        self._bitmaps[coluna] = bitmaps
+        return bitmaps
+
+    def _mascara_codigos(self, coluna: str, valores: List[Any], b0: int, b1: int) -> np.ndarray:
+        """Seleção compactada (bytes b0:b1) de uma coluna com muitos valores, a partir dos códigos"""
+        codigos, textos = self._codigos_coluna(coluna)
+        por_texto = self._codigos_texto.get(coluna)
+        if por_texto is None:
+            por_texto = self._codigos_texto[coluna] = {}
+            for codigo, texto in enumerate(textos):
+                por_texto.setdefault(texto, []).append(codigo)
+        escolhidos = [codigo for v in valores for codigo in por_texto.get(str(v), [])]
+        mascara = np.zeros((b1 - b0) << 3, dtype=bool)
+        trecho = codigos[b0 << 3:b1 << 3]
+        mascara[:len(trecho)] = np.isin(trecho, escolhidos)
+        return np.packbits(mascara)
+
+    def _intervalo(self, filtros: Dict) -> slice:
+        if self.datas is None:
+            return slice(0, len(self.df))
+        inicio = np.datetime64(pd.Timestamp(filtros['date_range'][0]), 'ns')
+        fim = np.datetime64(pd.Timestamp(filtros['date_range'][1]), 'ns')
+        return slice(int(np.searchsorted(self.datas, inicio, 'left')),
+                     int(np.searchsorted(self.datas, fim, 'right')))
+
+    def colunas_em_falta(self, filtros: Dict) -> List[str]:
+        """
+        Colunas com valores escolhidos que a tabela não tem. A seleção não as
+        pode aplicar: quem compara duas tabelas (vendas e plano) deve verificar.
+        """
+        return [coluna for coluna, valores in filtros.items()
+                if coluna not in CHAVES_NAO_COLUNAS and valores and coluna not in self.df.columns]
+
+    def _selecoes(self, filtros: Dict, b0: int, b1: int) -> Dict[str, np.ndarray]:
+        """OR dos bitmaps dos valores escolhidos em cada coluna (ver colunas_em_falta), nos bytes b0:b1"""
+        selecoes = {}
+        for coluna, valores in filtros.items():
+            if coluna in CHAVES_NAO_COLUNAS or not valores or coluna not in self.df.columns:
+                continue
+            if len(self._codigos_coluna(coluna)[1]) > LIMITE_VALORES_CATALOGO:
+                selecoes[coluna] = self._mascara_codigos(coluna, valores, b0, b1)
+                continue
+            bitmaps = self._bitmaps_coluna(coluna)
+            selecao = np.zeros(b1 - b0, dtype=np.uint8)
+            for valor in valores:
+                bitmap = bitmaps.get(str(valor))
+                if bitmap is not None:
+                    selecao |= bitmap[b0:b1]
+            selecoes[coluna] = selecao
+        return selecoes
+
+    def _posicoes_ordenadas(self, filtros: Dict, excluir: Optional[str] = None) -> np.ndarray:
+        """Posições, pela ordem da data, que passam nos filtros (sem o da coluna 'excluir')"""
+        intervalo = self._intervalo(filtros)
+        i, j = intervalo.start, max(intervalo.start, intervalo.stop)
+        # Bytes dos bitmaps que cobrem o intervalo de datas
+        b0, b1 = i >> 3, (j + 7) >> 3
+
+        acumulado: Optional[np.ndarray] = None
+        for coluna, selecao in self._selecoes(filtros, b0, b1).items():
+            if coluna != excluir:
+                acumulado = selecao if acumulado is None else acumulado & selecao
+        if acumulado is None:
+            return np.arange(i, j)
+        return np.flatnonzero(np.unpackbits(acumulado)[i - (b0 << 3):j - (b0 << 3)]) + i
+
+    def selecionar(self, filtros: Dict) -> np.ndarray:
+        """Posições (crescentes) das linhas que passam nos filtros"""
+        posicoes = self._posicoes_ordenadas(filtros)
+        if self.ordem is not None:
+            posicoes = np.sort(self.ordem[posicoes])
+        return posicoes
+
+    def _contagens_codigos(self, filtros: Dict, coluna: str) -> np.ndarray:
+        """Linhas de cada código da coluna, com os filtros das outras colunas"""
+        codigos, textos = self._codigos_coluna(coluna)
+        selecionados = codigos[self._posicoes_ordenadas(filtros, excluir=coluna)]
+        return np.bincount(selecionados[selecionados >= 0], minlength=len(textos))
+
+    def facetas(self, filtros: Dict, colunas: Sequence[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Número de linhas de cada valor (pelo texto) das 'colunas', com o intervalo
+        de datas e os filtros das outras colunas aplicados: ao escolher uma
+        Provincia, as contagens de Instalação e de Gestor / Promotor acompanham.
+        """
+        resultado = {}
+        for coluna in colunas:
+            if coluna not in self.df.columns:
+                continue
+            textos = self._codigos_coluna(coluna)[1]
+            contagens = self._contagens_codigos(filtros, coluna)
+            por_texto: Dict[str, int] = {}
+            for codigo in np.flatnonzero(contagens):
+                por_texto[textos[codigo]] = por_texto.get(textos[codigo], 0) + int(contagens[codigo])
+            resultado[coluna] = por_texto
+        return resultado
+
+    def pesquisar(self, coluna: str, consulta: str, filtros: Optional[Dict] = None,
+                  k: int = K_PADRAO) -> List[Tuple[str, int]]:
+        """
+        Até k valores da coluna que correspondem à consulta, com o número de
+        linhas de cada um. Com 'filtros', só entram valores com linhas nos
+        outros filtros e os de mais linhas aparecem primeiro.
+        """
+        if coluna not in self.df.columns:
+            return []
+        textos = self._codigos_coluna(coluna)[1]
+        pesquisa = self._pesquisas.get(coluna)
+        if pesquisa is None:
+            pesquisa = self._pesquisas[coluna] = IndicePesquisa(textos)
+        if filtros is not None:
+            contagens = self._contagens_codigos(filtros, coluna)
+            # Valores sem linhas ficam com peso negativo e são descartados
+            ids = pesquisa.procurar(consulta, k, np.where(contagens > 0, contagens, -1))
+        else:
+            contagens = np.bincount(self._codigos_coluna(coluna)[0] + 1, minlength=len(textos) + 1)[1:]
+            ids = pesquisa.procurar(consulta, k)
+        resultado: Dict[str, int] = {}
+        for i in ids:
+            resultado[textos[i]] = resultado.get(textos[i], 0) + int(contagens[i])
+        return list(resultado.items())
+
+    def catalogo(self) -> Dict[str, Any]:
+        """
+        Catálogo dos filtros, calculado uma vez: primeira e última data e os
+        valores distintos de cada coluna (só o número, acima de LIMITE_VALORES_CATALOGO).
+        """
+        if self._catalogo is not None:
+            return self._catalogo
+        datas = self.datas[~np.isnat(self.datas)] if self.datas is not None else np.array([], dtype='datetime64[ns]')
+        valores: Dict[str, List[Any]] = {}
+        distintos: Dict[str, int] = {}
+        for coluna in self.df.columns:
+            serie = self.df[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                presentes = np.bincount(serie.cat.codes.to_numpy() + 1, minlength=len(serie.cat.categories) + 1)[1:]
+                unicos = serie.cat.categories[presentes > 0]
+            else:
+                unicos = pd.unique(serie.dropna())
+            distintos[coluna] = len(unicos)
+            if 0 < len(unicos) <= LIMITE_VALORES_CATALOGO:
+                valores[coluna] = list(unicos)
+        self._catalogo = {
+            'coluna_data': self.coluna_data,
+            'min_date': pd.Timestamp(datas[0]).date() if len(datas) else None,
+            'max_date': pd.Timestamp(datas[-1]).date() if len(datas) else None,
+            'valores': valores,
+            'distintos': distintos,
+        }
+        return self._catalogo
+
+    def filtrar(self, filtros: Dict) -> pd.DataFrame:
+        return self.linhas(self.selecionar(filtros))
+
+    def linhas(self, posicoes: np.ndarray) -> pd.DataFrame:
+        """
+        Linhas selecionadas da tabela base. Sem nada excluído devolve uma cópia
+        rasa (os dados não são copiados, mas colunas novas não tocam na base).
+        """
+        if len(posicoes) == len(self.df):
+            return self.df.copy(deep=False)
+        return self.df.take(posicoes)
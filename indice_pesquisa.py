@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de Pesquisa de Valores – Petromoc, SA
+Pesquisa no servidor dos valores de colunas com muitos valores distintos
+(clientes, emissores): em vez de enviar a lista completa ao browser, o menu
+lateral pede os k melhores valores para o texto escrito. Os prefixos de
+palavra resolvem-se com procura binária numa lista ordenada e os restantes
+trechos com listas de trigramas, sem percorrer todos os valores.
+"""
+
+import logging
+import time
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Valores devolvidos por omissão em cada pesquisa
+K_PADRAO = 20
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas e sem acentos: 'João' e 'joao' encontram o mesmo cliente"""
+    decomposto = unicodedata.normalize('NFKD', str(texto).casefold())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).strip()
+
+def _trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndicePesquisa:
+    """
+    Índice de pesquisa sobre uma lista de textos; o identificador de cada
+    valor é a sua posição na lista (o código da coluna no índice de filtros).
+    """
+
+    def __init__(self, textos: Sequence[str]):
+        inicio = time.perf_counter()
+        self.textos = list(textos)
+        self.normalizados = [normalizar_texto(t) for t in self.textos]
+
+        # Sufixos a partir do início de cada palavra, ordenados: um prefixo da
+        # pesquisa corresponde a um intervalo contíguo desta lista
+        entradas = []
+        for ident, texto in enumerate(self.normalizados):
+            for i, c in enumerate(texto):
+                if c.isalnum() and (i == 0 or not texto[i - 1].isalnum()):
+                    entradas.append((texto[i:], ident))
+        entradas.sort()
+        self._chaves: List[str] = [chave for chave, _ in entradas]
+        self._ids_chaves = np.array([ident for _, ident in entradas], dtype=np.int64)
+
+        postings: Dict[str, List[int]] = {}
+        for ident, texto in enumerate(self.normalizados):
+            for trigrama in _trigramas(texto):
+                postings.setdefault(trigrama, []).append(ident)
+        self._trigramas = {t: np.array(ids, dtype=np.int64) for t, ids in postings.items()}
+
+        # Posição alfabética de cada valor, para desempatar
+        self._posto = np.empty(len(self.textos), dtype=np.int64)
+        self._posto[np.argsort(np.array(self.normalizados, dtype=object), kind='stable')] = np.arange(len(self.textos))
+        logger.info(f"Índice de pesquisa criado: {len(self.textos)} valores em "
+                    f"{(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    def _por_prefixo(self, consulta: str) -> np.ndarray:
+        """Marca (por valor) dos que têm alguma palavra a começar pela consulta"""
+        i = bisect_left(self._chaves, consulta)
+        j = bisect_left(self._chaves, consulta + '\U0010ffff', i)
+        marcados = np.zeros(len(self.textos), dtype=bool)
+        marcados[self._ids_chaves[i:j]] = True
+        return marcados
+
+    def _por_trecho(self, consulta: str) -> np.ndarray:
+        """Valores que contêm a consulta (3 ou mais caracteres) em qualquer posição"""
+        listas = []
+        for trigrama in _trigramas(consulta):
+            ids = self._trigramas.get(trigrama)
+            if ids is None:
+                return np.array([], dtype=np.int64)
+            listas.append(ids)
+        listas.sort(key=len)
+        candidatos = listas[0]
+        for ids in listas[1:]:
+            candidatos = np.intersect1d(candidatos, ids, assume_unique=True)
+            if not len(candidatos):
+                return candidatos
+        if len(consulta) == 3:
+            return candidatos
+        # Os trigramas podem estar todos presentes sem formarem o trecho seguido
+        return np.array([i for i in candidatos if consulta in self.normalizados[i]], dtype=np.int64)
+
+    def procurar(self, consulta: str, k: int = K_PADRAO, pesos: Optional[np.ndarray] = None) -> List[int]:
+        """
+        Identificadores dos k melhores valores para a consulta: primeiro os que
+        têm uma palavra a começar por ela, depois os que a contêm noutra posição;
+        dentro de cada grupo, pelo maior peso (ex.: linhas com os filtros atuais)
+        e depois por ordem alfabética. Valores com peso negativo são excluídos.
+        """
+        consulta = normalizar_texto(consulta)
+        if not consulta:
+            return []
+        marcados = self._por_prefixo(consulta)
+        prefixo = np.flatnonzero(marcados)
+        trecho = self._por_trecho(consulta) if len(consulta) >= 3 else np.array([], dtype=np.int64)
+        trecho = trecho[~marcados[trecho]]
+
+        resultado: List[int] = []
+        for grupo in (prefixo, trecho):
+            if pesos is not None:
+                grupo = grupo[pesos[grupo] >= 0]
+            if len(resultado) >= k or not len(grupo):
+                continue
+            # Sem pesos, a ordem alfabética decide
+            peso = pesos[grupo] if pesos is not None else -self._posto[grupo]
+            if len(grupo) > k:
+                # Só os k de maior peso (com os empates no limite) são ordenados
+                limite = np.partition(peso, len(grupo) - k)[len(grupo) - k]
+                grupo, peso = grupo[peso >= limite], peso[peso >= limite]
+            ordem = np.lexsort((self._posto[grupo], -peso))
+            resultado.extend(int(i) for i in grupo[ordem][:k - len(resultado)])
+        return resultado
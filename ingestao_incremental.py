@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestão Incremental do Ano Ativo – Petromoc, SA
+Mantém em disco a tabela de factos das vendas do ano corrente. Em cada
+atualização só as linhas de vendas novas ou alteradas (identificadas por
+hash da linha) passam pelas junções com os lookups, e são acrescentadas
+ao armazém como uma nova parte.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from cache_snapshots import DIRETORIO_SNAPSHOTS, assinatura_arquivo, gravar_parquet, ler_parquet, normalizar_tipos
+from fontes_dados import ARQUIVO_LOOKUP, concatenar_fatos, enriquecer_vendas, ordenar_por_data, preparar_vendas
+
+logger = logging.getLogger(__name__)
+
+# ============================================= CONFIGURAÇÃO =============================================
+DIRETORIO_ARMAZEM = DIRETORIO_SNAPSHOTS / 'armazem'
+
+# Incrementar quando enriquecer_vendas/preparar_vendas mudarem (força reconstrução)
+VERSAO_PROCESSAMENTO = 6
+
+# Acima deste número de partes o armazém é compactado num só ficheiro
+MAX_PARTES = 20
+
+COLUNA_CHAVE = '_chave_linha'
+
+# ============================================= CHAVES DAS LINHAS =============================================
+def chaves_linhas(vendas: pd.DataFrame) -> np.ndarray:
+    """
+    Hash de cada linha de vendas (todas as colunas) combinado com a ocorrência,
+    para que linhas repetidas tenham chaves distintas. Doc.fat. sozinho não
+    chega: uma factura tem várias linhas e uma linha pode ser corrigida.
+    """
+    hashes = pd.util.hash_pandas_object(vendas, index=False)
+    ocorrencia = hashes.groupby(hashes.to_numpy()).cumcount()
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({'h': hashes.to_numpy(), 'o': ocorrencia.to_numpy()}), index=False
+    ).to_numpy()
+
+# ============================================= ARMAZÉM EM DISCO =============================================
+def _diretorio(ano: int) -> Path:
+    return DIRETORIO_ARMAZEM / f"fatos_vendas_{ano}"
+
+def _ler_manifesto(ano: int) -> Optional[Dict[str, Any]]:
+    manifesto = _diretorio(ano) / 'manifesto.json'
+    try:
+        with open(manifesto, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifesto do armazém {manifesto} inválido: {e}")
+        return None
+
+def _gravar_manifesto(ano: int, dados: Dict[str, Any]) -> None:
+    manifesto = _diretorio(ano) / 'manifesto.json'
+    temporario = manifesto.with_suffix('.json.tmp')
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, manifesto)
+
+def _gravar_parte(ano: int, df: pd.DataFrame, numero: int) -> str:
+    nome = f"parte_{numero:05d}.parquet"
+    destino = _diretorio(ano) / nome
+    temporario = destino.with_name(nome + '.tmp')
+    gravar_parquet(df, temporario)
+    os.replace(temporario, destino)
+    return nome
+
+def ler_armazem(ano: int) -> Tuple[Optional[pd.DataFrame], Optional[Dict[str, Any]]]:
+    """Partição guardada (todas as partes concatenadas) e o seu manifesto"""
+    manifesto = _ler_manifesto(ano)
+    if manifesto is None:
+        return None, None
+    try:
+        partes = [ler_parquet(_diretorio(ano) / p) for p in manifesto['partes']]
+    except Exception as e:
+        logger.warning(f"Armazém de {ano} ilegível, será reconstruído: {e}")
+        return None, None
+    return concatenar_fatos(partes), manifesto
+
+def _reescrever(ano: int, df: pd.DataFrame, dependencias: Dict[str, Any]) -> None:
+    """Substitui o armazém do ano por uma única parte"""
+    diretorio = _diretorio(ano)
+    if diretorio.exists():
+        shutil.rmtree(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    _gravar_manifesto(ano, {
+        'ano': ano,
+        'dependencias': dependencias,
+        'partes': [_gravar_parte(ano, df, 0)],
+        'linhas': len(df),
+        'atualizado_em': time.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+
+def _acrescentar(ano: int, delta: pd.DataFrame, manifesto: Dict[str, Any]) -> None:
+    """Grava o delta como nova parte sem tocar nas existentes"""
+    numero = int(manifesto['partes'][-1].split('_')[1].split('.')[0]) + 1
+    manifesto['partes'].append(_gravar_parte(ano, delta, numero))
+    manifesto['linhas'] += len(delta)
+    manifesto['atualizado_em'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    _gravar_manifesto(ano, manifesto)
+
+# ============================================= PROCESSAMENTO =============================================
+def _assinatura_dependencias() -> Dict[str, Any]:
+    """Os lookups entram em todas as linhas: se mudarem, a partição é refeita"""
+    return {
+        'versao': VERSAO_PROCESSAMENTO,
+        'lookups': assinatura_arquivo(ARQUIVO_LOOKUP)['sha256'] if os.path.exists(ARQUIVO_LOOKUP) else None,
+    }
+
+def _processar(vendas: pd.DataFrame, lookups: Tuple[pd.DataFrame, ...]) -> pd.DataFrame:
+    if vendas.empty:
+        return pd.DataFrame()
+    DateSet_MT = enriquecer_vendas(vendas, lookups)
+    return normalizar_tipos(preparar_vendas(DateSet_MT))
+
+def _sem_chave(df: pd.DataFrame) -> pd.DataFrame:
+    return df.drop(columns=[COLUNA_CHAVE], errors='ignore')
+
+def atualizar_particao(ano: int, vendas: pd.DataFrame, lookups: Tuple[pd.DataFrame, ...]) -> pd.DataFrame:
+    """
+    Factos das vendas do ano a partir do armazém: só as linhas novas são
+    enriquecidas e acrescentadas; linhas que deixaram de existir no ficheiro
+    de vendas são removidas (com compactação do armazém).
+    """
+    inicio = time.perf_counter()
+    if vendas.empty:
+        return pd.DataFrame()
+
+    vendas = vendas.assign(**{COLUNA_CHAVE: chaves_linhas(vendas)})
+    dependencias = _assinatura_dependencias()
+    guardado, manifesto = ler_armazem(ano)
+
+    if guardado is None or manifesto.get('dependencias') != dependencias:
+        completo = _processar(vendas, lookups)
+        _reescrever(ano, completo, dependencias)
+        logger.info(f"Armazém {ano} reconstruído: {len(completo)} registros em {time.perf_counter() - inicio:.2f} s")
+        return _sem_chave(completo)
+
+    chaves_guardadas = guardado[COLUNA_CHAVE].to_numpy()
+    novas = ~np.isin(vendas[COLUNA_CHAVE].to_numpy(), chaves_guardadas)
+    manter = np.isin(chaves_guardadas, vendas[COLUNA_CHAVE].to_numpy())
+    removidas = int((~manter).sum())
+
+    if not novas.any() and removidas == 0:
+        logger.info(f"Armazém {ano} atualizado, sem alterações ({len(guardado)} registros)")
+        return _sem_chave(ordenar_por_data(guardado))
+
+    delta = _processar(vendas[novas], lookups)
+    resultado = concatenar_fatos([guardado[manter], delta])
+
+    if removidas or len(manifesto['partes']) >= MAX_PARTES:
+        _reescrever(ano, resultado, dependencias)
+    else:
+        _acrescentar(ano, delta, manifesto)
+
+    logger.info(f"Armazém {ano}: {int(novas.sum())} linhas novas, {removidas} removidas, "
+                f"{len(resultado)} registros em {time.perf_counter() - inicio:.2f} s")
+    # As partes novas ficam no fim: volta à ordem da data esperada pelo índice de filtros
+    return _sem_chave(ordenar_por_data(resultado))
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Leitor Excel em Streaming com Projeção de Colunas – Petromoc, SA
+Percorre a folha linha a linha (openpyxl em modo read-only) e escreve cada
+coluna projetada diretamente num array NumPy tipado, sem DataFrame de
+objetos intermédio. Memória e tempo crescem com as colunas usadas e não
+com a largura da folha.
+"""
+
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Tipos aceites na projeção
+TIPO_TEXTO = 'category'
+TIPO_DECIMAL = 'float64'
+TIPO_INTEIRO = 'int64'
+TIPO_DATA = 'datetime64[ns]'
+
+TAMANHO_BLOCO = 8192
+
+# Números pt-BR escritos como texto: "1.234,56", "MT 1 234", "-0,5". Tudo o que
+# não é dígito, separador ou sinal é descartado antes da interpretação.
+_NAO_NUMERICO = re.compile(r'[^0-9.,-]')
+_DECIMAL_SIMPLES = re.compile(r'-?\d*\.?\d+')
+
+def texto_para_float(valor: str) -> float:
+    """
+    Converte um número pt-BR escrito como texto. Com os dois separadores, o
+    último é o decimal e o outro agrupa milhares; um separador repetido
+    agrupa milhares; uma só vírgula ou um só ponto é o decimal. Texto em
+    branco é vazio (NaN, como no pd.read_excel); texto sem dígitos vale 0
+    (como em limpar_coluna_numerica); o resto falha com NaN.
+    """
+    if not valor.strip():
+        return np.nan
+    s = _NAO_NUMERICO.sub('', valor)
+    if _DECIMAL_SIMPLES.fullmatch(s):
+        return float(s)
+    if not any(c.isdigit() for c in s):
+        return 0.0
+    virgula, ponto = s.rfind(','), s.rfind('.')
+    if virgula >= 0 and ponto >= 0:
+        milhares, decimal = ('.', ',') if virgula > ponto else (',', '.')
+        s = s.replace(milhares, '').replace(decimal, '.')
+    elif virgula >= 0:
+        s = s.replace(',', '') if s.count(',') > 1 else s.replace(',', '.')
+    elif s.count('.') > 1:
+        s = s.replace('.', '')
+    try:
+        return float(s)
+    except ValueError:
+        return np.nan
+
+def _converter_textos_data(textos: List[str]) -> np.ndarray:
+    """Datas escritas como texto: dd/mm/aaaa primeiro, outros formatos depois; o resto fica NaT"""
+    serie = pd.Series(textos, dtype=object).str.strip()
+    datas = pd.to_datetime(serie, format='%d/%m/%Y', errors='coerce')
+    restantes = datas.isna() & serie.str.contains(r'\d', regex=True)
+    if restantes.any():
+        datas[restantes] = pd.to_datetime(serie[restantes], format='mixed', dayfirst=True, errors='coerce')
+    return datas.to_numpy(dtype='datetime64[ns]')
+
+# ============================================= CONSTRUTORES DE COLUNA =============================================
+class _Coluna(ABC):
+    """Acumula valores de uma coluna em blocos de arrays NumPy do tipo final"""
+
+    dtype = np.float64
+    vazio: Any = np.nan
+
+    def __init__(self):
+        self.blocos: List[np.ndarray] = []
+        self.atual = np.empty(TAMANHO_BLOCO, dtype=self.dtype)
+        self.pos = 0
+        # Células preenchidas que não se conseguiram converter
+        self.falhas = 0
+
+    def adicionar(self, linha: int, valor: Any) -> None:
+        if self.pos == TAMANHO_BLOCO:
+            self.blocos.append(self.atual)
+            self.atual = np.empty(TAMANHO_BLOCO, dtype=self.dtype)
+            self.pos = 0
+        self.atual[self.pos] = self.vazio if valor is None else self.converter(linha, valor)
+        self.pos += 1
+
+    @abstractmethod
+    def converter(self, linha: int, valor: Any):
+        """Valor da célula não vazia no tipo da coluna"""
+
+    def array(self, n: int) -> np.ndarray:
+        return np.concatenate(self.blocos + [self.atual[:self.pos]])[:n]
+
+    def finalizar(self, n: int):
+        return self.array(n)
+
+class _ColunaDecimal(_Coluna):
+    dtype = np.float64
+    vazio = np.nan
+
+    def converter(self, linha, valor):
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            return valor
+        numero = texto_para_float(valor) if isinstance(valor, str) else np.nan
+        # Células só com espaços são vazias, não falhas
+        if numero != numero and not (isinstance(valor, str) and not valor.strip()):
+            self.falhas += 1
+        return numero
+
+class _ColunaInteira(_Coluna):
+    dtype = np.int64
+    vazio = 0
+
+    def converter(self, linha, valor):
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            return int(valor) if valor == valor else 0
+        v = texto_para_float(valor) if isinstance(valor, str) else np.nan
+        if v != v:
+            if not (isinstance(valor, str) and not valor.strip()):
+                self.falhas += 1
+            return 0
+        return int(v)
+
+class _ColunaData(_Coluna):
+    """Datas em int64 (ns); textos são guardados à parte e convertidos no fim"""
+
+    dtype = np.int64
+    vazio = np.iinfo(np.int64).min  # representação de NaT
+
+    def __init__(self):
+        super().__init__()
+        self.textos: Dict[int, str] = {}
+
+    def converter(self, linha, valor):
+        if isinstance(valor, datetime):
+            return pd.Timestamp(valor).value
+        if isinstance(valor, date):
+            return pd.Timestamp(valor).value
+        if isinstance(valor, str):
+            self.textos[linha] = valor
+        return self.vazio
+
+    def finalizar(self, n: int):
+        valores = self.array(n).view('datetime64[ns]')
+        if self.textos:
+            linhas = np.fromiter((l for l in self.textos if l < n), dtype=np.int64)
+            if len(linhas):
+                valores[linhas] = _converter_textos_data([self.textos[l] for l in linhas])
+        return valores
+
+class _ColunaTexto(_Coluna):
+    """Texto dicionário-codificado: códigos int32 + categorias únicas"""
+
+    dtype = np.int32
+    vazio = -1
+
+    def __init__(self):
+        super().__init__()
+        self.codigos: Dict[str, int] = {}
+
+    def converter(self, linha, valor):
+        texto = valor if isinstance(valor, str) else str(valor)
+        codigo = self.codigos.get(texto)
+        if codigo is None:
+            codigo = self.codigos[texto] = len(self.codigos)
+        return codigo
+
+    def finalizar(self, n: int):
+        # Categorias por ordem alfabética (e não de aparição), para que groupby e
+        # ordenações pela coluna saiam como com texto simples
+        categorias = list(self.codigos)
+        return pd.Categorical.from_codes(self.array(n), categories=categorias).reorder_categories(sorted(categorias))
+
+_CONSTRUTORES = {
+    TIPO_DECIMAL: _ColunaDecimal,
+    TIPO_INTEIRO: _ColunaInteira,
+    TIPO_DATA: _ColunaData,
+    TIPO_TEXTO: _ColunaTexto,
+}
+
+# ============================================= LEITURA =============================================
+def ler_folha_projetada(caminho: Union[str, Path], colunas: Dict[str, str],
+                        folha: Union[int, str] = 0) -> pd.DataFrame:
+    """
+    Lê apenas as colunas declaradas em 'colunas' ({nome: tipo}) da folha.
+    Colunas declaradas que não existam no cabeçalho são ignoradas com aviso.
+    O número de células numéricas que falharam a conversão, por coluna, fica
+    em df.attrs['falhas_conversao'].
+    """
+    from openpyxl import load_workbook
+
+    inicio = time.perf_counter()
+    livro = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        ws = livro.worksheets[folha] if isinstance(folha, int) else livro[folha]
+        linhas = ws.iter_rows(values_only=True)
+
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return pd.DataFrame(columns=list(colunas))
+
+        posicoes: Dict[str, int] = {}
+        for i, nome in enumerate(cabecalho):
+            if nome is not None and str(nome) in colunas and str(nome) not in posicoes:
+                posicoes[str(nome)] = i
+
+        em_falta = [c for c in colunas if c not in posicoes]
+        if em_falta:
+            logger.warning(f"Colunas não encontradas em {Path(caminho).name}: {em_falta}")
+
+        projetadas = [(nome, posicoes[nome], _CONSTRUTORES[colunas[nome]]())
+                      for nome in colunas if nome in posicoes]
+
+        n = 0
+        ultima_com_dados = -1
+        for linha in linhas:
+            largura = len(linha)
+            for nome, pos, coluna in projetadas:
+                coluna.adicionar(n, linha[pos] if pos < largura else None)
+            # Como no pd.read_excel, linhas vazias no fim da folha são descartadas
+            if any(v is not None for v in linha):
+                ultima_com_dados = n
+            n += 1
+    finally:
+        livro.close()
+
+    total = ultima_com_dados + 1
+    df = pd.DataFrame({nome: coluna.finalizar(total) for nome, _, coluna in projetadas})
+
+    # Falhas de conversão por coluna ficam com a tabela (attrs passa para snapshots e cópias)
+    falhas = {nome: coluna.falhas for nome, _, coluna in projetadas if coluna.falhas}
+    df.attrs['falhas_conversao'] = falhas
+    if falhas:
+        logger.warning(f"{Path(caminho).name}: células não numéricas tratadas como vazias: {falhas}")
+
+    logger.info(f"{Path(caminho).name}: {total} registros x {len(projetadas)} colunas "
+                f"lidos em streaming em {time.perf_counter() - inicio:.2f} s")
+    return df
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de Consultas – Petromoc, SA
+Que motor serve cada consulta do painel:
+- filtros do menu lateral: índice de bitmaps (indice_filtros.py), sobre a
+  tabela já em memória, sem cópia;
+- totais de intervalos de datas: somas acumuladas (somas_acumuladas.py);
+- somas por chave com ordenação e limite (rankings, tabelas por linha de
+  negócio): somar_por, em DuckDB embebido quando instalado e em pandas caso
+  contrário ou com query_engine = "pandas" no config.json.
+somar_por serve as vendas por linha de negócio e o ranking de promotores
+(vendas) e as tabelas de dívida por linha de negócio e top 10 de promotores
+(MIS). O DuckDB corre em memória e lê o DataFrame recebido diretamente (sem
+tabelas nem segunda cópia dos dados); o limite de memória aplica-se às
+agregações, com o excedente em disco. Configuração: query_engine e
+duckdb_memory_limit.
+"""
+
+import logging
+import threading
+from typing import Optional, Sequence
+
+import pandas as pd
+
+from cache_snapshots import DIRETORIO_SNAPSHOTS
+from fontes_dados import CONFIGURACAO
+
+try:
+    import duckdb
+except ImportError:  # dependência opcional
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# ============================================= CONFIGURAÇÃO =============================================
+# 'auto' usa o DuckDB quando instalado; 'duckdb' ou 'pandas' forçam o motor
+MOTOR = CONFIGURACAO.get('query_engine', 'auto')
+LIMITE_MEMORIA = CONFIGURACAO.get('duckdb_memory_limit', '1GB')
+DIRETORIO_TEMPORARIO = DIRETORIO_SNAPSHOTS / 'duckdb_tmp'
+
+# Chaves do dicionário de filtros que não são colunas
+CHAVES_NAO_COLUNAS = ('date_range', 'modo_trabalho', 'tipo_dados')
+
+_lock = threading.Lock()
+_ligacao = None
+_indisponivel = False
+
+def _citar(identificador: str) -> str:
+    return '"' + str(identificador).replace('"', '""') + '"'
+
+# ============================================= LIGAÇÃO =============================================
+def _ligar():
+    """Abre a base em memória na primeira utilização; uma falha desativa o motor no processo"""
+    global _ligacao, _indisponivel
+    with _lock:
+        if _ligacao is not None or _indisponivel:
+            return _ligacao
+        if MOTOR == 'pandas' or duckdb is None:
+            if MOTOR == 'duckdb':
+                logger.warning("query_engine = duckdb mas o pacote duckdb não está instalado - consultas em pandas")
+            _indisponivel = True
+            return None
+        try:
+            ligacao = duckdb.connect(':memory:')
+            ligacao.execute(f"SET memory_limit = '{LIMITE_MEMORIA}'")
+            ligacao.execute(f"SET temp_directory = '{DIRETORIO_TEMPORARIO}'")
+            _ligacao = ligacao
+            logger.info(f"Motor DuckDB ativo (memória até {LIMITE_MEMORIA})")
+        except Exception as e:
+            _indisponivel = True
+            logger.warning(f"DuckDB indisponível, consultas em pandas: {e}")
+        return _ligacao
+
+def ativo() -> bool:
+    return _ligar() is not None
+
+# ============================================= CONSULTAS =============================================
+def somar_por(df: pd.DataFrame, chave: str, colunas: Sequence[str],
+              ordenar_por: Optional[str] = None, limite: Optional[int] = None) -> pd.DataFrame:
+    """
+    groupby(chave)[colunas].sum() ordenado pela chave (ou por 'ordenar_por'
+    descendente e, nos empates, pela chave) e limitado a 'limite' linhas. Em
+    SQL quando o motor está ativo, em pandas caso contrário, com o mesmo
+    resultado.
+    """
+    if ativo():
+        somas = ", ".join(f"COALESCE(SUM({_citar(c)}), 0) AS {_citar(c)}" for c in colunas)
+        ordem = f"{_citar(ordenar_por)} DESC, {_citar(chave)}" if ordenar_por else _citar(chave)
+        sql = (f"SELECT {_citar(chave)}, {somas} FROM _df WHERE {_citar(chave)} IS NOT NULL "
+               f"GROUP BY {_citar(chave)} ORDER BY {ordem}" + (f" LIMIT {int(limite)}" if limite else ""))
+        cursor = _ligacao.cursor()
+        try:
+            cursor.register('_df', df[[chave, *colunas]])
+            return cursor.execute(sql).df()
+        except Exception as e:
+            logger.warning(f"Agregação DuckDB falhou, a usar pandas: {e}")
+        finally:
+            cursor.close()
+
+    tabela = df.groupby(chave, observed=True)[list(colunas)].sum().reset_index()
+    if ordenar_por:
+        # Empates desfeitos pela chave, como no ORDER BY do SQL (o nlargest usaria a posição)
+        tabela = tabela.sort_values([ordenar_por, chave], ascending=[False, True], kind='stable')
+    return (tabela.head(limite) if limite else tabela).reset_index(drop=True)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Quota de Mercado em Formato Longo – Petromoc, SA
+As quantidades da ImportacaoMZ vêm em colunas largas (Petromoc RELEASE,
+Financial Hold e uma coluna por congénere). São desdobradas uma vez, ao
+carregar, numa tabela longa com uma linha por (descarga, empresa) com
+quantidade, já em TM e em m³ com a densidade do combustível da linha. As
+quotas por empresa, mês, porto e combustível e as variações de posição
+saem desta tabela com um único groupby cada; uma congénere nova é só mais
+um valor da coluna Empresa.
+"""
+
+import logging
+import time
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from conversao_volumes import densidades_por_linha, normalizar_combustivel, tm_para_m3
+from fontes_dados import CLIENTES_CONGENERES, ordenar_por_data
+
+logger = logging.getLogger(__name__)
+
+# ============================================= ESTRUTURA =============================================
+EMPRESA_PETROMOC = 'PETROMOC'
+ORIGEM_CONGENERE = 'Congénere'
+
+# Coluna larga de quantidade → (empresa, origem)
+COLUNAS_QUANTIDADE = {
+    'Qtd_Petro_TM': (EMPRESA_PETROMOC, 'RELEASE'),
+    'Qtd_FH_( TM)': (EMPRESA_PETROMOC, 'Financial Hold'),
+    **{c: (c, ORIGEM_CONGENERE) for c in CLIENTES_CONGENERES},
+}
+
+# Dimensões da importação copiadas para cada linha (as mesmas dos filtros)
+DIMENSOES_QUOTA = ['NOR', 'Data_Descarga', 'Ano', 'Mes', 'Situacao_Descarga', 'Porto', 'Combustivel']
+COLUNA_PERIODO = 'Periodo'
+COLUNA_PRODUTO = 'Produto'
+MEDIDAS_QUOTA = ['TM', 'm³']
+
+# Dimensões pelas quais a vista de quota de mercado agrupa
+DIMENSOES_ANALISE = {
+    'Mês': COLUNA_PERIODO,
+    'Porto': 'Porto',
+    'Combustível': COLUNA_PRODUTO,
+}
+
+# ============================================= TABELA LONGA =============================================
+def tabela_longa(importacao: pd.DataFrame) -> pd.DataFrame:
+    """
+    Desdobra as colunas de quantidade da importação (já em float64) numa
+    tabela longa: NOR, Data_Descarga, Ano, Mes, Situacao_Descarga, Porto,
+    Combustivel, Periodo (mês do NOR), Produto (combustível normalizado),
+    Empresa, Origem, TM e m³. Só entram as células com quantidade.
+    """
+    inicio = time.perf_counter()
+    colunas = [c for c in COLUNAS_QUANTIDADE if c in importacao.columns]
+    if importacao.empty or not colunas:
+        return pd.DataFrame(columns=DIMENSOES_QUOTA + [COLUNA_PERIODO, COLUNA_PRODUTO, 'Empresa', 'Origem']
+                            + MEDIDAS_QUOTA)
+
+    quantidades = np.nan_to_num(importacao[colunas].to_numpy(dtype='float64', na_value=np.nan))
+    linhas, posicoes = np.nonzero(quantidades)
+
+    longa = importacao[[c for c in DIMENSOES_QUOTA if c in importacao.columns]].take(linhas).reset_index(drop=True)
+    if 'NOR' in longa.columns:
+        longa[COLUNA_PERIODO] = longa['NOR'].dt.to_period('M').dt.to_timestamp()
+    if 'Combustivel' in importacao.columns:
+        # Grafias diferentes do mesmo combustível ('Jet_A1', 'Jet A1') dão um só produto
+        combustiveis = importacao['Combustivel'].astype('category')
+        produtos = np.array([normalizar_combustivel(c) for c in combustiveis.cat.categories]
+                            + [normalizar_combustivel(None)], dtype=object)
+        longa[COLUNA_PRODUTO] = pd.Categorical(produtos[combustiveis.cat.codes.to_numpy()[linhas]])
+        densidades = densidades_por_linha(combustiveis)[linhas]
+    else:
+        densidades = densidades_por_linha(pd.Series([None] * len(linhas), dtype='object'))
+
+    # Empresa e origem como categorias: o código é a posição da coluna larga
+    empresas = list(dict.fromkeys(COLUNAS_QUANTIDADE[c][0] for c in colunas))
+    origens = list(dict.fromkeys(COLUNAS_QUANTIDADE[c][1] for c in colunas))
+    codigo_empresa = np.array([empresas.index(COLUNAS_QUANTIDADE[c][0]) for c in colunas])
+    codigo_origem = np.array([origens.index(COLUNAS_QUANTIDADE[c][1]) for c in colunas])
+    longa['Empresa'] = pd.Categorical.from_codes(codigo_empresa[posicoes], empresas)
+    longa['Origem'] = pd.Categorical.from_codes(codigo_origem[posicoes], origens)
+
+    longa['TM'] = quantidades[linhas, posicoes]
+    longa['m³'] = tm_para_m3(longa['TM'].to_numpy(), densidades)
+    longa = ordenar_por_data(longa, 'NOR')
+    logger.info(f"Quota de mercado em formato longo: {len(longa)} linhas de {len(importacao)} descargas × "
+                f"{len(colunas)} colunas em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    return longa
+
+# ============================================= QUOTAS =============================================
+def totais_por_origem(longa: pd.DataFrame, medida: str = 'TM') -> pd.Series:
+    """Total da medida por origem (RELEASE, Financial Hold, Congénere)"""
+    if longa.empty:
+        return pd.Series(dtype='float64', name=medida)
+    return longa.groupby('Origem', observed=False)[medida].sum()
+
+def quotas(longa: pd.DataFrame, por: Union[str, Sequence[str], None] = None, medida: str = 'TM') -> pd.DataFrame:
+    """
+    Quantidade e quota (%) de cada empresa dentro de cada grupo de 'por'
+    (ex.: 'Periodo', 'Porto', 'Produto'), ou no total sem 'por'.
+    """
+    grupos: List[str] = [] if por is None else [por] if isinstance(por, str) else list(por)
+    if longa.empty:
+        return pd.DataFrame(columns=grupos + ['Empresa', medida, 'Quota (%)'])
+    somas = longa.groupby(grupos + ['Empresa'], observed=True, sort=False)[medida].sum().reset_index()
+    totais = somas.groupby(grupos, observed=True, sort=False)[medida].transform('sum') if grupos \
+        else somas[medida].sum()
+    somas['Quota (%)'] = np.where(totais > 0, somas[medida] / totais * 100, 0.0)
+    return somas.sort_values(grupos + [medida], ascending=[True] * len(grupos) + [False], ignore_index=True)
+
+def variacao_posicoes(longa: pd.DataFrame, por: str = COLUNA_PERIODO, medida: str = 'TM',
+                      empresas: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Posição de cada empresa em cada valor de 'por' (1 = maior quantidade) e a
+    variação face ao valor anterior em que a empresa aparece (positivo = subiu).
+    """
+    tabela = quotas(longa, por, medida)
+    if tabela.empty:
+        return tabela.assign(Posicao=pd.Series(dtype='int64'), Variacao=pd.Series(dtype='float64'))
+    tabela['Posicao'] = tabela.groupby(por, observed=True)[medida].rank(method='min', ascending=False).astype('int64')
+    tabela = tabela.sort_values([por, 'Posicao'], ignore_index=True)
+    tabela['Variacao'] = tabela.groupby('Empresa', observed=True)['Posicao'].shift() - tabela['Posicao']
+    if empresas is not None:
+        tabela = tabela[tabela['Empresa'].isin(empresas)].reset_index(drop=True)
+    return tabela
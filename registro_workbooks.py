@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Registo de Livros Excel – Petromoc, SA
+Abre cada livro uma única vez, interpreta numa só passagem todas as folhas
+declaradas e partilha os mesmos DataFrames entre carregar_lookups,
+carregar_dados_MIS e qualquer outro carregador.
+"""
+
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from cache_snapshots import assinatura_arquivo, carregar_snapshot, gravar_snapshot, normalizar_tipos
+
+logger = logging.getLogger(__name__)
+
+Folha = Union[int, str]
+Normalizador = Callable[[pd.DataFrame], pd.DataFrame]
+
+class RegistroWorkbooks:
+    """
+    Cache em memória, por processo, das folhas de cada livro Excel.
+    Os DataFrames devolvidos são partilhados entre todos os chamadores e devem
+    ser tratados como só de leitura: quem precisar de alterar faz .copy().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks_arquivo: Dict[str, threading.Lock] = {}
+        self._folhas: Dict[Tuple[str, Folha], pd.DataFrame] = {}
+        self._assinaturas: Dict[str, Tuple[int, int]] = {}
+        self._declaradas: Dict[str, List[Folha]] = {}
+        self._normalizadores: Dict[Tuple[str, Folha], Tuple[Normalizador, str]] = {}
+        self.tempos_parse: Dict[Tuple[str, Folha], Dict] = {}
+
+    # ============================================= CONFIGURAÇÃO =============================================
+    def declarar(self, caminho: Union[str, Path], folhas: Iterable[Folha]) -> None:
+        """Declara as folhas usadas de um livro para serem lidas juntas"""
+        chave = self._chave(caminho)
+        with self._lock:
+            atuais = self._declaradas.setdefault(chave, [])
+            for folha in folhas:
+                if folha not in atuais:
+                    atuais.append(folha)
+
+    def registar_normalizador(self, caminho: Union[str, Path], folha: Folha,
+                              normalizar: Normalizador, versao: str = '1') -> None:
+        """Associa uma normalização à folha, aplicada uma vez antes de partilhar"""
+        with self._lock:
+            self._normalizadores[(self._chave(caminho), folha)] = (normalizar, versao)
+
+    # ============================================= ACESSO =============================================
+    def folha(self, caminho: Union[str, Path], folha: Folha = 0) -> pd.DataFrame:
+        """Devolve uma folha do livro (ver folhas())"""
+        return self.folhas(caminho, [folha])[folha]
+
+    def folhas(self, caminho: Union[str, Path], folhas: Iterable[Folha]) -> Dict[Folha, pd.DataFrame]:
+        """Devolve as folhas pedidas, abrindo o livro no máximo uma vez"""
+        chave = self._chave(caminho)
+        pedidas = list(folhas)
+
+        with self._lock_arquivo(chave):
+            self._verificar_alteracao(caminho, chave)
+
+            em_falta = [f for f in self._todas_folhas(chave, pedidas) if (chave, f) not in self._folhas]
+            if em_falta:
+                self._carregar(caminho, chave, em_falta)
+
+            return {f: self._folhas[(chave, f)] for f in pedidas}
+
+    def relatorio_tempos(self) -> pd.DataFrame:
+        """Tempos de leitura por folha (origem: excel ou snapshot)"""
+        if not self.tempos_parse:
+            return pd.DataFrame(columns=['Arquivo', 'Folha', 'Origem', 'Segundos', 'Linhas'])
+        linhas = [
+            {'Arquivo': Path(c).name, 'Folha': f, **info}
+            for (c, f), info in self.tempos_parse.items()
+        ]
+        return pd.DataFrame(linhas)
+
+    def limpar(self, caminho: Optional[Union[str, Path]] = None) -> None:
+        """Esquece as folhas em memória (de um livro ou de todos)"""
+        with self._lock:
+            if caminho is None:
+                self._folhas.clear()
+                self._assinaturas.clear()
+                return
+            chave = self._chave(caminho)
+            for k in [k for k in self._folhas if k[0] == chave]:
+                del self._folhas[k]
+            self._assinaturas.pop(chave, None)
+
+    # ============================================= INTERNOS =============================================
+    @staticmethod
+    def _chave(caminho: Union[str, Path]) -> str:
+        return str(Path(caminho).resolve())
+
+    def _lock_arquivo(self, chave: str) -> threading.Lock:
+        with self._lock:
+            return self._locks_arquivo.setdefault(chave, threading.Lock())
+
+    def _todas_folhas(self, chave: str, pedidas: List[Folha]) -> List[Folha]:
+        with self._lock:
+            declaradas = list(self._declaradas.get(chave, []))
+        return pedidas + [f for f in declaradas if f not in pedidas]
+
+    def _verificar_alteracao(self, caminho: Union[str, Path], chave: str) -> None:
+        """Descarta as folhas em memória se o ficheiro mudou desde a leitura"""
+        info = os.stat(caminho)  # FileNotFoundError propaga para o chamador
+        assinatura = (info.st_size, info.st_mtime_ns)
+        if self._assinaturas.get(chave) not in (None, assinatura):
+            logger.info(f"Livro {Path(caminho).name} alterado - folhas serão relidas")
+            for k in [k for k in self._folhas if k[0] == chave]:
+                del self._folhas[k]
+        self._assinaturas[chave] = assinatura
+
+    def _carregar(self, caminho: Union[str, Path], chave: str, folhas: List[Folha]) -> None:
+        """Lê do snapshot o que estiver válido e interpreta o resto numa só abertura"""
+        por_interpretar = []
+        for folha in folhas:
+            _, versao = self._normalizadores.get((chave, folha), (None, '1'))
+            inicio = time.perf_counter()
+            df = carregar_snapshot(caminho, folha, versao)
+            if df is None:
+                por_interpretar.append(folha)
+                continue
+            self._guardar(chave, folha, df, 'snapshot', time.perf_counter() - inicio)
+
+        if not por_interpretar:
+            return
+
+        # Assinatura tirada antes da leitura: um ficheiro substituído a meio não fica com snapshot válido
+        assinatura = assinatura_arquivo(caminho)
+        inicio = time.perf_counter()
+        with pd.ExcelFile(caminho) as livro:
+            abertura = time.perf_counter() - inicio
+            logger.info(f"Livro {Path(caminho).name} aberto em {abertura:.2f} s")
+
+            for folha in por_interpretar:
+                normalizar, versao = self._normalizadores.get((chave, folha), (None, '1'))
+                inicio = time.perf_counter()
+                df = livro.parse(folha)
+                if normalizar is not None:
+                    df = normalizar(df)
+                df = normalizar_tipos(df)
+                self._guardar(chave, folha, df, 'excel', time.perf_counter() - inicio)
+
+                try:
+                    gravar_snapshot(caminho, df, folha, versao, assinatura)
+                except Exception as e:
+                    logger.warning(f"Não foi possível gravar snapshot de {caminho}[{folha}]: {e}")
+
+    def _guardar(self, chave: str, folha: Folha, df: pd.DataFrame, origem: str, segundos: float) -> None:
+        self._folhas[(chave, folha)] = df
+        self.tempos_parse[(chave, folha)] = {'Origem': origem, 'Segundos': round(segundos, 4), 'Linhas': len(df)}
+        logger.info(f"Folha {Path(chave).name}[{folha}] ({origem}): {len(df)} registros em {segundos * 1000:.0f} ms")
+
+# Instância única partilhada por todas as sessões do processo
+registro_workbooks = RegistroWorkbooks()
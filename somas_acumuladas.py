@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Somas Acumuladas por Dia – Petromoc, SA
+Para cada medida (Vendas m³, V_Liquido em MT, plano) e cada valor das dimensões
+principais (linha de negócio, combustível, província, promotor), um array
+com a soma acumulada dia a dia. O total de qualquer intervalo de datas é a
+diferença de duas posições do array, sem percorrer linhas; mês e ano até à
+data e o mesmo período do ano anterior saem das mesmas arrays.
+"""
+
+import logging
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from fontes_dados import detetar_coluna_plano
+
+logger = logging.getLogger(__name__)
+
+# Dimensões com arrays próprias (o total geral existe sempre)
+DIMENSOES_SOMAS = ['Sector/Sigla', 'Combustivel', 'Provincia', 'Gestor / Promotor']
+MEDIDAS_VENDAS = ['Vendas m³', 'V_Liquido']
+
+# Nome da medida do plano, qualquer que seja a coluna de origem (Plano_m³, Meta, ...)
+MEDIDA_PLANO = 'Plano'
+
+def _codigos(serie: pd.Series) -> Tuple[np.ndarray, List[str]]:
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), [str(v) for v in serie.cat.categories]
+    codigos, valores = pd.factorize(serie)
+    return codigos, [str(v) for v in valores]
+
+def periodos(inicio: date, fim: date) -> Dict[str, Tuple[date, date]]:
+    """Intervalo escolhido, mês e ano até à data do fim e o mesmo intervalo um ano antes"""
+    ano_antes = pd.DateOffset(years=1)
+    return {
+        'Intervalo': (inicio, fim),
+        'Mês até à data': (fim.replace(day=1), fim),
+        'Ano até à data': (date(fim.year, 1, 1), fim),
+        'Mesmo período do ano anterior': ((pd.Timestamp(inicio) - ano_antes).date(),
+                                          (pd.Timestamp(fim) - ano_antes).date()),
+    }
+
+class SomasAcumuladas:
+    """
+    Somas acumuladas das vendas e do plano (factos ou cubos, já combinados).
+    Por (medida, dimensão) há uma matriz com uma linha por código da
+    dimensão (uma só linha para o total geral); a coluna d tem a soma dos
+    dias anteriores ao dia d, contado a partir de 'primeiro_dia'.
+    """
+
+    def __init__(self, vendas: pd.DataFrame, plano: pd.DataFrame, coluna_data: str = 'Data_Facturacao'):
+        inicio = time.perf_counter()
+        self.vendas, self.plano = vendas, plano
+        self._arrays: Dict[Tuple[str, Optional[str]], np.ndarray] = {}
+        self._membros: Dict[Tuple[str, str], Dict[str, List[int]]] = {}
+
+        tabelas = [(df, {m: m for m in MEDIDAS_VENDAS if m in df.columns}) for df in (vendas,)]
+        coluna_plano = detetar_coluna_plano(plano)
+        if coluna_plano is not None:
+            tabelas.append((plano, {MEDIDA_PLANO: coluna_plano}))
+        tabelas = [(df, medidas) for df, medidas in tabelas if medidas and coluna_data in df.columns and not df.empty]
+
+        datas = [pd.to_datetime(df[coluna_data]).dt.normalize() for df, _ in tabelas]
+        validas = [d.dropna() for d in datas]
+        self.primeiro_dia = min((d.min() for d in validas if len(d)), default=pd.Timestamp.today().normalize())
+        ultimo = max((d.max() for d in validas if len(d)), default=self.primeiro_dia)
+        self.dias = (ultimo - self.primeiro_dia).days + 1
+        self._dia0 = self.primeiro_dia.date()
+
+        for (df, medidas), dia in zip(tabelas, datas):
+            # Linhas sem data não entram em nenhum intervalo
+            com_data = dia.notna().to_numpy()
+            indices = (dia[com_data] - self.primeiro_dia).dt.days.to_numpy()
+            for medida, coluna in medidas.items():
+                pesos = df[coluna].to_numpy(dtype='float64')[com_data]
+                # V_Liquido está na moeda de cada linha: acumula-se em MT (valor × Cambio)
+                if coluna == 'V_Liquido' and 'Cambio' in df.columns:
+                    pesos = pesos * df['Cambio'].to_numpy(dtype='float64')[com_data]
+                self._arrays[(medida, None)] = self._acumular(indices, pesos, 1)
+                for dimensao in DIMENSOES_SOMAS:
+                    if dimensao not in df.columns:
+                        continue
+                    codigos, textos = _codigos(df[dimensao])
+                    codigos = codigos[com_data].astype(np.int64)
+                    # Nulos (-1) contam só no total geral: ficam numa linha extra descartada
+                    linhas = np.where(codigos >= 0, codigos, len(textos))
+                    self._arrays[(medida, dimensao)] = self._acumular(indices + linhas * self.dias, pesos,
+                                                                      len(textos) + 1)[:-1]
+                    if (medida, dimensao) not in self._membros:
+                        membros: Dict[str, List[int]] = {}
+                        for codigo, texto in enumerate(textos):
+                            membros.setdefault(texto, []).append(codigo)
+                        self._membros[(medida, dimensao)] = membros
+        logger.info(f"Somas acumuladas criadas: {self.dias} dias, {len(self._arrays)} arrays em "
+                    f"{(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    def _acumular(self, posicoes: np.ndarray, pesos: np.ndarray, linhas: int) -> np.ndarray:
+        por_dia = np.bincount(posicoes, weights=pesos, minlength=linhas * self.dias).reshape(linhas, self.dias)
+        acumulado = np.zeros((linhas, self.dias + 1))
+        np.cumsum(por_dia, axis=1, out=acumulado[:, 1:])
+        return acumulado
+
+    def _colunas(self, inicio: date, fim: date) -> Tuple[int, int]:
+        """Colunas do array a subtrair para o intervalo [inicio, fim] (limitado aos dias existentes)"""
+        i = ((inicio.date() if isinstance(inicio, datetime) else inicio) - self._dia0).days
+        j = ((fim.date() if isinstance(fim, datetime) else fim) - self._dia0).days + 1
+        return min(max(i, 0), self.dias), min(max(i, j, 0), self.dias)
+
+    def total(self, medida: str, inicio: date, fim: date,
+              dimensao: Optional[str] = None, valores: Optional[Sequence[Any]] = None) -> float:
+        """
+        Soma da medida de 'inicio' a 'fim' (inclusive), só dos 'valores' da
+        dimensão se indicados. Se a tabela da medida não tiver a dimensão (o
+        plano não tem Provincia) devolve NaN: não há total comparável.
+        """
+        i, j = self._colunas(inicio, fim)
+        geral = self._arrays.get((medida, None))
+        if geral is None:
+            return 0.0
+        if not valores:
+            return float(geral[0, j] - geral[0, i])
+        arrays = self._arrays.get((medida, dimensao))
+        if arrays is None:
+            return np.nan
+        membros = self._membros[(medida, dimensao)]
+        linhas = [codigo for v in valores for codigo in membros.get(str(v), [])]
+        return float((arrays[linhas, j] - arrays[linhas, i]).sum())
+
+    def por_valor(self, medida: str, dimensao: str, inicio: date, fim: date) -> pd.Series:
+        """Soma do intervalo para cada valor da dimensão (uma subtração de duas colunas)"""
+        arrays = self._arrays.get((medida, dimensao))
+        if arrays is None:
+            return pd.Series(dtype='float64', name=medida)
+        i, j = self._colunas(inicio, fim)
+        somas = arrays[:, j] - arrays[:, i]
+        return pd.Series({texto: somas[codigos].sum() for texto, codigos in self._membros[(medida, dimensao)].items()},
+                         dtype='float64', name=medida)
+
+    def comparar(self, medida: str, inicio: date, fim: date, dimensao: Optional[str] = None,
+                 valores: Optional[Sequence[Any]] = None) -> Dict[str, float]:
+        """Total da medida em cada um dos periodos(inicio, fim)"""
+        return {nome: self.total(medida, a, b, dimensao, valores) for nome, (a, b) in periodos(inicio, fim).items()}
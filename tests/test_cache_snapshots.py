@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pandas as pd
+import pytest
+
+import cache_snapshots
+from cache_snapshots import carregar_snapshot, ler_com_snapshot, snapshot_valido
+
+@pytest.fixture(autouse=True)
+def snapshots_temporarios(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_snapshots, 'DIRETORIO_SNAPSHOTS', tmp_path / 'snapshots')
+
+@pytest.fixture
+def livro(tmp_path):
+    caminho = tmp_path / 'livro.xlsx'
+    caminho.write_bytes(b'versao 1')
+    return caminho
+
+def test_snapshot_gravado_e_reaberto(livro):
+    df = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+    lido = ler_com_snapshot(livro, 0, lambda: df.copy())
+    pd.testing.assert_frame_equal(lido, df)
+    assert snapshot_valido(livro)
+    pd.testing.assert_frame_equal(carregar_snapshot(livro), df)
+
+def test_ficheiro_alterado_durante_a_leitura_invalida_o_snapshot(livro):
+    def interpretar():
+        # O ficheiro é substituído enquanto o conteúdo antigo está a ser lido
+        livro.write_bytes(b'versao 2, maior')
+        os.utime(livro, ns=(1, 1))
+        return pd.DataFrame({'a': [1]})
+
+    ler_com_snapshot(livro, 0, interpretar)
+    assert not snapshot_valido(livro)
+    assert carregar_snapshot(livro) is None
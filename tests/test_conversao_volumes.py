@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from conversao_volumes import converter_tm_para_m3_seguro, densidades_por_linha, normalizar_combustivel, tm_para_m3
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('Jet_A1', 'Jet A1'), ('jet-a1', 'Jet A1'), ('GASOLEO', 'Gasóleo'), ('Diesel', 'Gasóleo'),
+    (' gasolina ', 'Gasolina'), (None, 'Gasóleo'), ('Petróleo', 'Petróleo'),
+])
+def test_normalizar_combustivel(texto, esperado):
+    assert normalizar_combustivel(texto) == esperado
+
+def test_conversao_por_linha_com_combustiveis_misturados():
+    combustiveis = pd.Series(['Gasolina', 'Jet_A1', 'Gasóleo', None, 'Petróleo', 'gasolina'])
+    quantidades = pd.Series([73.0, 79.0, 84.0, 8.4, 10.0, np.nan])
+    m3 = tm_para_m3(quantidades, densidades_por_linha(combustiveis))
+    assert m3 == pytest.approx([100.0, 100.0, 100.0, 10.0, 0.0, 0.0])
+    # Igual à conversão linha a linha
+    esperado = [converter_tm_para_m3_seguro(q, c) for q, c in zip(quantidades, combustiveis)]
+    assert m3 == pytest.approx(esperado)
+
+def test_total_usa_a_densidade_de_cada_linha():
+    combustiveis = pd.Series(['Gasolina', 'Gasóleo'], dtype='category')
+    m3 = tm_para_m3(np.array([73.0, 84.0]), densidades_por_linha(combustiveis))
+    # Com uma só densidade (a da primeira linha) o total seria 157 / 0.73
+    assert m3.sum() == pytest.approx(200.0)
+
+def test_varias_colunas():
+    densidades = densidades_por_linha(pd.Series(['Gasolina', 'Jet A1']))
+    m3 = tm_para_m3(pd.DataFrame({'a': [7.3, 7.9], 'b': [0.0, 15.8]}), densidades)
+    assert m3.shape == (2, 2)
+    assert m3 == pytest.approx(np.array([[10.0, 0.0], [10.0, 20.0]]))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from formatacao import formatar_coluna_ptbr, formatar_ptbr
+from leitor_streaming import texto_para_float
+
+VALORES = [0, 0.4, 7, -7.5, 999.995, 1234.56, -1234567.891, 1e12 + 0.25]
+
+@pytest.mark.parametrize('casas', [0, 1, 2])
+def test_coluna_igual_a_formatar_ptbr(casas):
+    esperado = [formatar_ptbr(v, casas) for v in VALORES]
+    assert formatar_coluna_ptbr(pd.Series(VALORES), casas).tolist() == esperado
+
+def test_formatos():
+    textos = formatar_coluna_ptbr(pd.Series([1234.56, -0.001, 1234567]), 2).tolist()
+    assert textos == ['1.234,56', '0,00', '1.234.567,00']
+
+def test_vazios_e_nao_numericos_contam_zero():
+    serie = pd.Series([np.nan, None, 'abc', np.inf], dtype=object)
+    assert formatar_coluna_ptbr(serie, 0).tolist() == ['0'] * 4
+
+def test_prefixo_sufixo_e_sinal():
+    serie = pd.Series([1500, -2.5, 0], index=[10, 20, 30], name='Variação')
+    textos = formatar_coluna_ptbr(serie, 1, prefixo='MT ', sufixo='%', com_sinal=True)
+    assert textos.tolist() == ['MT +1.500,0%', 'MT -2,5%', 'MT 0,0%']
+    assert textos.index.tolist() == [10, 20, 30] and textos.name == 'Variação'
+
+@pytest.mark.parametrize('valor', [0.5, 12.25, 1234.56, -98765.43, 1234567.89])
+def test_ida_e_volta_ptbr(valor):
+    texto = formatar_coluna_ptbr(pd.Series([valor]), 2)[0]
+    assert texto_para_float(texto) == pytest.approx(valor)
+    assert texto_para_float(formatar_ptbr(valor, 2)) == pytest.approx(valor)
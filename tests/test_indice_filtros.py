@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fontes_dados import mascara_valores
+from indice_filtros import LIMITE_VALORES_CATALOGO, IndiceFiltros
+
+@pytest.fixture
+def vendas():
+    gerador = np.random.default_rng(3)
+    n = 1000
+    return pd.DataFrame({
+        # Fora de ordem de propósito: o índice guarda a permutação
+        'Data_Facturacao': pd.Timestamp('2025-01-01') + pd.to_timedelta(gerador.integers(0, 90, n), unit='D'),
+        'Combustivel': pd.Categorical(gerador.choice(['Gasolina', 'Gasóleo', 'Jet A1'], n)),
+        'Provincia': gerador.choice(['Maputo', 'Beira', 'Tete', None], n),
+        'Emissor': gerador.integers(0, LIMITE_VALORES_CATALOGO * 3, n),
+        'Vendas m³': gerador.uniform(0, 50, n),
+    })
+
+def _filtrar_pandas(df, filtros):
+    inicio, fim = (pd.Timestamp(d) for d in filtros['date_range'])
+    linhas = (df['Data_Facturacao'] >= inicio) & (df['Data_Facturacao'] <= fim)
+    for coluna, valores in filtros.items():
+        if coluna != 'date_range' and valores:
+            linhas &= mascara_valores(df[coluna], valores)
+    return df[linhas]
+
+@pytest.mark.parametrize('filtros', [
+    {'date_range': (date(2025, 1, 1), date(2025, 3, 31))},
+    {'date_range': (date(2025, 1, 15), date(2025, 2, 14)), 'Combustivel': ['Gasolina']},
+    {'date_range': (date(2025, 1, 1), date(2025, 3, 31)), 'Provincia': ['Maputo', 'Tete'], 'Combustivel': []},
+    {'date_range': (date(2025, 2, 1), date(2025, 2, 1)), 'Combustivel': ['Jet A1', 'Gasóleo'],
+     'Provincia': ['Beira']},
+    {'date_range': (date(2025, 1, 1), date(2025, 3, 31)), 'Emissor': [5, '17', 250]},
+    {'date_range': (date(2025, 1, 1), date(2025, 3, 31)), 'Provincia': ['Inexistente']},
+])
+def test_filtrar_igual_ao_pandas(vendas, filtros):
+    obtido = IndiceFiltros(vendas, ['Data_Facturacao']).filtrar(filtros)
+    esperado = _filtrar_pandas(vendas, filtros)
+    pd.testing.assert_frame_equal(obtido, esperado)
+
+def test_facetas_contam_com_os_outros_filtros(vendas):
+    filtros = {'date_range': (date(2025, 1, 1), date(2025, 1, 31)), 'Combustivel': ['Gasolina'],
+               'Provincia': ['Maputo']}
+    facetas = IndiceFiltros(vendas, ['Data_Facturacao']).facetas(filtros, ['Provincia'])['Provincia']
+    sem_provincia = _filtrar_pandas(vendas, {**filtros, 'Provincia': []})
+    assert facetas == sem_provincia['Provincia'].dropna().value_counts().to_dict()
+
+def test_colunas_em_falta(vendas):
+    indice = IndiceFiltros(vendas, ['Data_Facturacao'])
+    filtros = {'date_range': (date(2025, 1, 1), date(2025, 3, 31)), 'Instalação': ['X'], 'Provincia': ['Beira'],
+               'Sector/Sigla': []}
+    assert indice.colunas_em_falta(filtros) == ['Instalação']
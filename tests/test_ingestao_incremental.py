@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+import ingestao_incremental
+from cache_snapshots import normalizar_tipos
+from fontes_dados import enriquecer_vendas, ordenar_por_data, preparar_vendas
+
+ANO = 2025
+
+LOOKUPS = (
+    pd.DataFrame({'Emissor': [1, 2, 3], 'Nome_do_Cliente': ['Alfa', 'Beta', 'Gama'],
+                  'Gestor / Promotor': ['Ana', 'Rui', 'Ana']}),
+    pd.DataFrame({'CDst': [10, 20], 'CanalDist': ['Retalho', 'Grosso']}),
+    pd.DataFrame(),
+    pd.DataFrame({'CE': [100, 200], 'Instalação': ['Matola', 'Beira'], 'Provincia': ['Maputo', 'Sofala']}),
+    pd.DataFrame({'TipFt': ['F2', 'G2'], 'Tipo.Factura': ['Factura', 'Nota de crédito']}),
+    pd.DataFrame({'Material': ['GAS', 'JET'], 'Combustivel': ['Gasolina', 'Jet A1']}),
+)
+
+def _vendas(linhas):
+    return pd.DataFrame(linhas, columns=['Data_Facturacao', 'Doc.fat.', 'CE', 'Emissor', 'Material', 'TipFt',
+                                         'CDst', 'Vendas m³', 'V_Liquido', 'Cambio']
+                        ).assign(Data_Facturacao=lambda df: pd.to_datetime(df['Data_Facturacao']))
+
+VENDAS = _vendas([
+    ('2025-01-03', 'A1', 100, 1, 'GAS', 'F2', 10, 12.5, 1000.0, 63.9),
+    ('2025-01-03', 'A1', 100, 1, 'JET', 'F2', 10, 4.0, 500.0, 63.9),
+    ('2025-01-05', 'A2', 200, 2, 'GAS', 'F2', 20, 7.0, 800.0, 1.0),
+    # Linha repetida: conta duas vezes
+    ('2025-01-05', 'A2', 200, 2, 'GAS', 'F2', 20, 7.0, 800.0, 1.0),
+])
+NOVAS = _vendas([
+    ('2025-01-04', 'A3', 200, 3, 'JET', 'G2', 20, 3.0, 300.0, 63.9),
+    ('2025-01-09', 'A4', 100, 2, 'GAS', 'F2', 10, 9.5, 950.0, 1.0),
+])
+
+@pytest.fixture(autouse=True)
+def armazem_temporario(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestao_incremental, 'DIRETORIO_ARMAZEM', tmp_path)
+    monkeypatch.setattr(ingestao_incremental, 'ARQUIVO_LOOKUP', str(tmp_path / 'sem_lookup.xlsx'))
+
+def _completo(vendas):
+    """Factos calculados de raiz, sem armazém"""
+    return ordenar_por_data(normalizar_tipos(preparar_vendas(enriquecer_vendas(vendas, LOOKUPS))))
+
+def _comparavel(df):
+    ordem = ['Data_Facturacao', 'Emissor', 'Vendas m³']
+    df = df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+    return df.sort_values(ordem, kind='stable', ignore_index=True)[sorted(df.columns)]
+
+def _partes():
+    return ingestao_incremental._ler_manifesto(ANO)['partes']
+
+def _atualizar(vendas):
+    return ingestao_incremental.atualizar_particao(ANO, vendas, LOOKUPS)
+
+def test_primeira_leitura_grava_uma_parte():
+    resultado = _atualizar(VENDAS)
+    pd.testing.assert_frame_equal(_comparavel(resultado), _comparavel(_completo(VENDAS)))
+    assert _partes() == ['parte_00000.parquet']
+    assert ingestao_incremental.COLUNA_CHAVE not in resultado.columns
+
+def test_linhas_novas_acrescentadas_como_parte():
+    _atualizar(VENDAS)
+    todas = pd.concat([VENDAS, NOVAS], ignore_index=True)
+    resultado = _atualizar(todas)
+
+    pd.testing.assert_frame_equal(_comparavel(resultado), _comparavel(_completo(todas)))
+    assert _partes() == ['parte_00000.parquet', 'parte_00001.parquet']
+    delta = pd.read_parquet(ingestao_incremental._diretorio(ANO) / 'parte_00001.parquet')
+    assert len(delta) == len(NOVAS)
+    assert resultado['Data_Facturacao'].is_monotonic_increasing
+
+    # O que ficou gravado é igual ao resultado devolvido
+    guardado, manifesto = ingestao_incremental.ler_armazem(ANO)
+    assert manifesto['linhas'] == len(todas)
+    pd.testing.assert_frame_equal(_comparavel(ingestao_incremental._sem_chave(guardado)), _comparavel(resultado))
+
+def test_sem_alteracoes_nao_grava():
+    _atualizar(VENDAS)
+    resultado = _atualizar(VENDAS.sample(frac=1, random_state=1))
+    pd.testing.assert_frame_equal(_comparavel(resultado), _comparavel(_completo(VENDAS)))
+    assert _partes() == ['parte_00000.parquet']
+
+def test_linhas_removidas_reescrevem_o_armazem():
+    _atualizar(VENDAS)
+    _atualizar(pd.concat([VENDAS, NOVAS], ignore_index=True))
+    # Uma das linhas repetidas e uma das novas deixam de existir
+    restantes = pd.concat([VENDAS.iloc[:3], NOVAS.iloc[:1]], ignore_index=True)
+    resultado = _atualizar(restantes)
+
+    pd.testing.assert_frame_equal(_comparavel(resultado), _comparavel(_completo(restantes)))
+    assert _partes() == ['parte_00000.parquet']
+    assert ingestao_incremental._ler_manifesto(ANO)['linhas'] == len(restantes)
+
+def test_nova_versao_de_processamento_reescreve(monkeypatch):
+    _atualizar(VENDAS)
+    _atualizar(pd.concat([VENDAS, NOVAS], ignore_index=True))
+    monkeypatch.setattr(ingestao_incremental, 'VERSAO_PROCESSAMENTO', ingestao_incremental.VERSAO_PROCESSAMENTO + 1)
+    resultado = _atualizar(pd.concat([VENDAS, NOVAS], ignore_index=True))
+    assert len(resultado) == len(VENDAS) + len(NOVAS)
+    assert _partes() == ['parte_00000.parquet']
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import math
+
+import pandas as pd
+import pytest
+
+from fontes_dados import normalizar_numericos
+from leitor_streaming import _ColunaDecimal, _ColunaInteira, texto_para_float
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('1.234,56', 1234.56),
+    ('1,234.56', 1234.56),
+    ('MT 1 234', 1234.0),
+    ('1.234.567', 1234567.0),
+    ('1,234,567', 1234567.0),
+    ('-0,5', -0.5),
+    ('12.5', 12.5),
+    ('-', 0.0),
+])
+def test_texto_para_float_ptbr(texto, esperado):
+    assert texto_para_float(texto) == pytest.approx(esperado)
+
+@pytest.mark.parametrize('texto', ['', '   ', '\t'])
+def test_texto_em_branco_e_vazio(texto):
+    assert math.isnan(texto_para_float(texto))
+
+def test_texto_invalido_falha_com_nan():
+    assert math.isnan(texto_para_float('1-2'))
+
+def test_colunas_nao_contam_brancos_como_falhas():
+    decimal, inteira = _ColunaDecimal(), _ColunaInteira()
+    for linha, valor in enumerate(['  ', '1-2', '3', None]):
+        decimal.adicionar(linha, valor)
+        inteira.adicionar(linha, valor)
+    valores = decimal.finalizar(4)
+    assert math.isnan(valores[0]) and math.isnan(valores[1]) and valores[2] == 3.0
+    assert list(inteira.finalizar(4)) == [0, 0, 3, 0]
+    assert decimal.falhas == 1 and inteira.falhas == 1
+
+def test_normalizar_numericos_brancos_e_falhas():
+    df = pd.DataFrame({'Valor': [' ', '1,5', '1-2', None, '1-2']})
+    resultado = normalizar_numericos(df, ['Valor'])
+    assert resultado['Valor'].isna().tolist() == [True, False, True, True, True]
+    assert resultado['Valor'][1] == 1.5
+    assert resultado.attrs['falhas_conversao'] == {'Valor': 2}
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+import motor_consultas
+
+DIVIDAS = pd.DataFrame({
+    'Promotor': ['Carlos', 'Beatriz', 'Ana', 'Daniel', 'Beatriz', None],
+    'Divida': [5.0, 3.0, 2.0, 5.0, 2.0, 9.0],
+})
+
+@pytest.fixture(params=['duckdb', 'pandas'])
+def motor(request, monkeypatch):
+    if request.param == 'pandas':
+        monkeypatch.setattr(motor_consultas, 'ativo', lambda: False)
+    elif not motor_consultas.ativo():
+        pytest.skip('DuckDB indisponível')
+    return request.param
+
+def test_somar_por_desempata_pela_chave(motor):
+    tabela = motor_consultas.somar_por(DIVIDAS, 'Promotor', ['Divida'], ordenar_por='Divida', limite=3)
+    assert tabela['Promotor'].tolist() == ['Beatriz', 'Carlos', 'Daniel']
+    assert tabela['Divida'].tolist() == [5.0, 5.0, 5.0]
+
+def test_somar_por_ordena_pela_chave_sem_ordenar_por(motor):
+    tabela = motor_consultas.somar_por(DIVIDAS, 'Promotor', ['Divida'])
+    assert tabela['Promotor'].tolist() == ['Ana', 'Beatriz', 'Carlos', 'Daniel']
+    assert tabela['Divida'].tolist() == [2.0, 5.0, 5.0, 5.0]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from quota_mercado import EMPRESA_PETROMOC, ORIGEM_CONGENERE, quotas, tabela_longa, totais_por_origem
+
+@pytest.fixture
+def importacao():
+    return pd.DataFrame({
+        'NOR': pd.to_datetime(['2025-01-10', '2025-01-20', '2025-02-05']),
+        'Porto': ['Beira', 'Maputo', 'Beira'],
+        'Combustivel': ['Gasolina', 'Jet_A1', 'Gasóleo'],
+        'Qtd_Petro_TM': [73.0, 0.0, 84.0],
+        'Qtd_FH_( TM)': [np.nan, 79.0, 0.0],
+        'BP': [146.0, 0.0, 42.0],
+    })
+
+def test_tabela_longa_so_celulas_com_quantidade(importacao):
+    longa = tabela_longa(importacao)
+    assert len(longa) == 5
+    assert longa['TM'].sum() == pytest.approx(73 + 84 + 79 + 146 + 42)
+    assert set(longa['Empresa']) == {EMPRESA_PETROMOC, 'BP'}
+    assert set(longa['Produto']) == {'Gasolina', 'Jet A1', 'Gasóleo'}
+    # m³ com a densidade do combustível de cada descarga
+    assert longa['m³'].sum() == pytest.approx(100 + 100 + 100 + 200 + 50)
+
+def test_totais_por_origem(importacao):
+    totais = totais_por_origem(tabela_longa(importacao))
+    assert totais['RELEASE'] == pytest.approx(157.0)
+    assert totais['Financial Hold'] == pytest.approx(79.0)
+    assert totais[ORIGEM_CONGENERE] == pytest.approx(188.0)
+
+def test_quotas_somam_100_por_grupo(importacao):
+    tabela = quotas(tabela_longa(importacao), 'Porto')
+    assert tabela.groupby('Porto')['Quota (%)'].sum().tolist() == pytest.approx([100.0, 100.0])
+    beira = tabela[tabela['Porto'] == 'Beira'].set_index('Empresa')['TM']
+    assert beira['BP'] == pytest.approx(188.0) and beira[EMPRESA_PETROMOC] == pytest.approx(157.0)
+
+def test_quotas_sem_grupo_igual_ao_groupby(importacao):
+    longa = tabela_longa(importacao)
+    tabela = quotas(longa, medida='m³').set_index('Empresa')
+    esperado = longa.groupby('Empresa', observed=True)['m³'].sum()
+    assert tabela['m³'].to_dict() == pytest.approx(esperado.to_dict())
+    assert tabela['Quota (%)'].sum() == pytest.approx(100.0)
+
+def test_importacao_vazia():
+    assert tabela_longa(pd.DataFrame()).empty
+    assert quotas(tabela_longa(pd.DataFrame()), 'Porto').empty
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from somas_acumuladas import MEDIDA_PLANO, SomasAcumuladas
+
+@pytest.fixture
+def vendas():
+    gerador = np.random.default_rng(7)
+    n = 400
+    return pd.DataFrame({
+        'Data_Facturacao': pd.Timestamp('2024-11-01') + pd.to_timedelta(gerador.integers(0, 120, n), unit='D'),
+        'Combustivel': pd.Categorical(gerador.choice(['Gasolina', 'Gasóleo', 'Jet A1'], n)),
+        'Provincia': gerador.choice(['Maputo', 'Beira', None], n),
+        'Vendas m³': gerador.uniform(0, 50, n),
+        'V_Liquido': gerador.uniform(100, 1000, n),
+        'Cambio': gerador.choice([1.0, 63.9], n),
+    })
+
+@pytest.fixture
+def plano():
+    return pd.DataFrame({
+        'Data_Facturacao': pd.to_datetime(['2024-12-01', '2025-01-01', '2025-02-01']),
+        'Combustivel': ['Gasolina', 'Gasolina', 'Jet A1'],
+        'Plano_m³': [100.0, 200.0, 300.0],
+    })
+
+def _soma(df, coluna, inicio, fim, filtro=None):
+    datas = df['Data_Facturacao']
+    linhas = (datas >= pd.Timestamp(inicio)) & (datas <= pd.Timestamp(fim))
+    if filtro:
+        linhas &= df[filtro[0]].astype(str).isin(filtro[1])
+    return df.loc[linhas, coluna].sum()
+
+@pytest.mark.parametrize('inicio, fim', [
+    (date(2024, 11, 1), date(2025, 2, 28)),
+    (date(2024, 12, 15), date(2025, 1, 14)),
+    (date(2025, 1, 1), date(2025, 1, 1)),
+    (date(2020, 1, 1), date(2030, 1, 1)),
+    (date(2025, 3, 10), date(2025, 3, 1)),
+])
+def test_total_igual_ao_groupby(vendas, plano, inicio, fim):
+    somas = SomasAcumuladas(vendas, plano)
+    assert somas.total('Vendas m³', inicio, fim) == pytest.approx(_soma(vendas, 'Vendas m³', inicio, fim))
+    assert somas.total(MEDIDA_PLANO, inicio, fim) == pytest.approx(_soma(plano, 'Plano_m³', inicio, fim))
+    for valores in (['Gasolina'], ['Gasóleo', 'Jet A1']):
+        assert somas.total('Vendas m³', inicio, fim, 'Combustivel', valores) == pytest.approx(
+            _soma(vendas, 'Vendas m³', inicio, fim, ('Combustivel', valores)))
+
+def test_por_valor_igual_ao_groupby(vendas, plano):
+    somas = SomasAcumuladas(vendas, plano)
+    inicio, fim = date(2024, 12, 1), date(2025, 1, 31)
+    no_intervalo = vendas[vendas['Data_Facturacao'].between(pd.Timestamp(inicio), pd.Timestamp(fim))]
+    esperado = no_intervalo.groupby('Provincia')['Vendas m³'].sum()
+    obtido = somas.por_valor('Vendas m³', 'Provincia', inicio, fim)
+    assert obtido[esperado.index].to_dict() == pytest.approx(esperado.to_dict())
+    # Nulos só contam no total geral
+    assert somas.total('Vendas m³', inicio, fim) == pytest.approx(no_intervalo['Vendas m³'].sum())
+
+def test_valor_liquido_em_mt(vendas, plano):
+    somas = SomasAcumuladas(vendas, plano)
+    inicio, fim = date(2024, 11, 1), date(2025, 2, 28)
+    assert somas.total('V_Liquido', inicio, fim) == pytest.approx((vendas['V_Liquido'] * vendas['Cambio']).sum())
+
+def test_plano_sem_a_dimensao_nao_tem_total(vendas, plano):
+    somas = SomasAcumuladas(vendas, plano)
+    assert np.isnan(somas.total(MEDIDA_PLANO, date(2024, 11, 1), date(2025, 2, 28), 'Provincia', ['Maputo']))